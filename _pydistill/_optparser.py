@@ -0,0 +1,43 @@
+"""
+argparse based parser of :class:`_pydistill.config.Parser`, kept apart from
+``_pydistill.config`` so argparse is only imported once a command line
+actually gets parsed.
+"""
+from __future__ import absolute_import, division, print_function
+import argparse
+
+FILE_OR_DIR = 'file_or_dir'
+
+
+class MyOptionParser(argparse.ArgumentParser):
+    def __init__(self, parser, extra_info=None):
+        if not extra_info:
+            extra_info = {}
+        self._parser = parser
+        argparse.ArgumentParser.__init__(self, prog="distill",
+                                         usage=parser._usage,
+                                         add_help=False)
+        # extra_info is a dict of (param -> value) to display if there's
+        # an usage error to provide more contextual information to the user
+        self.extra_info = extra_info
+
+    def error(self, message):
+        """Transform argparse error message into UsageError."""
+        from _pydistill.config import UsageError
+        msg = "%s: error: %s" % (self.prog, message)
+        if hasattr(self._parser, '_config_source_hint'):
+            msg = "%s (%s)" % (msg, self._parser._config_source_hint)
+        raise UsageError(self.format_usage() + msg)
+
+    def parse_args(self, args=None, namespace=None):
+        """allow splitting of positional arguments"""
+        args, argv = self.parse_known_args(args, namespace)
+        if argv:
+            for arg in argv:
+                if arg and arg[0] == '-':
+                    lines = ['unrecognized arguments: %s' % (' '.join(argv))]
+                    for k, v in sorted(self.extra_info.items()):
+                        lines.append('  %s: %s' % (k, v))
+                    self.error('\n'.join(lines))
+            getattr(args, FILE_OR_DIR).extend(argv)
+        return args
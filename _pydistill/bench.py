@@ -0,0 +1,379 @@
+"""
+``bench`` sub-command: performance benchmarks with regression baselines.
+
+Measured are the start-up of a fresh ``distill`` process and of a config in
+an already warm interpreter, the parsing of the command line depending on
+the number of plugin options, the dispatch overhead of a hook depending on
+the number of implementations and the ``csv`` throughput on generated
+inputs of increasing size.  The inputs are generated once into the cache
+directory.
+
+Results can be saved as a json baseline and compared against one; the run
+fails if a metric got worse than the baseline by more than a threshold::
+
+    distill bench --save-baseline base.json
+    distill bench --baseline base.json --bench-sizes 1MB,1GB,10GB
+
+Positional arguments select benchmarks by substring, e.g. ``distill bench
+parse``.
+"""
+from __future__ import absolute_import, division, print_function
+import json
+import os
+import subprocess
+import sys
+import time
+
+import py
+
+from _pydistill import __version__, stream
+from _pydistill.config import UsageError
+
+_timer = getattr(time, "perf_counter", time.time)
+
+#: root of the source tree, put on ``PYTHONPATH`` of cold start-ups
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPTIONS_PER_PLUGIN = 5
+PARSE_ARGS = ["--plugin0-opt0", "x", "input.csv"]
+DISPATCH_CALLS = 10000
+
+
+class Metric(object):
+    """ one measured value; ``higher`` tells whether larger is better. """
+
+    def __init__(self, name, value, unit, higher=False):
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.higher = higher
+
+    @classmethod
+    def from_json(cls, name, data):
+        return cls(name, data["value"], data["unit"], data["higher"])
+
+    def to_json(self):
+        return dict(value=self.value, unit=self.unit, higher=self.higher)
+
+    def change(self, base):
+        """ relative change against the baseline value ``base``, positive
+        if this metric got worse. """
+        if self.higher:
+            return base / self.value - 1 if self.value else float("inf")
+        return self.value / base - 1 if base else 0.0
+
+    def __repr__(self):
+        return "<Metric %s=%s%s>" % (self.name, self.value, self.unit)
+
+
+def best_of(func, repeat):
+    """ return the fastest of ``repeat`` calls of ``func`` in seconds. """
+    best = None
+    for _ in range(repeat):
+        start = _timer()
+        func()
+        duration = _timer() - start
+        if best is None or duration < best:
+            best = duration
+    return best
+
+
+#
+# start-up
+#
+def bench_startup_cold(inputpath, repeat):
+    """ a whole ``distill csv`` run on a tiny input in a new process. """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [_ROOT] + [p for p in env.get("PYTHONPATH", "").split(os.pathsep) if p])
+    cmd = [sys.executable, "-c",
+           "import sys, pydistill; sys.exit(pydistill.main())",
+           "csv", str(inputpath), "--output", os.devnull]
+    with open(os.devnull, "w") as devnull:
+        seconds = best_of(lambda: subprocess.check_call(
+            cmd, env=env, stdout=devnull, stderr=devnull), repeat)
+    return Metric("startup_cold", seconds * 1000, "ms")
+
+
+def bench_startup_warm(inputpath, repeat):
+    """ creating and parsing a config once all modules are imported. """
+    from _pydistill.config import _prepareconfig
+    args = ["csv", str(inputpath), "--output", os.devnull]
+
+    def startup():
+        _prepareconfig(list(args))._ensure_unconfigure()
+
+    return Metric("startup_warm", best_of(startup, repeat) * 1000, "ms")
+
+
+#
+# option parsing
+#
+def make_parser(nplugins):
+    """ a :class:`Parser <_pydistill.config.Parser>` with ``nplugins``
+    option groups of :data:`OPTIONS_PER_PLUGIN` options each. """
+    from _pydistill.config import Parser
+    parser = Parser(usage="%(prog)s")
+    for i in range(nplugins):
+        group = parser.getgroup("plugin%d" % i)
+        for j in range(OPTIONS_PER_PLUGIN):
+            group.addoption("--plugin%d-opt%d" % (i, j), default=None)
+    return parser
+
+
+def one_parse(parser, cached=True):
+    """ replay the three parser lookups of a single ``Config.parse``. """
+    from _pydistill.config import CmdOptions
+    for step in range(3):
+        if not cached:
+            parser._parsercache.clear()
+        if step == 0:
+            parser.parse_known_and_unknown_args("csv", PARSE_ARGS)
+        elif step == 1:
+            parser.parse_known_args("csv", PARSE_ARGS)
+        else:
+            parser.parse_setoption("csv", PARSE_ARGS, CmdOptions())
+
+
+def bench_parse(nplugins, repeat):
+    parser = make_parser(nplugins)
+    seconds = best_of(lambda: one_parse(parser), repeat)
+    return Metric("parse[plugins=%d]" % nplugins, seconds * 1000, "ms")
+
+
+#
+# hook dispatch
+#
+def make_pluginmanager(nimpls):
+    """ a plugin manager with one ``bench_hook(value)`` hook implemented by
+    ``nimpls`` plugins. """
+    from pluggy import HookimplMarker, HookspecMarker, PluginManager
+    hookspec = HookspecMarker("bench")
+    hookimpl = HookimplMarker("bench")
+
+    class Spec(object):
+        @hookspec
+        def bench_hook(self, value):
+            pass
+
+    class Impl(object):
+        @hookimpl
+        def bench_hook(self, value):
+            return value
+
+    pm = PluginManager("bench")
+    pm.add_hookspecs(Spec)
+    for i in range(nimpls):
+        pm.register(Impl(), name="impl%d" % i)
+    return pm
+
+
+def bench_dispatch(nimpls, repeat, calls=DISPATCH_CALLS):
+    hook = make_pluginmanager(nimpls).hook.bench_hook
+
+    def dispatch():
+        for i in range(calls):
+            hook(value=i)
+
+    seconds = best_of(dispatch, repeat)
+    return Metric("dispatch[impls=%d]" % nimpls, seconds / calls * 1e6, "us")
+
+
+#
+# csv throughput
+#
+def make_dataset(datadir, nbytes):
+    """ return the path of a generated csv file of at least ``nbytes``
+    bytes in ``datadir``, generating it on first use. """
+    path = py.path.local(datadir).join("rows-%d.csv" % nbytes)
+    if path.check(file=1):
+        return path
+    tmp = path.new(basename=path.basename + ".%d.tmp" % os.getpid())
+    with stream.open_text(tmp, 'w') as f:
+        f.write(u"id,group,name,value\n")
+        written = 0
+        i = 0
+        while written < nbytes:
+            block = u"".join(u"%d,%d,name%d,%.3f\n" % (j, j % 97, j % 1000,
+                                                       j / 7.0)
+                             for j in range(i, i + 10000))
+            f.write(block)
+            written += len(block)
+            i += 10000
+    tmp.rename(path)
+    return path
+
+
+def _sizename(nbytes):
+    for unit, factor in (("GB", 1024 ** 3), ("MB", 1024 ** 2),
+                         ("KB", 1024)):
+        if nbytes >= factor and nbytes % factor == 0:
+            return "%d%s" % (nbytes // factor, unit)
+    return "%dB" % nbytes
+
+
+def bench_csv(path, repeat, mmap=False):
+    """ read, chunk and write all rows of ``path``, in MB/s. """
+    def run():
+        with open(os.devnull, "w") as out:
+            writer = stream.CsvWriter(out)
+            if mmap:
+                from _pydistill.tokenizer import MmapCsvReader
+                reader = MmapCsvReader(path)
+            else:
+                reader = stream.CsvReader(stream.open_text(path))
+            with reader:
+                writer.writeheader(reader.header)
+                stream.Stream(reader, writer).run()
+
+    seconds = best_of(run, repeat)
+    return path.size() / 1024.0 ** 2 / seconds
+
+
+#
+# running and comparing
+#
+def run_benchmarks(datadir, sizes=(), plugins=(), impls=(), repeat=5,
+                   select=(), startup=True):
+    """ yield the :class:`Metric` of every selected benchmark. """
+    def selected(name):
+        return not select or any(s in name for s in select)
+
+    if startup and selected("startup"):
+        tiny = py.path.local(datadir).join("tiny.csv")
+        if not tiny.check(file=1):
+            tiny.write("id,name\n1,one\n")
+        yield bench_startup_cold(tiny, repeat)
+        yield bench_startup_warm(tiny, repeat)
+    if selected("parse"):
+        for nplugins in plugins:
+            yield bench_parse(nplugins, repeat)
+    if selected("dispatch"):
+        for nimpls in impls:
+            yield bench_dispatch(nimpls, repeat)
+    # large inputs are read only a few times, the page cache decides anyway
+    for nbytes in sizes:
+        for mmap in (False, True):
+            if not selected("csv_mmap" if mmap else "csv["):
+                continue
+            path = make_dataset(datadir, nbytes)
+            mbps = bench_csv(path, max(1, min(repeat, int(1e9 // nbytes))),
+                             mmap)
+            yield Metric("csv%s[%s]" % ("_mmap" if mmap else "",
+                                        _sizename(nbytes)),
+                         mbps, "MB/s", higher=True)
+
+
+def save_baseline(path, metrics):
+    data = dict(pydistill=__version__, python=sys.version.split()[0],
+                metrics=dict((m.name, m.to_json()) for m in metrics))
+    with open(str(path), "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    """ return ``{name: Metric}`` of a baseline written by
+    :func:`save_baseline`. """
+    with open(str(path)) as f:
+        data = json.load(f)
+    return dict((name, Metric.from_json(name, value))
+                for name, value in data["metrics"].items())
+
+
+def regressions(metrics, baseline, threshold):
+    """ return ``(metric, base, change)`` for every metric which got worse
+    than its baseline by more than ``threshold`` (a fraction). """
+    found = []
+    for metric in metrics:
+        base = baseline.get(metric.name)
+        if base is None:
+            continue
+        change = metric.change(base.value)
+        if change > threshold:
+            found.append((metric, base, change))
+    return found
+
+
+def _intlist(value, what):
+    try:
+        values = [int(x) for x in value.split(",") if x.strip()]
+    except ValueError:
+        values = [-1]
+    if any(x <= 0 for x in values):
+        raise UsageError("invalid %s: %r" % (what, value))
+    return values
+
+
+def pydistill_addoption(parser):
+    group = parser.getgroup("bench", "benchmarks")
+    group.addoption('--bench-sizes', action="store", dest="bench_sizes",
+                    default="1MB,10MB,100MB", metavar="SIZES",
+                    help="comma separated sizes of the generated csv "
+                         "inputs, up to e.g. 10GB. (default: %default)")
+    group.addoption('--bench-plugins', action="store", dest="bench_plugins",
+                    default="1,10,30,100", metavar="NUMS",
+                    help="numbers of plugins registering options to parse. "
+                         "(default: %default)")
+    group.addoption('--bench-impls', action="store", dest="bench_impls",
+                    default="1,10,100", metavar="NUMS",
+                    help="numbers of implementations of the dispatched "
+                         "hook. (default: %default)")
+    group.addoption('--bench-repeat', action="store", dest="bench_repeat",
+                    default="5", metavar="NUM",
+                    help="repetitions per benchmark, the fastest counts. "
+                         "(default: %default)")
+    group.addoption('--baseline', action="store", dest="baseline",
+                    default=None, metavar="PATH",
+                    help="compare against the json baseline at PATH and "
+                         "fail on regressions.")
+    group.addoption('--save-baseline', action="store", dest="save_baseline",
+                    default=None, metavar="PATH",
+                    help="write the results as json baseline to PATH.")
+    group.addoption('--bench-threshold', action="store",
+                    dest="bench_threshold", default="0.25", metavar="FRACTION",
+                    help="tolerated relative slowdown against the baseline. "
+                         "(default: %default)")
+
+
+def pydistill_cmdline_main(config):
+    from _pydistill.cacheprovider import getcache
+    try:
+        sizes = [stream.parse_bytes(x)
+                 for x in config.getoption("bench_sizes").split(",")
+                 if x.strip()]
+        threshold = float(config.getoption("bench_threshold"))
+    except ValueError as e:
+        raise UsageError(str(e))
+    plugins = _intlist(config.getoption("bench_plugins"), "--bench-plugins")
+    impls = _intlist(config.getoption("bench_impls"), "--bench-impls")
+    repeat, = _intlist(config.getoption("bench_repeat"), "--bench-repeat")
+    baseline = {}
+    if config.getoption("baseline"):
+        baseline = load_baseline(config.getoption("baseline"))
+
+    tw = py.io.TerminalWriter(sys.stdout)
+    tw.line("%-24s %12s %6s %12s %8s" % ("benchmark", "value", "unit",
+                                          "baseline", "change"))
+    metrics = []
+    for metric in run_benchmarks(getcache(config).makedir("bench"), sizes,
+                                 plugins, impls, repeat, config.args):
+        metrics.append(metric)
+        base = baseline.get(metric.name)
+        if base is None:
+            tw.line("%-24s %12.3f %6s" % (metric.name, metric.value,
+                                          metric.unit))
+        else:
+            change = metric.change(base.value)
+            tw.line("%-24s %12.3f %6s %12.3f %+7.1f%%" % (
+                metric.name, metric.value, metric.unit, base.value,
+                change * 100), red=change > threshold)
+
+    if config.getoption("save_baseline"):
+        save_baseline(config.getoption("save_baseline"), metrics)
+    found = regressions(metrics, baseline, threshold)
+    if found:
+        tw.line("%d regression(s) beyond %d%%: %s" % (
+            len(found), threshold * 100,
+            ", ".join(metric.name for metric, _, _ in found)), red=True)
+        return 1
+    return 0
@@ -0,0 +1,273 @@
+"""
+on-disk cache below the rootdir, shared by builtin plugins.
+
+``config.cache`` stores small json values across runs; its ``results``
+area keeps whole distilled outputs, addressed by a digest of everything
+that determines them and bounded in size by least-recently-used eviction.
+"""
+from __future__ import absolute_import, division, print_function
+import errno
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+
+import py
+
+from _pydistill.stream import parse_bytes
+
+# replaces the target atomically on every platform, python2 has no replace
+_replace = getattr(os, "replace", os.rename)
+
+
+def _newhash():
+    # blake2b is much faster than sha256 where it is available
+    if hasattr(hashlib, "blake2b"):
+        return hashlib.blake2b(digest_size=20)
+    return hashlib.sha256()
+
+
+class Cache(object):
+
+    def __init__(self, config):
+        self.config = config
+        self._cachedir = Cache.cache_dir_from_config(config)
+        self.trace = config.trace.root.get("cache")
+        if Cache.clear_requested(config):
+            self.trace("clearing cachedir")
+            self._clear()
+
+    def _clear(self):
+        # the directory is moved aside first, so concurrent runs clearing
+        # or using it never see it half removed
+        aside = "%s.%s.clear" % (self._cachedir, uuid.uuid4().hex)
+        try:
+            os.rename(str(self._cachedir), aside)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        else:
+            shutil.rmtree(aside, ignore_errors=True)
+        self._cachedir.ensure_dir()
+
+    @staticmethod
+    def clear_requested(config):
+        """ true if ``--cache-clear`` was given.  The cache is created while
+        plugins are loaded, before the full command line parse, so the
+        early parse of the known arguments is looked at as well. """
+        early = getattr(config, "known_args_namespace", None)
+        return bool(config.getoption("cacheclear", False) or
+                    getattr(early, "cacheclear", False))
+
+    @staticmethod
+    def cache_dir_from_config(config):
+        cache_dir = config.getini("cache_dir")
+        cache_dir = os.path.expanduser(cache_dir)
+        cache_dir = os.path.expandvars(cache_dir)
+        if os.path.isabs(cache_dir):
+            return py.path.local(cache_dir)
+        else:
+            return py.path.local(config.rootdir).join(cache_dir)
+
+    def makedir(self, name):
+        """ return a directory path object with the given name.  If the
+        directory does not yet exist, it will be created.  You can use it
+        to manage files likes e. g. store/retrieve database
+        dumps across runs.
+
+        :param name: must be a string not containing a ``/`` separator.
+             Make sure the name contains your plugin or application
+             identifiers to prevent clashes with other cache users.
+        """
+        if "/" in name or os.sep in name:
+            raise ValueError("name is not allowed to contain path separators")
+        return self._cachedir.ensure_dir("d", name)
+
+    def _getvaluepath(self, key):
+        return self._cachedir.join('v', *key.split('/'))
+
+    def get(self, key, default):
+        """ return cached value for the given key.  If no value
+        was yet cached or the value cannot be read, the specified
+        default is returned.
+
+        :param key: must be a ``/`` separated value. Usually the first
+             name is the name of your plugin or your application.
+        :param default: must be provided in case of a cache-miss or
+             invalid cache values.
+
+        """
+        path = self._getvaluepath(key)
+        if path.check():
+            try:
+                with path.open("r") as f:
+                    return json.load(f)
+            except ValueError:
+                self.trace("cache-invalid at %s" % (path,))
+        return default
+
+    def set(self, key, value):
+        """ save value for the given key.
+
+        :param key: must be a ``/`` separated value. Usually the first
+             name is the name of your plugin or your application.
+        :param value: must be of any combination of basic
+               python types, including nested types
+               like e. g. lists of dictionaries.
+        """
+        path = self._getvaluepath(key)
+        try:
+            path.dirpath().ensure_dir()
+        except (py.error.EEXIST, py.error.EACCES):
+            self.config._warn('could not create cache path %s' % (path,))
+            return
+        # written aside and moved into place, so readers never see a
+        # half-written value
+        try:
+            fd, tmp = tempfile.mkstemp(prefix=path.basename + ".",
+                                       suffix=".tmp", dir=str(path.dirpath()))
+        except OSError:
+            self.config._warn('cache could not write path %s' % (path,))
+            return
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(value, f, indent=2, sort_keys=True)
+            _replace(tmp, str(path))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def results(self):
+        """ return the :class:`ResultCache` of this cache directory, or
+        ``None`` if ``result_cache_size`` is 0. """
+        maxsize = parse_bytes(self.config.getini("result_cache_size"))
+        if not maxsize:
+            return None
+        return ResultCache(self.makedir("results"), maxsize)
+
+
+def file_digest(path, blocksize=1 << 20):
+    """ return the hex digest of the content of ``path``. """
+    h = _newhash()
+    with open(str(path), "rb") as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    """ content addressed store of distilled outputs.
+
+    Every entry is a data file plus a json file with metadata.  Using an
+    entry refreshes its mtime; when the data exceeds ``maxsize`` bytes the
+    least recently used entries are removed.
+    """
+
+    def __init__(self, directory, maxsize):
+        self.directory = py.path.local(directory)
+        self.maxsize = maxsize
+
+    @staticmethod
+    def key(*parts):
+        """ return a cache key for json serializable ``parts``. """
+        h = _newhash()
+        h.update(json.dumps(parts, sort_keys=True, default=str).encode("utf-8"))
+        return h.hexdigest()
+
+    def _paths(self, key):
+        return self.directory.join(key + ".data"), self.directory.join(key + ".json")
+
+    def get(self, key):
+        """ return ``(datapath, meta)`` of a cached entry or ``None``. """
+        datapath, metapath = self._paths(key)
+        try:
+            with metapath.open("r") as f:
+                meta = json.load(f)
+            datapath.setmtime()
+        except (ValueError, py.error.Error):
+            return None
+        metapath.setmtime()
+        return datapath, meta
+
+    def put(self, key, srcpath, meta):
+        """ move ``srcpath`` into the cache under ``key`` and return the new
+        ``(datapath, meta)``, or ``None`` if it is too large to be cached.
+
+        Entries become visible atomically, concurrent runs storing the same
+        key are harmless.
+        """
+        srcpath = py.path.local(srcpath)
+        if srcpath.size() > self.maxsize:
+            return None
+        datapath, metapath = self._paths(key)
+        tmp = "%s.%d.tmp" % (key, os.getpid())
+        tmpdata = self.directory.join(tmp + ".data")
+        tmpmeta = self.directory.join(tmp + ".json")
+        shutil.move(str(srcpath), str(tmpdata))
+        with tmpmeta.open("w") as f:
+            json.dump(meta, f, sort_keys=True)
+        os.rename(str(tmpdata), str(datapath))
+        os.rename(str(tmpmeta), str(metapath))
+        self.evict()
+        return datapath, meta
+
+    def evict(self):
+        """ remove least recently used entries until the cache fits. """
+        entries = []
+        total = 0
+        for metapath in self.directory.listdir("*.json"):
+            if metapath.basename.endswith(".tmp.json"):
+                continue
+            datapath = metapath.new(ext=".data")
+            try:
+                size = datapath.size() + metapath.size()
+                mtime = metapath.mtime()
+            except py.error.Error:
+                continue
+            entries.append((mtime, size, datapath, metapath))
+            total += size
+        entries.sort(key=lambda entry: entry[0])
+        for mtime, size, datapath, metapath in entries:
+            if total <= self.maxsize:
+                break
+            for path in (metapath, datapath):
+                try:
+                    path.remove()
+                except py.error.Error:
+                    pass
+            total -= size
+
+
+def getcache(config):
+    """ return ``config.cache``, creating it on first use. """
+    cache = getattr(config, "cache", None)
+    if cache is None:
+        cache = config.cache = Cache(config)
+    return cache
+
+
+def pydistill_addoption(parser):
+    group = parser.getgroup("general")
+    group.addoption(
+        '--cache-clear', action='store_true', dest="cacheclear",
+        default=False, help="remove all cache contents, including cached results, at "
+             "start of the run.")
+    parser.addini(
+        "cache_dir", default='.pydistill_cache',
+        help="cache directory path.")
+    parser.addini(
+        "result_cache_size", default="1GB",
+        help="size bound of the cache of distilled outputs, 0 disables it.")
+    parser.addini(
+        "parse_cache_size", default="4GB",
+        help="size bound of the cache of trees parsed by language plugins, "
+             "0 disables it.")
+
+
+def pydistill_configure(config):
+    getcache(config)
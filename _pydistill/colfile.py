@@ -0,0 +1,326 @@
+"""
+compact binary column file format for distilled data, read through mmap.
+
+A column file holds a table as row groups of typed, contiguous column
+arrays, followed by a json footer with the header, the dtype and offset of
+every column chunk and its min/max statistics::
+
+    MAGIC | group 0: column 0, column 1, ... | group 1: ... | footer |
+    footer length (8 bytes, little endian) | MAGIC
+
+Column chunks are raw little endian NumPy arrays aligned to 8 bytes, so a
+:class:`ColumnFile` maps the file and wraps chunks with ``numpy.frombuffer``
+without copying or parsing anything; only the columns and row groups which
+are actually used are paged in.  Text columns are stored as the offsets of
+every value followed by the utf-8 encoded values, and decoded when read.
+The statistics let readers skip row groups which cannot contain a range of
+values, see :meth:`ColumnFile.groups_between`.
+
+The ``csv`` sub-command writes column files if ``--output`` ends in
+``.pdc`` and reads them as inputs, so chained distillation steps exchange
+typed columns instead of re-parsing text.  Requires numpy.
+"""
+from __future__ import absolute_import, division, print_function
+import json
+import mmap
+import struct
+
+import numpy as np
+
+from _pydistill.table import ColumnTable, column_to_text, convert
+
+#: file name suffix of column files
+SUFFIX = ".pdc"
+
+#: first and last bytes of every column file
+MAGIC = b"PDCOL\x00\x01\x00"
+
+#: changes whenever the layout changes
+FORMAT_VERSION = 2
+
+#: default number of rows per row group
+DEFAULT_ROW_GROUP_ROWS = 65536
+
+_ALIGN = 8
+_LENGTH = struct.Struct("<Q")
+
+#: dtype kinds which can be stored: bool, integers, floats and unicode
+_KINDS = "biufU"
+
+#: the dtype of text columns in the footer
+_UTF8 = "utf8"
+
+_OFFSET = np.dtype("<u8")
+
+
+def _stats(array):
+    """ return the json serializable ``(min, max)`` of ``array``, ignoring
+    NaNs, or ``(None, None)`` if there are no values. """
+    if array.dtype.kind == "f":
+        array = array[~np.isnan(array)]
+    if not len(array):
+        return None, None
+    if array.dtype.kind == "U":
+        values = array.tolist()
+        return min(values), max(values)
+    return array.min().item(), array.max().item()
+
+
+def _concat(arrays):
+    """ concatenate the chunks of a column, which may have been inferred
+    with different dtypes in different row groups. """
+    if len(arrays) == 1:
+        return arrays[0]
+    try:
+        dtype = np.result_type(*arrays)
+    except TypeError:
+        # numbers in some groups, text in others
+        dtype = np.str_
+    return np.concatenate([a.astype(dtype, copy=False) for a in arrays])
+
+
+def _stored(text):
+    """ the array stored for the unicode array ``text``: numbers only if
+    they are written back exactly as read, empty fields being NaN. """
+    for type in ("int", "float"):
+        try:
+            array = convert(text, type)
+        except ValueError:
+            continue
+        if (column_to_text(array) == text).all():
+            return array
+    return text
+
+
+def _encode_text(array):
+    """ return the value offsets and the utf-8 data of a text column. """
+    values = [value.encode("utf-8") for value in array.tolist()]
+    offsets = np.zeros(len(values) + 1, dtype=_OFFSET)
+    np.cumsum([len(value) for value in values], out=offsets[1:])
+    return offsets, b"".join(values)
+
+
+class ColumnFileWriter(object):
+    """ writes a header and chunks of rows to a binary stream as a column
+    file.
+
+    Rows are collected into row groups of ``rowgroup_rows`` rows; a column
+    is stored as integers or floats per row group if its text is written
+    back unchanged from them, as text otherwise.  :meth:`finish` writes the
+    last row group and the footer.
+    """
+
+    def __init__(self, stream, rowgroup_rows=DEFAULT_ROW_GROUP_ROWS):
+        if rowgroup_rows <= 0:
+            raise ValueError("row group size must be positive")
+        self.stream = stream
+        self.rowgroup_rows = rowgroup_rows
+        self.header = None
+        self._rows = []
+        self._groups = []
+        self._offset = 0
+        self._write(MAGIC)
+
+    def _write(self, data):
+        self.stream.write(data)
+        self._offset += len(data)
+
+    def writeheader(self, header):
+        if header is not None and self.header is None:
+            self.header = list(header)
+
+    def write(self, chunk):
+        rows = self._rows
+        rows.extend(chunk)
+        size = self.rowgroup_rows
+        if len(rows) >= size:
+            full = len(rows) - len(rows) % size
+            for start in range(0, full, size):
+                self._write_rows(rows[start:start + size])
+            del rows[:full]
+
+    def _write_rows(self, rows):
+        if self.header is None:
+            raise ValueError("the header must be written before the rows")
+        table = ColumnTable.from_rows(self.header, rows,
+                                      dict.fromkeys(self.header, np.str_))
+        for name in self.header:
+            table[name] = _stored(table[name])
+        self.write_table(table)
+
+    def write_table(self, table):
+        """ write the :class:`ColumnTable <_pydistill.table.ColumnTable>`
+        ``table`` as one row group. """
+        if self.header is None:
+            self.header = table.header
+        elif table.header != self.header:
+            raise ValueError("table columns %r differ from the header %r" % (
+                table.header, self.header))
+        if not len(table):
+            return
+        columns = []
+        for name in self.header:
+            array = table[name]
+            if array.dtype.kind not in _KINDS:
+                raise ValueError("column %r: cannot store dtype %s" % (
+                    name, array.dtype))
+            low, high = _stats(array)
+            self._write(b"\0" * (-self._offset % _ALIGN))
+            if array.dtype.kind == "U":
+                offsets, data = _encode_text(array)
+                columns.append(dict(dtype=_UTF8, offset=self._offset,
+                                    min=low, max=high))
+                self._write(offsets.view(np.uint8).data)
+                self._write(data)
+                continue
+            array = np.ascontiguousarray(
+                array, dtype=array.dtype.newbyteorder("<"))
+            columns.append(dict(dtype=array.dtype.str, offset=self._offset,
+                                min=low, max=high))
+            self._write(array.view(np.uint8).data)
+        self._groups.append(dict(rows=len(table), columns=columns))
+
+    def flush(self):
+        self.stream.flush()
+
+    def finish(self):
+        """ write the collected rows and the footer. """
+        if self._rows:
+            self._write_rows(self._rows)
+            self._rows = []
+        footer = json.dumps(dict(version=FORMAT_VERSION,
+                                 header=self.header or [],
+                                 groups=self._groups)).encode("utf-8")
+        self._write(footer)
+        self._write(_LENGTH.pack(len(footer)))
+        self._write(MAGIC)
+        self.flush()
+
+
+class RowGroup(object):
+    """ one row group of a :class:`ColumnFile`. """
+
+    def __init__(self, buffer, header, meta):
+        self._buffer = buffer
+        self._columns = dict(zip(header, meta["columns"]))
+        self.rows = meta["rows"]
+
+    def stats(self, name):
+        """ return ``(min, max)`` of column ``name`` in this group. """
+        meta = self._columns[name]
+        return meta["min"], meta["max"]
+
+    def column(self, name):
+        """ return column ``name`` as a read-only array backed by the file
+        mapping; text columns are decoded into a new unicode array. """
+        meta = self._columns[name]
+        if meta["dtype"] == _UTF8:
+            offsets = np.frombuffer(self._buffer, _OFFSET, self.rows + 1,
+                                    meta["offset"]).tolist()
+            start = meta["offset"] + _OFFSET.itemsize * (self.rows + 1)
+            data = self._buffer[start:start + offsets[-1]]
+            return np.array([data[a:b].decode("utf-8") for a, b in
+                             zip(offsets[:-1], offsets[1:])], dtype=np.str_)
+        return np.frombuffer(self._buffer, np.dtype(meta["dtype"]),
+                             self.rows, meta["offset"])
+
+
+class ColumnFile(object):
+    """ memory mapped column file.
+
+    Iterating yields every row group as a chunk of rows of strings, so a
+    column file can be read like a :class:`CsvReader
+    <_pydistill.stream.CsvReader>`; :meth:`read` returns typed columns.
+    With ``columns`` only these columns are seen, the others are never paged
+    in.  Used as a context manager the file is closed on exit.
+    """
+
+    def __init__(self, path, columns=None):
+        self.path = str(path)
+        with open(self.path, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file
+                raise ValueError("%s is not a column file" % (self.path,))
+        mm = self._mmap
+        trailer = _LENGTH.size + len(MAGIC)
+        if len(mm) < len(MAGIC) + trailer or \
+                mm[:len(MAGIC)] != MAGIC or mm[-len(MAGIC):] != MAGIC:
+            self.close()
+            raise ValueError("%s is not a column file" % (self.path,))
+        length, = _LENGTH.unpack_from(mm, len(mm) - trailer)
+        footer = json.loads(
+            mm[len(mm) - trailer - length:len(mm) - trailer].decode("utf-8"))
+        if footer["version"] != FORMAT_VERSION:
+            self.close()
+            raise ValueError("%s: unsupported column file version %r" % (
+                self.path, footer["version"]))
+        self.groups = [RowGroup(mm, footer["header"], meta)
+                       for meta in footer["groups"]]
+        self.header = footer["header"]
+        if columns is not None:
+            for name in columns:
+                if name not in self.header:
+                    self.close()
+                    raise ValueError("unknown column %r" % (name,))
+            self.header = list(columns)
+
+    @property
+    def num_rows(self):
+        return sum(group.rows for group in self.groups)
+
+    def groups_between(self, name, low=None, high=None):
+        """ return the indexes of the row groups in which column ``name``
+        may have values between ``low`` and ``high`` (inclusive). """
+        found = []
+        for i, group in enumerate(self.groups):
+            gmin, gmax = group.stats(name)
+            if gmin is None:
+                continue
+            if low is not None and gmax < low:
+                continue
+            if high is not None and gmin > high:
+                continue
+            found.append(i)
+        return found
+
+    def read(self, columns=None, groups=None):
+        """ return a :class:`ColumnTable <_pydistill.table.ColumnTable>` of
+        ``columns`` (default: all) in the row groups with the indexes
+        ``groups`` (default: all).
+
+        A single row group is returned without copying.
+        """
+        columns = self.header if columns is None else list(columns)
+        for name in columns:
+            if name not in self.header:
+                raise KeyError(name)
+        selected = self.groups if groups is None else [
+            self.groups[i] for i in groups]
+        if not selected:
+            return ColumnTable((name, np.empty(0)) for name in columns)
+        return ColumnTable(
+            (name, _concat([group.column(name) for group in selected]))
+            for name in columns)
+
+    def __iter__(self):
+        for i in range(len(self.groups)):
+            yield self.read(groups=[i]).to_rows()
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            # arrays still use the mapping, it is closed with the last one
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return "<ColumnFile %s rows=%d groups=%d>" % (
+            self.path, self.num_rows, len(self.groups))
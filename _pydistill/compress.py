@@ -0,0 +1,223 @@
+"""
+transparent decompression of gzip, bzip2 and xz compressed inputs.
+
+Compression is detected by the magic bytes at the start of a file, not by
+its name, and inputs are decompressed while they are read, so they never
+take up disk space uncompressed.
+
+Files made of several compressed members or streams, as written by
+``bgzip`` or ``pbzip2`` or by concatenating compressed files, are
+decompressed by several threads at once: every offset where the magic of a
+member appears is decompressed speculatively and the members which really
+follow each other are stitched together in order.  Offsets which only look
+like a member are dropped.  zlib, bz2 and lzma release the GIL, so the
+threads run in parallel.  The data decompressed ahead is bounded by
+:data:`MEMORY_BUDGET`; larger members, like the single member of a plain
+``gzip`` file, are streamed.  ``pigz`` and ``xz -T`` write a single member
+or stream, which is decompressed by one thread.
+"""
+from __future__ import absolute_import, division, print_function
+import bz2
+import collections
+import gzip
+import io
+import mmap
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    # python 2
+    lzma = None
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # python 2 without the futures backport
+    ThreadPoolExecutor = None
+
+#: bytes of a compressed file fed to a decompressor at once
+BLOCK_SIZE = 1024 * 1024
+
+#: largest member decompressed ahead, larger ones are streamed
+SPECULATE_LIMIT = 32 * 1024 * 1024
+
+#: bytes decompressed ahead by all threads of one input together
+MEMORY_BUDGET = 64 * 1024 * 1024
+
+_DETECT = 6
+
+_ERRORS = (zlib.error, OSError, IOError, EOFError, ValueError)
+if lzma is not None:
+    _ERRORS += (lzma.LZMAError,)
+
+
+class _Format(object):
+    """ how to recognize, open and decompress one compression format. """
+
+    def __init__(self, name, magic, member_magic, open, decompressor):
+        self.name = name
+        self.magic = magic
+        self.member_magic = member_magic
+        self.open = open
+        self.decompressor = decompressor
+
+
+_FORMATS = [
+    _Format("gzip", b"\x1f\x8b", b"\x1f\x8b\x08", gzip.open,
+            lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)),
+    # stream header followed by the magic of the first block
+    _Format("bz2", b"BZh", b"1AY&SY", bz2.BZ2File, bz2.BZ2Decompressor),
+]
+if lzma is not None:
+    _FORMATS.append(_Format("xz", b"\xfd7zXZ\x00", b"\xfd7zXZ\x00",
+                            lzma.open, lzma.LZMADecompressor))
+
+
+def detect(path):
+    """ return the name of the compression format of the file ``path``,
+    or ``None`` if it is not compressed. """
+    fmt = _detect(path)
+    return fmt.name if fmt is not None else None
+
+
+def _detect(path):
+    with open(str(path), "rb") as f:
+        head = f.read(_DETECT)
+    for fmt in _FORMATS:
+        if head.startswith(fmt.magic):
+            return fmt
+    return None
+
+
+def _member_starts(buf, fmt):
+    """ yield the offsets in ``buf`` at which a member may start. """
+    magic = fmt.member_magic
+    # the bz2 block magic follows the four bytes "BZh<level>"
+    shift = 4 if fmt.name == "bz2" else 0
+    pos = buf.find(magic)
+    while pos >= 0:
+        if pos >= shift:
+            yield pos - shift
+        pos = buf.find(magic, pos + 1)
+
+
+def _decompress_member(buf, start, fmt, limit):
+    """ decompress the member starting at ``start`` and return its data and
+    the offset following it, or ``None`` if there is no valid member or its
+    data is larger than ``limit``. """
+    decompressor = fmt.decompressor()
+    out = []
+    size = 0
+    pos = start
+    try:
+        while not decompressor.eof and pos < len(buf):
+            out.append(decompressor.decompress(buf[pos:pos + BLOCK_SIZE]))
+            pos += BLOCK_SIZE
+            size += len(out[-1])
+            if size > limit:
+                return None
+    except _ERRORS:
+        return None
+    if not decompressor.eof:
+        return None
+    return b"".join(out), min(pos, len(buf)) - len(decompressor.unused_data)
+
+
+def iter_members(buf, fmt, threads, limit=SPECULATE_LIMIT,
+                 budget=MEMORY_BUDGET):
+    """ yield the decompressed data of the compressed data ``buf`` in order.
+
+    Up to ``2 * threads`` of the following members are decompressed ahead
+    in a thread pool, each holding at most ``limit`` bytes and all of them
+    together at most ``budget`` bytes.  The member at the current offset is
+    streamed if it was not decompressed ahead, e.g. because it is larger.
+    """
+    starts = _member_starts(buf, fmt)
+    ahead = collections.OrderedDict()
+    maxahead = 2 * threads
+    limit = min(limit, budget // maxahead)
+    pos = 0
+    with ThreadPoolExecutor(threads) as pool:
+        while pos < len(buf):
+            while len(ahead) < maxahead:
+                start = next(starts, None)
+                if start is None:
+                    break
+                if start > pos:
+                    ahead[start] = pool.submit(_decompress_member, buf, start,
+                                               fmt, limit)
+            future = ahead.pop(pos, None)
+            found = future.result() if future is not None else None
+            if found is not None:
+                data, pos = found
+                yield data
+            else:
+                decompressor = fmt.decompressor()
+                while not decompressor.eof:
+                    if pos >= len(buf):
+                        raise IOError("truncated %s data" % (fmt.name,))
+                    try:
+                        data = decompressor.decompress(
+                            buf[pos:pos + BLOCK_SIZE])
+                    except _ERRORS as e:
+                        raise IOError("corrupt %s data at offset %d: %s" % (
+                            fmt.name, pos, e))
+                    pos += BLOCK_SIZE
+                    yield data
+                pos = min(pos, len(buf)) - len(decompressor.unused_data)
+            # false starts inside the member just done
+            for start in [start for start in ahead if start < pos]:
+                ahead.pop(start).cancel()
+            # padding between members
+            while pos < len(buf) and buf[pos:pos + 1] == b"\0":
+                pos += 1
+
+
+class _MemberStream(io.RawIOBase):
+    """ readable binary stream of the decompressed members of a mapped
+    file. """
+
+    def __init__(self, path, fmt, threads):
+        with open(str(path), "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._members = iter_members(self._mmap, fmt, threads)
+        self._data = b""
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._pos >= len(self._data):
+            self._data = next(self._members, None)
+            self._pos = 0
+            if self._data is None:
+                self._data = b""
+                return 0
+        size = min(len(b), len(self._data) - self._pos)
+        b[:size] = self._data[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._members.close()
+            self._mmap.close()
+        super(_MemberStream, self).close()
+
+
+def open_input(path, threads=1):
+    """ return a binary stream of the decompressed content of ``path``, or
+    ``None`` if ``path`` is not compressed.
+
+    With ``threads`` > 1 files of several members are decompressed in that
+    many threads.
+    """
+    fmt = _detect(path)
+    if fmt is None:
+        return None
+    if threads > 1 and ThreadPoolExecutor is not None:
+        return io.BufferedReader(_MemberStream(path, fmt, threads),
+                                 BLOCK_SIZE)
+    return fmt.open(str(path), "rb")
@@ -1,19 +1,14 @@
 """ command line options, ini-file and conftest.py processing. """
 from __future__ import absolute_import, division, print_function
-import argparse
-import shlex
-import traceback
-import types
-import warnings
-
-import six
+# keep module level imports to what every invocation needs: argparse,
+# shlex, traceback, six, the hookspec modules and _pydistill.assertion
+# are imported where they are used, so that "import pydistill" and
+# "distill --version" stay cheap (see testing/test_importtime.py).
+# py only installs a lazy apipkg namespace on import.
 import py
 # DON't import pydistill here because it causes import cycle troubles
 import sys
 import os
-import _pydistill.exthookspec  # the extension definitions
-import _pydistill.langhookspec  # the language definitions
-import _pydistill.assertion
 from pluggy import PluginManager, HookimplMarker, HookspecMarker
 
 # pydistill extension plugins
@@ -34,6 +29,7 @@ class ConfextractImportFailure(Exception):
         self.excinfo = excinfo
 
     def __str__(self):
+        import traceback
         etype, evalue, etb = self.excinfo
         formatted = traceback.format_tb(etb)
         # The level of the tracebacks we want to print is hand crafted :(
@@ -48,10 +44,30 @@ def main(args=None, plugins=None):
     :arg plugins: list of plugin objects to be auto-registered during
                   initialization.
     """
+    if _daemon_requested(args):
+        from _pydistill import daemon
+        try:
+            socketpath = daemon.daemon_args(args)
+        except ValueError as e:
+            sys.stderr.write("ERROR: %s\n" % (e,))
+            return 4
+        return daemon.serve(socketpath or None)
+    if _version_requested(args):
+        from _pydistill import __version__
+        sys.stderr.write("This is pydistill version %s, imported from %s\n" % (
+            __version__, os.path.dirname(os.path.abspath(__file__))))
+        return 0
+    return _run(args, plugins)
+
+
+def _run(args, plugins=None, entrypoints=None):
+    """ run one job and return its exit code, see :func:`main`;
+    ``entrypoints`` are passed on to :func:`get_config`. """
     try:
         try:
-            config = _prepareconfig(args, plugins)
+            config = _prepareconfig(args, plugins, entrypoints)
         except ConfextractImportFailure as e:
+            import traceback
             tw = py.io.TerminalWriter(sys.stderr)
             for line in traceback.format_exception(*e.excinfo):
                 tw.line(line.rstrip(), red=True)
@@ -59,7 +75,14 @@ def main(args=None, plugins=None):
             return 4
         else:
             try:
-                return config.hook.pydistill_cmdline_main(config=config)
+                config._do_configure()
+                ret = config.hook.pydistill_cmdline_main(config=config)
+                if ret is None:
+                    if config.subcmd is None:
+                        raise UsageError("no sub-command given, see --help")
+                    raise UsageError("unknown sub-command: %s" % (
+                        config.subcmd,))
+                return ret
             finally:
                 config._ensure_unconfigure()
     except UsageError as e:
@@ -69,29 +92,54 @@ def main(args=None, plugins=None):
         return 4
 
 
+def _daemon_requested(args):
+    """ true if the command line asks to start the daemon, see
+    :mod:`_pydistill.daemon`. """
+    if args is None:
+        args = sys.argv[1:]
+    return isinstance(args, (list, tuple)) and args[:1] == ["--daemon"]
+
+
+def _version_requested(args):
+    """ true if the command line only asks for the version, which is
+    answered before any plugin is loaded. """
+    if args is None:
+        args = sys.argv[1:]
+    return isinstance(args, (list, tuple)) and list(args) in (
+        ["--version"], ["-V"])
+
+
 class cmdline(object):  # compatibility namespace
     main = staticmethod(main)
 
 class UsageError(Exception):
     """ error in pydistill usage or invocation"""
 
-default_plugins = ( "csv" )
+
+notset = object()
+
+essential_plugins = ("cacheprovider", "hookprofile")
+
+default_plugins = essential_plugins + ("csv", "bench")
 
 builtin_plugins = set(default_plugins)
 #builtin_plugins.add("pytester")
 
 
-def get_config(subcmd):
+def get_config(subcmd, entrypoints=None):
     # subsequent calls to main will create a fresh instance
     pluginmanager = PyDistillPluginManager()
+    # loaded in place of the setuptools entry points, see Session
+    pluginmanager._entrypoints = entrypoints
     config = Config(pluginmanager)
     for spec in default_plugins:
-        #pluginmanager.import_plugin(spec)
-        if spec == subcmd:
+        if spec in essential_plugins or spec == subcmd:
             pluginmanager.import_plugin(spec)
     return config
 
-def _prepareconfig(args=None, plugins=None):
+def _prepareconfig(args=None, plugins=None, entrypoints=None):
+    import shlex
+    import six
     warning = None
     if args is None:
         subcmd = sys.argv[1] if len(sys.argv) > 1 else None
@@ -107,7 +155,10 @@ def _prepareconfig(args=None, plugins=None):
         args = _args[1:] if len(_args) > 1 else []
         from _pydistill import deprecated
         warning = deprecated.TEST_WARNING
-    config = get_config(subcmd)
+    else:
+        subcmd = args[0] if args else None
+        args = list(args[1:])
+    config = get_config(subcmd, entrypoints)
     pluginmanager = config.pluginmanager
     try:
         if plugins:
@@ -129,13 +180,15 @@ class PyDistillPluginManager(PluginManager):
     Overwrites :py:class:`pluggy.PluginManager <pluggy.PluginManager>` to add pydistill-specific
     functionality:
 
-    * loading plugins from the command line, ``PYDISTILL_PLUGIN`` env variable and
-      ``pydistill_plugins`` global variables found in plugins being loaded;
+    * loading plugins from the command line (``-p name``) and the
+      ``PYDISTILL_PLUGINS`` env variable;
     * ``confdistill.py`` loading during start-up;
+    * functions and methods named ``pydistill_*`` implement hooks without
+      being marked with ``exthookimpl``.
     """
 
     def __init__(self):
-        super(PyDistillPluginManager, self).__init__("pydistill", implprefix="pydistill_")
+        super(PyDistillPluginManager, self).__init__("pydistill")
         self._confdistill_plugins = set()
 
         # state related to local conftest plugins
@@ -143,8 +196,11 @@ class PyDistillPluginManager(PluginManager):
         self._confdistillpath2mod = {}
         self._confcutdir = None
         self._noconfdistill = False
+        self._confdistillindex = None
+        self._entrypoints = None
         self._duplicatepaths = set()
 
+        import _pydistill.exthookspec  # the extension definitions
         self.add_hookspecs(_pydistill.exthookspec)
         self.register(self)
         if os.environ.get('PYDISTILL_DEBUG'):
@@ -158,7 +214,17 @@ class PyDistillPluginManager(PluginManager):
             self.enable_tracing()
 
         # Config._consider_importhook will set a real object if required.
-        self.rewrite_hook = _pydistill.assertion.DummyRewriteHook()
+        from _pydistill.assertion import DummyRewriteHook
+        self.rewrite_hook = DummyRewriteHook()
+
+    def parse_hookimpl_opts(self, plugin, name):
+        import inspect
+        opts = super(PyDistillPluginManager, self).parse_hookimpl_opts(
+            plugin, name)
+        if opts is None and name.startswith("pydistill_") and \
+                inspect.isroutine(getattr(plugin, name, None)):
+            opts = {}
+        return opts
 
     def _warn(self, message):
         kwargs = message if isinstance(message, dict) else {
@@ -169,6 +235,139 @@ class PyDistillPluginManager(PluginManager):
         }
         self.hook.pydistill_logwarning.call_historic(kwargs=kwargs)
 
+    def load_setuptools_entrypoints(self, entrypoint_name, subcmd=None,
+                                    cache=None):
+        """ load the plugins registered under ``entrypoint_name``.
+
+        With a ``cache`` the entry points are taken from an
+        :class:`EntryPointIndex <_pydistill.entrypoints.EntryPointIndex>`
+        instead of scanning all distributions.  Entry points given to
+        :func:`get_config` are used as they are.  Either way plugins named
+        ``<other-subcmd>.<name>`` are skipped.
+        """
+        from _pydistill import entrypoints
+        entries = self._entrypoints
+        if entries is None:
+            if cache is None:
+                entries = entrypoints.scan_entrypoints(entrypoint_name)
+            else:
+                entries = entrypoints.EntryPointIndex(
+                    cache, entrypoint_name).entries()
+        for ep in entries:
+            if not ep.applies_to(subcmd):
+                continue
+            if self.get_plugin(ep.name) or self.is_blocked(ep.name):
+                continue
+            plugin = ep.load()
+            self.register(plugin, name=ep.name)
+            self._plugin_distinfo.append((plugin, ep.dist))
+
+    #
+    # internal API for local confdistill plugin handling
+    #
+    def _set_initial_confdistills(self, namespace, index=None):
+        """ load initial confdistill files given a preparsed "namespace".
+        As conftest files may add their own command line options
+        which have arguments ('--my-opt somepath') we might get some
+        false positives.  All builtin and 3rd party plugins will have
+        been loaded, however, so common options will not confuse our logic
+        here.
+
+        ``index`` is the :class:`ConfdistillIndex
+        <_pydistill.confindex.ConfdistillIndex>` used to find the files.
+        """
+        from _pydistill.confindex import ConfdistillIndex
+        current = py.path.local()
+        self._confcutdir = current.join(namespace.confcutdir, abs=True) \
+            if namespace.confcutdir else None
+        self._noconfdistill = namespace.noconfdistill
+        self._confdistillindex = index if index is not None else ConfdistillIndex()
+        foundanchor = False
+        for path in namespace.file_or_dir:
+            anchor = current.join(str(path), abs=1)
+            if anchor.exists():  # we found some file object
+                self._getconfdistillmodules(anchor)
+                foundanchor = True
+        if not foundanchor:
+            self._getconfdistillmodules(current)
+
+    def _getconfdistillmodules(self, path):
+        if self._noconfdistill:
+            return []
+        try:
+            return self._path2confmods[path]
+        except KeyError:
+            if path.isfile():
+                clist = self._getconfdistillmodules(path.dirpath())
+            else:
+                clist = [self._importconfdistill(confdistillpath)
+                         for confdistillpath in
+                         self._confdistillindex.confdistill_paths(
+                             path, self._confcutdir)]
+            self._path2confmods[path] = clist
+            return clist
+
+    def _importconfdistill(self, confdistillpath):
+        try:
+            return self._confdistillpath2mod[confdistillpath]
+        except KeyError:
+            pkgpath = confdistillpath.pypkgpath()
+            if pkgpath is None:
+                sys.modules.pop(confdistillpath.purebasename, None)
+            try:
+                mod = confdistillpath.pyimport()
+            except Exception:
+                raise ConfextractImportFailure(confdistillpath, sys.exc_info())
+
+            self._confdistill_plugins.add(mod)
+            self._confdistillpath2mod[confdistillpath] = mod
+            self.trace("loaded confdistillmodule %r" % (mod))
+            self.register(mod, name=mod.__file__)
+            return mod
+
+    def consider_preparse(self, args):
+        """ load or block the plugins given with ``-p`` in ``args``. """
+        for opt1, opt2 in zip(args, args[1:]):
+            if opt1 == "-p":
+                self.consider_pluginarg(opt2)
+
+    def consider_pluginarg(self, arg):
+        if arg.startswith("no:"):
+            self.set_blocked(arg[3:])
+        else:
+            self.import_plugin(arg)
+
+    def consider_env(self):
+        """ load the plugins named in ``PYDISTILL_PLUGINS``, separated by
+        commas. """
+        spec = os.environ.get("PYDISTILL_PLUGINS")
+        if spec:
+            for name in spec.split(","):
+                self.import_plugin(name.strip())
+
+    def import_plugin(self, modname):
+        # most often modname refers to builtin modules, e.g. "csv".
+        # Those plugins are registered under their basename for historic
+        # purposes but must be imported with the _pydistill prefix.
+        import six
+        assert isinstance(modname, (six.text_type, str)), "module name as text required, got %r" % modname
+        modname = str(modname)
+        if self.is_blocked(modname) or self.get_plugin(modname) is not None:
+            return
+        if modname in builtin_plugins:
+            importspec = "_pydistill." + modname
+        else:
+            importspec = modname
+        self.rewrite_hook.mark_rewrite(importspec)
+        try:
+            __import__(importspec)
+        except ImportError as e:
+            new_exc = ImportError('Error importing plugin "%s": %s' % (modname, e.args[0]))
+            six.reraise(ImportError, new_exc, sys.exc_info()[2])
+        else:
+            mod = sys.modules[importspec]
+            self.register(mod, modname)
+
 class Parser(object):
     """ Parser for command line arguments and ini-file values.
 
@@ -184,7 +383,88 @@ class Parser(object):
         self._inidict = {}
         self._ininames = []
         self.extra_info = {}
+        # sub-command -> MyOptionParser, emptied whenever an option or an
+        # ini value is added
+        self._parsercache = {}
+
+    def processoption(self, option):
+        self._parsercache.clear()
+        if self._processopt:
+            if option.dest:
+                self._processopt(option)
+
+    def getgroup(self, name, description="", after=None):
+        """ get (or create) a named option Group.
+
+        :name: name of the option group.
+        :description: long description for --help output.
+        :after: name of other group, used for ordering --help output.
+
+        The returned group object has an ``addoption`` method with the same
+        signature as :py:func:`parser.addoption
+        <_pydistill.config.Parser.addoption>` but will be shown in the
+        respective group in the output of ``distill --help``.
+        """
+        for group in self._groups:
+            if group.name == name:
+                return group
+        group = OptionGroup(name, description, parser=self)
+        i = 0
+        for i, grp in enumerate(self._groups):
+            if grp.name == after:
+                break
+        self._groups.insert(i + 1, group)
+        return group
+
+    def addoption(self, *opts, **attrs):
+        """ register a command line option.
+
+        :opts: option names, can be short or long options.
+        :attrs: same attributes which the ``add_option()`` function of the
+           `argparse library
+           <http://docs.python.org/2/library/argparse.html>`_
+           accepts.
+
+        After command line parsing options are available on the pydistill config
+        object via ``config.option.NAME`` where ``NAME`` is usually set
+        by passing a ``dest`` attribute, for example
+        ``addoption("--long", dest="NAME", ...)``.
+        """
+        self._anonymous.addoption(*opts, **attrs)
+
+    def addini(self, name, help, type=None, default=None):
+        """ register an ini-file option.
+
+        :name: name of the ini-variable
+        :type: type of the variable, can be ``pathlist``, ``args``, ``linelist``
+               or ``bool``.
+        :default: default value if no ini-file option exists but is queried.
+
+        The value of ini-variables can be retrieved via a call to
+        :py:func:`config.getini(name) <_pydistill.config.Config.getini>`.
+        """
+        assert type in (None, "pathlist", "args", "linelist", "bool")
+        self._parsercache.clear()
+        self._inidict[name] = (help, type, default)
+        self._ininames.append(name)
 
+    def parse(self, subcmd, args, namespace=None):
+        from _pydistill._argcomplete import try_argcomplete
+        self.optparser = self._getparser(subcmd)
+        try_argcomplete(self.optparser)
+        return self.optparser.parse_args([str(x) for x in args], namespace=namespace)
+
+    def parse_setoption(self, subcmd, args, option, namespace=None):
+        parsedoption = self.parse(subcmd, args, namespace=namespace)
+        for name, value in parsedoption.__dict__.items():
+            setattr(option, name, value)
+        return subcmd, getattr(parsedoption, FILE_OR_DIR)
+
+    def parse_known_args(self, subcmd, args, namespace=None):
+        """parses and returns a namespace object with known arguments at this
+        point.
+        """
+        return self.parse_known_and_unknown_args(subcmd, args, namespace=namespace)[0]
 
     def parse_known_and_unknown_args(self, subcmd, args, namespace=None):
         """parses and returns a namespace object with known arguments, and
@@ -192,14 +472,24 @@ class Parser(object):
         """
         optparser = self._getparser(subcmd)
         args = [str(x) for x in args]
-        return optparser.parse_known_args(subcmd, args, namespace=namespace)
+        return optparser.parse_known_args(args, namespace=namespace)
 
     def _getparser(self, subcmd):
+        # building the argparse parser costs time linear in the number of
+        # plugin options and happens several times per Config.parse, so it
+        # is built once per sub-command until an option or ini value is added
+        try:
+            return self._parsercache[subcmd]
+        except KeyError:
+            optparser = self._parsercache[subcmd] = self._buildparser(subcmd)
+            return optparser
+
+    def _buildparser(self, subcmd):
         #TODO: get groups from installed plugins. remove unnecessary subcmd argument
         #TODO: Hierachcial Plugins with Language classification
         #TODO: Mgr -> KGenMgr
-        #TODO: HookSpec -> IOHookSpec -> (ReadHookSpec, WriterHookSpec)
         from _pydistill._argcomplete import filescompleter
+        from _pydistill._optparser import MyOptionParser
         optparser = MyOptionParser(self, self.extra_info)
         groups = self._groups + [self._anonymous]
         for group in groups:
@@ -214,6 +504,10 @@ class Parser(object):
         optparser.add_argument(FILE_OR_DIR, nargs='*').completer = filescompleter
         return optparser
 
+#: dest of the positional arguments, see _pydistill._optparser
+FILE_OR_DIR = 'file_or_dir'
+
+
 class OptionGroup(object):
     def __init__(self, name, description="", parser=None):
         self.name = name
@@ -221,6 +515,136 @@ class OptionGroup(object):
         self.options = []
         self.parser = parser
 
+    def addoption(self, *optnames, **attrs):
+        """ add an option to this group.
+
+        if a shortened version of a long option is specified it will
+        be suppressed in the help. addoption('--twowords', '--two-words')
+        results in help showing '--two-words' only, but --twowords gets
+        accepted **and** the automatic destination is in args.twowords
+        """
+        conflict = set(optnames).intersection(
+            name for opt in self.options for name in opt.names())
+        if conflict:
+            raise ValueError("option names %s already added" % conflict)
+        option = Argument(*optnames, **attrs)
+        self._addoption_instance(option, shortupper=False)
+
+    def _addoption(self, *optnames, **attrs):
+        option = Argument(*optnames, **attrs)
+        self._addoption_instance(option, shortupper=True)
+
+    def _addoption_instance(self, option, shortupper=False):
+        if not shortupper:
+            for opt in option._short_opts:
+                if opt[0] == '-' and opt[1].islower():
+                    raise ValueError("lowercase shortoptions reserved")
+        if self.parser:
+            self.parser.processoption(option)
+        self.options.append(option)
+
+
+class ArgumentError(Exception):
+    """
+    Raised if an Argument instance is created with invalid or
+    inconsistent arguments.
+    """
+
+    def __init__(self, msg, option):
+        self.msg = msg
+        self.option_id = str(option)
+
+    def __str__(self):
+        if self.option_id:
+            return "option %s: %s" % (self.option_id, self.msg)
+        else:
+            return self.msg
+
+
+class Argument(object):
+    """class that mimics the necessary behaviour of optparse.Option
+
+    it's currently a least effort implementation
+    and ignoring choices and integer prefixes
+    """
+
+    def __init__(self, *names, **attrs):
+        """store parms in private vars for use in add_argument"""
+        self._attrs = attrs
+        self._short_opts = []
+        self._long_opts = []
+        self.dest = attrs.get('dest')
+        try:
+            self.default = attrs['default']
+        except KeyError:
+            pass
+        self._set_opt_strings(names)
+        if not self.dest:
+            if self._long_opts:
+                self.dest = self._long_opts[0][2:].replace('-', '_')
+            else:
+                try:
+                    self.dest = self._short_opts[0][1:]
+                except IndexError:
+                    raise ArgumentError(
+                        'need a long or short option', self)
+
+    def names(self):
+        return self._short_opts + self._long_opts
+
+    def attrs(self):
+        # update any attributes set by processopt
+        attrs = 'default dest help'.split()
+        if self.dest:
+            attrs.append(self.dest)
+        for attr in attrs:
+            try:
+                self._attrs[attr] = getattr(self, attr)
+            except AttributeError:
+                pass
+        if self._attrs.get('help'):
+            a = self._attrs['help']
+            a = a.replace('%default', '%(default)s')
+            self._attrs['help'] = a
+        return self._attrs
+
+    def _set_opt_strings(self, opts):
+        """directly from optparse
+
+        might not be necessary as this is passed to argparse later on"""
+        for opt in opts:
+            if len(opt) < 2:
+                raise ArgumentError(
+                    "invalid option string %r: "
+                    "must be at least two characters long" % opt, self)
+            elif len(opt) == 2:
+                if not (opt[0] == "-" and opt[1] != "-"):
+                    raise ArgumentError(
+                        "invalid short option string %r: "
+                        "must be of the form -x, (x any non-dash char)" % opt,
+                        self)
+                self._short_opts.append(opt)
+            else:
+                if not (opt[0:2] == "--" and opt[2] != "-"):
+                    raise ArgumentError(
+                        "invalid long option string %r: "
+                        "must start with --, followed by non-dash" % opt,
+                        self)
+                self._long_opts.append(opt)
+
+    def __repr__(self):
+        args = []
+        if self._short_opts:
+            args += ['_short_opts: ' + repr(self._short_opts)]
+        if self._long_opts:
+            args += ['_long_opts: ' + repr(self._long_opts)]
+        args += ['dest: ' + repr(self.dest)]
+        if hasattr(self, 'type'):
+            args += ['type: ' + repr(self.type)]
+        if hasattr(self, 'default'):
+            args += ['default: ' + repr(self.default)]
+        return 'Argument({})'.format(', '.join(args))
+
 class CmdOptions(object):
     """ holds cmdline options as attributes."""
 
@@ -241,7 +665,7 @@ class Config(object):
         #: (deprecated), use :py:func:`getoption() <_pytest.config.Config.getoption>` instead
         self.option = CmdOptions()
         self._parser = Parser(
-            usage="%%(prog)s sub-command [options] source-file",
+            usage="%(prog)s sub-command [options] source-file",
             processopt=self._processopt,
         )
         #: a pluginmanager instance
@@ -263,6 +687,55 @@ class Config(object):
         self.hook.pydistill_namespace.call_historic(do_setns, {})
         self.hook.pydistill_addoption.call_historic(kwargs=dict(parser=self._parser))
 
+    def warn(self, code, message, fslocation=None, nodeid=None):
+        """ generate a warning for this config, see
+        :func:`pydistill_logwarning
+        <_pydistill.exthookspec.pydistill_logwarning>`. """
+        self.hook.pydistill_logwarning.call_historic(kwargs=dict(
+            code=code, message=message, fslocation=fslocation,
+            nodeid=nodeid))
+
+    def pydistill_logwarning(self, code, message, fslocation, nodeid):
+        tw = py.io.TerminalWriter(sys.stderr)
+        location = " %s" % (fslocation,) if fslocation else ""
+        tw.line("WARNING %s%s: %s" % (code, location, message), yellow=True)
+
+    def pydistill_addoption(self, parser):
+        group = parser.getgroup("general")
+        group._addoption(
+            '-h', '--help', action="store_true", dest="help", default=False,
+            help="show help message and configuration info.")
+        group._addoption(
+            '-p', action="append", dest="plugins", default=[],
+            metavar="name",
+            help="early-load given plugin (multi-allowed). To avoid loading "
+                 "of plugins, use the `no:` prefix, e.g. `no:csv`.")
+        group._addoption(
+            '-c', metavar="file", type=str, dest="inifilename",
+            help="load configuration from `file` instead of trying to "
+                 "locate one of the implicit configuration files.")
+        group._addoption(
+            '-o', '--override-ini', nargs='*', dest="override_ini",
+            action="append",
+            help="override ini option with \"option=value\" style, e.g. "
+                 "`-o cache_dir=cache`.")
+        group.addoption(
+            '--confcutdir', dest="confcutdir", default=None, metavar="dir",
+            help="only load confdistill.py's relative to specified dir.")
+        group.addoption(
+            '--noconfdistill', action="store_true", dest="noconfdistill",
+            default=False, help="don't load any confdistill.py files.")
+
+    @exthookimpl(tryfirst=True)
+    def pydistill_cmdline_main(self, config):
+        if config.option.help:
+            config._parser.optparser.print_help()
+            return 0
+
+    def pydistill_load_initial_conftests(self, early_config):
+        self.pluginmanager._set_initial_confdistills(
+            early_config.known_args_namespace)
+
     def _processopt(self, opt):
         for name in opt._short_opts + opt._long_opts:
             self._opt2dest[name] = opt.dest
@@ -279,9 +752,15 @@ class Config(object):
         self._parser.extra_info['inifile'] = self.inifile
         self.invocation_dir = py.path.local()
         self._parser.addini('addopts', 'extra command line options', 'args')
-        self._parser.addini('minversion', 'minimally required pytest version')
         self._override_ini = ns.override_ini or ()
 
+    def _do_configure(self):
+        """ call the configure hooks; :meth:`_ensure_unconfigure` calls the
+        unconfigure hooks once the sub-command ran. """
+        assert not self._configured
+        self._configured = True
+        self.hook.pydistill_configure.call_historic(kwargs=dict(config=self))
+
     def _ensure_unconfigure(self):
         if self._configured:
             self._configured = False
@@ -297,16 +776,21 @@ class Config(object):
         return self
 
     def _preparse(self, subcmd, args, addopts=True):
+        import shlex
         if addopts:
             args[:] = shlex.split(os.environ.get('PYDISTILL_ADDOPTS', '')) + args
         self._initini(subcmd, args)
         if addopts:
             args[:] = self.getini("addopts") + args
-        self._checkversion()
-        self._consider_importhook(subcmd, args)
-        self.pluginmanager.consider_preparse(subcmd, args)
-        self.pluginmanager.load_setuptools_entrypoints('pydistill11')
+        self.pluginmanager.consider_preparse(args)
+        # the cache of the entry point index honours --cache-clear, so the
+        # known arguments are parsed before it is created
+        self.known_args_namespace = self._parser.parse_known_args(subcmd, args, namespace=self.option.copy())
+        from _pydistill.cacheprovider import getcache
+        self.pluginmanager.load_setuptools_entrypoints(
+            'pydistill11', subcmd, getcache(self))
         self.pluginmanager.consider_env()
+        # again, for the options of the plugins loaded above
         self.known_args_namespace = ns = self._parser.parse_known_args(subcmd, args, namespace=self.option.copy())
         if self.known_args_namespace.confcutdir is None and self.inifile:
             confcutdir = py.path.local(self.inifile).dirname
@@ -316,13 +800,87 @@ class Config(object):
                                                     subcmd=subcmd, args=args, parser=self._parser)
         except ConfextractImportFailure:
             e = sys.exc_info()[1]
-            if ns.help or ns.version:
-                # we don't want to prevent --help/--version to work
+            if ns.help:
+                # we don't want to prevent --help to work
                 # so just let is pass and print a warning at the end
                 self._warn("could not load initial conftests (%s)\n" % e.path)
             else:
                 raise
 
+    def getoption(self, name, default=notset):
+        """ return command line option value.
+
+        :arg name: name of the option.  You may also specify
+            the literal ``--OPT`` option instead of the "dest" option name.
+        :arg default: default value if no option of that name exists.
+        """
+        name = self._opt2dest.get(name, name)
+        try:
+            return getattr(self.option, name)
+        except AttributeError:
+            if default is not notset:
+                return default
+            raise ValueError("no option named %r" % (name,))
+
+    def getini(self, name):
+        """ return configuration value from an :ref:`ini file <inifiles>`. If the
+        specified name hasn't been registered through a prior
+        :py:func:`parser.addini <_pydistill.config.Parser.addini>`
+        call (usually from a plugin), a ValueError is raised. """
+        try:
+            return self._inicache[name]
+        except KeyError:
+            self._inicache[name] = val = self._getini(name)
+            return val
+
+    def _getini(self, name):
+        try:
+            description, type, default = self._parser._inidict[name]
+        except KeyError:
+            raise ValueError("unknown configuration value: %r" % (name,))
+        value = self._get_override_ini_value(name)
+        if value is None:
+            try:
+                value = self.inicfg[name]
+            except KeyError:
+                if default is not None:
+                    return default
+                if type is None:
+                    return ''
+                return []
+        import shlex
+        if type == "pathlist":
+            dp = py.path.local(self.inicfg.config.path).dirpath()
+            values = []
+            for relpath in shlex.split(value):
+                values.append(dp.join(relpath, abs=True))
+            return values
+        elif type == "args":
+            return shlex.split(value)
+        elif type == "linelist":
+            return [t for t in map(lambda x: x.strip(), value.split("\n")) if t]
+        elif type == "bool":
+            return bool(_strtobool(value.strip()))
+        else:
+            assert type is None
+            return value
+
+    def _get_override_ini_value(self, name):
+        value = None
+        # override_ini is a list of list, to support both -o foo1=bar1 foo2=bar2 and
+        # and -o foo1=bar1 -o foo2=bar2 options
+        # always use the last item if multiple value set for same ini-name,
+        # e.g. -o foo=bar1 -o foo=bar2 will set foo to bar2
+        for ini_config_list in self._override_ini:
+            for ini_config in ini_config_list:
+                try:
+                    (key, user_ini_value) = ini_config.split("=", 1)
+                except ValueError:
+                    raise UsageError("-o/--override-ini expects option=value style.")
+                if key == name:
+                    value = user_ini_value
+        return value
+
     def parse(self, subcmd, args, addopts=True):
         # parse given cmdline arguments into this config object.
         assert not hasattr(self, 'subcmd'), (
@@ -331,19 +889,156 @@ class Config(object):
         self.hook.pydistill_addhooks.call_historic(
             kwargs=dict(pluginmanager=self.pluginmanager))
         self._preparse(subcmd, args, addopts=addopts)
-        # XXX deprecated hook:
-        self.hook.pydistill_cmdline_preparse(config=self, subcmd=subcmd, args=args)
         self._parser.after_preparse = True
+        subcmd, args = self._parser.parse_setoption(subcmd, args, self.option, namespace=self.option)
+        if not args:
+            args = [os.getcwd()]
+        self.subcmd = subcmd
+        self.args = args
+
+
+def setns(obj, dic):
+    """ set the names of ``dic`` on the module ``obj``, see
+    :func:`pydistill_namespace <_pydistill.exthookspec.pydistill_namespace>`.
+    """
+    for name, value in dic.items():
+        setattr(obj, name, value)
+        if name not in obj.__all__:
+            obj.__all__.append(name)
+
+
+def exists(path, ignore=EnvironmentError):
+    try:
+        return path.check()
+    except ignore:
+        return False
+
+
+def getcfg(args, warnfunc=None):
+    """ search the list of arguments for a valid ini-file for pydistill,
+    and return a tuple of (rootdir, inifile, cfg-dict).
+
+    note: warnfunc is an optional function used to warn
+        about ini-files that use deprecated features.
+        This parameter should be removed when pydistill
+        adopts standard deprecation warnings (#1804).
+    """
+    inibasenames = ["pydistill.ini", "tox.ini", "setup.cfg"]
+    args = [x for x in args if not str(x).startswith("-")]
+    if not args:
+        args = [py.path.local()]
+    for arg in args:
+        arg = py.path.local(arg)
+        for base in arg.parts(reverse=True):
+            for inibasename in inibasenames:
+                p = base.join(inibasename)
+                if exists(p):
+                    iniconfig = py.iniconfig.IniConfig(p)
+                    if 'pydistill' in iniconfig.sections:
+                        if inibasename == 'setup.cfg' and warnfunc:
+                            warnfunc('C1', '[pydistill] section in setup.cfg '
+                                           'files is deprecated, use '
+                                           '[tool:pydistill] instead.')
+                        return base, p, iniconfig['pydistill']
+                    if inibasename == 'setup.cfg' and \
+                            'tool:pydistill' in iniconfig.sections:
+                        return base, p, iniconfig['tool:pydistill']
+                    elif inibasename == "pydistill.ini":
+                        # allowed to be empty
+                        return base, p, {}
+    return None, None, None
+
+
+def get_common_ancestor(paths):
+    common_ancestor = None
+    for path in paths:
+        if not path.exists():
+            continue
+        if common_ancestor is None:
+            common_ancestor = path
+        else:
+            if path.relto(common_ancestor) or path == common_ancestor:
+                continue
+            elif common_ancestor.relto(path):
+                common_ancestor = path
+            else:
+                shared = path.common(common_ancestor)
+                if shared is not None:
+                    common_ancestor = shared
+    if common_ancestor is None:
+        common_ancestor = py.path.local()
+    elif common_ancestor.isfile():
+        common_ancestor = common_ancestor.dirpath()
+    return common_ancestor
+
+
+def get_dirs_from_args(args):
+    def is_option(x):
+        return str(x).startswith('-')
+
+    def get_file_part_from_node_id(x):
+        return str(x).split('::')[0]
+
+    def get_dir_from_path(path):
+        if path.isdir():
+            return path
+        return py.path.local(path.dirname)
+
+    # These look like paths but may not exist
+    possible_paths = (
+        py.path.local(get_file_part_from_node_id(arg))
+        for arg in args
+        if not is_option(arg)
+    )
+
+    return [
+        get_dir_from_path(path)
+        for path in possible_paths
+        if path.exists()
+    ]
+
+
+def determine_setup(inifile, args, warnfunc=None):
+    """ return the rootdir, the ini-file and its ``[pydistill]`` section
+    for the inputs ``args``, or for the ini-file given with ``-c``. """
+    dirs = get_dirs_from_args(args)
+    if inifile:
+        iniconfig = py.iniconfig.IniConfig(inifile)
         try:
-            subcmd, args = self._parser.parse_setoption(subcmd, args, self.option, namespace=self.option)
-            if not args:
-                cwd = os.getcwd()
-                if cwd == self.rootdir:
-                    args = self.getini('testpaths')
-                if not args:
-                    args = [cwd]
-            self.subcmd = subcmd
-            self.args = args
-        except PrintHelp:
-            pass
+            inicfg = iniconfig["pydistill"]
+        except KeyError:
+            inicfg = None
+        rootdir = get_common_ancestor(dirs)
+    else:
+        ancestor = get_common_ancestor(dirs)
+        rootdir, inifile, inicfg = getcfg([ancestor], warnfunc=warnfunc)
+        if rootdir is None:
+            for rootdir in ancestor.parts(reverse=True):
+                if rootdir.join("setup.py").exists():
+                    break
+            else:
+                rootdir, inifile, inicfg = getcfg(dirs, warnfunc=warnfunc)
+                if rootdir is None:
+                    rootdir = get_common_ancestor([py.path.local(), ancestor])
+                    is_fs_root = os.path.splitdrive(str(rootdir))[1] == '/'
+                    if is_fs_root:
+                        rootdir = ancestor
+    return rootdir, inifile, inicfg or {}
 
+
+def _strtobool(val):
+    """Convert a string representation of truth to true (1) or false (0).
+
+    True values are 'y', 'yes', 't', 'true', 'on', and '1'; false values
+    are 'n', 'no', 'f', 'false', 'off', and '0'.  Raises ValueError if
+    'val' is anything else.
+
+    .. note:: copied from distutils.util
+    """
+    val = val.lower()
+    if val in ('y', 'yes', 't', 'true', 'on', '1'):
+        return 1
+    elif val in ('n', 'no', 'f', 'false', 'off', '0'):
+        return 0
+    else:
+        raise ValueError("invalid truth value %r" % (val,))
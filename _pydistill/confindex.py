@@ -0,0 +1,43 @@
+"""
+index of the ``confdistill.py`` files applying to directories.
+
+Looking for ``confdistill.py`` means probing every parent directory of every
+input for a file which usually does not exist.  Inputs of one run mostly
+share their parent directories, so the index remembers per directory
+whether it holds a ``confdistill.py`` and every directory is probed once
+per run, however many inputs lie below it.
+
+The index is not kept across runs: checking that a remembered directory
+did not change costs a ``stat`` per directory, as much as probing it again.
+"""
+from __future__ import absolute_import, division, print_function
+import os
+
+CONFDISTILL = "confdistill.py"
+
+
+class ConfdistillIndex(object):
+    """ directory -> has ``confdistill.py``, for the duration of one run. """
+
+    def __init__(self):
+        self._entries = {}
+
+    def has_confdistill(self, dirpath):
+        dirpath = str(dirpath)
+        try:
+            return self._entries[dirpath]
+        except KeyError:
+            found = os.path.isfile(os.path.join(dirpath, CONFDISTILL))
+            self._entries[dirpath] = found
+            return found
+
+    def confdistill_paths(self, directory, confcutdir=None):
+        """ return the ``confdistill.py`` paths applying to ``directory``,
+        outermost first, ignoring directories above ``confcutdir``. """
+        paths = []
+        for parent in directory.parts():
+            if confcutdir and confcutdir.relto(parent):
+                continue
+            if self.has_confdistill(parent):
+                paths.append(parent.join(CONFDISTILL))
+        return paths
@@ -0,0 +1,950 @@
+""" ``csv`` sub-command: distill delimited text files. """
+from __future__ import absolute_import, division, print_function
+import contextlib
+import csv as pycsv
+import functools
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+import py
+
+from _pydistill import __version__, compress, parallel, stream
+from _pydistill.cacheprovider import ResultCache, file_digest, getcache
+from _pydistill.config import UsageError, exthookimpl
+from _pydistill.incremental import IncrementalState
+from _pydistill.sketch import SUMMARY_HEADER, TableSketch
+from _pydistill.tokenizer import CsvError
+
+
+def pydistill_addoption(parser):
+    group = parser.getgroup("csv", "csv distillation")
+    group.addoption('--chunk-size', action="store", dest="chunk_size",
+                    default=str(stream.DEFAULT_CHUNK_ROWS), metavar="SIZE",
+                    help="upper bound of a processing chunk, either a number "
+                         "of rows (e.g. 10000) or a byte budget (e.g. 64MB). "
+                         "(default: %default)")
+    group.addoption('--output', action="store", dest="output", default=None,
+                    metavar="PATH",
+                    help="write the distilled csv to PATH instead of stdout. "
+                         "A PATH ending in .pdc is written as binary column "
+                         "file (requires numpy).")
+    group.addoption('--row-group-size', action="store", dest="row_group_size",
+                    default="65536", metavar="NUM",
+                    help="rows per row group of .pdc output. "
+                         "(default: %default)")
+    group.addoption('--delimiter', action="store", dest="delimiter",
+                    default=",", help="field delimiter, 'auto' detects the "
+                                      "delimiter of every input and writes "
+                                      "','. (default: %default)")
+    group.addoption('--encoding', action="store", dest="encoding",
+                    default="utf-8", help="text encoding of inputs and "
+                                          "output. (default: %default)")
+    group.addoption('--columnar', action="store_true", dest="columnar",
+                    default=False,
+                    help="hold chunks as typed NumPy columns and pass them "
+                         "to pydistill_csv_table hooks (requires numpy).")
+    group.addoption('--mmap', action="store_true", dest="mmap",
+                    default=False,
+                    help="memory map inputs and only decode the fields "
+                         "which are actually used.")
+    group.addoption('--columns', action="store", dest="columns",
+                    default=None, metavar="NAMES",
+                    help="comma separated names of the columns to distill, "
+                         "in this order; the other columns are never "
+                         "decoded.")
+    group.addoption('--grep', action="store", dest="grep", default=None,
+                    metavar="PATTERN",
+                    help="only distill records whose raw text, as written "
+                         "in the input without the newline, matches the "
+                         "regular expression PATTERN; ^ and $ match at line "
+                         "boundaries. Other records are dropped before "
+                         "they are split into fields where possible.")
+    group.addoption('--grep-fixed', action="store_true", dest="grep_fixed",
+                    default=False,
+                    help="match the --grep PATTERN as a literal string.")
+    group.addoption('--build-index', action="store_true",
+                    dest="build_index", default=False,
+                    help="write a sidecar row offset index (.pdx) next to "
+                         "every input instead of distilling it; indexed "
+                         "inputs are counted and split across workers "
+                         "without rescanning them.")
+    group.addoption('--index-key', action="store", dest="index_key",
+                    default=None, metavar="NAME",
+                    help="keep the minimum and maximum of column NAME per "
+                         "indexed block with --build-index.")
+    group.addoption('--rows', action="store", dest="rows", default=None,
+                    metavar="START:STOP",
+                    help="only distill the records START (counting from 0) "
+                         "up to STOP of every input, seeking with the "
+                         "index if there is one.")
+    group.addoption('--count', action="store_true", dest="count",
+                    default=False,
+                    help="write the number of records of every input "
+                         "instead of distilling them.")
+    group.addoption('--incremental', action="store_true", dest="incremental",
+                    default=False,
+                    help="only distill records appended to the inputs since "
+                         "the last --incremental run.")
+    group.addoption('--pipeline', action="store_true", dest="pipeline",
+                    default=False,
+                    help="distill through the reader and writer hooks, "
+                         "with reading and writing overlapping the "
+                         "transforms, without the result cache (requires "
+                         "python 3.5).")
+    group.addoption('--queue-size', action="store", dest="queue_size",
+                    default="8", metavar="NUM",
+                    help="chunks buffered between the --pipeline stages. "
+                         "(default: %default)")
+    group.addoption('--sketch', action="store_true", dest="sketch",
+                    default=False,
+                    help="write approximate summaries of every column "
+                         "(distinct count, quantiles, most frequent values) "
+                         "computed in one pass instead of the rows.")
+    group.addoption('--sketch-top', action="store", dest="sketch_top",
+                    default="10", metavar="NUM",
+                    help="most frequent values listed per column by "
+                         "--sketch. (default: %default)")
+    group.addoption('--decompress-threads', action="store",
+                    dest="decompress_threads", default="auto", metavar="NUM",
+                    help="threads decompressing each gzip, bzip2 or xz "
+                         "input made of several members, 'auto' shares "
+                         "the cpus among the --workers. (default: %default)")
+    group._addoption('-n', '--workers', action="store", dest="workers",
+                     default="1", metavar="NUM",
+                     help="distill input files in NUM worker processes, "
+                          "'auto' uses one per cpu. Output keeps the order "
+                          "of the inputs. (default: %default)")
+
+
+def pydistill_cmdline_main(config):
+    try:
+        workers = parallel.parse_workers(config.getoption("workers"))
+        parallel.parse_workers(config.getoption("decompress_threads"))
+        stream.ChunkSize.parse(config.getoption("chunk_size"))
+    except ValueError as e:
+        raise UsageError(str(e))
+    if config.getoption("pipeline"):
+        if sys.version_info < (3, 5):
+            raise UsageError("--pipeline requires python 3.5 or later")
+        for name in ("count", "incremental", "columnar", "sketch",
+                     "build_index"):
+            if config.getoption(name):
+                raise UsageError("--pipeline cannot be combined with --%s" %
+                                 name.replace("_", "-"))
+        if workers > 1:
+            raise UsageError("--pipeline distills in a single process, "
+                             "it cannot be combined with --workers")
+        if not config.getoption("queue_size").isdigit() or \
+                int(config.getoption("queue_size")) <= 0:
+            raise UsageError("invalid --queue-size: %r" % (
+                config.getoption("queue_size"),))
+    if config.getoption("columnar"):
+        try:
+            import _pydistill.table  # noqa: F401
+        except ImportError:
+            raise UsageError("--columnar requires numpy to be installed")
+    if config.getoption("grep") is not None:
+        try:
+            re.compile(config.getoption("grep"))
+        except re.error as e:
+            raise UsageError("invalid --grep pattern: %s" % (e,))
+    paths = collect_inputs(config.args)
+    if not paths:
+        raise UsageError("no csv input found in: %s" % " ".join(
+            str(x) for x in config.args))
+    if config.getoption("incremental") and any(
+            path.check(file=1) and compress.detect(path) for path in paths):
+        raise UsageError("--incremental cannot resume compressed inputs")
+    if config.getoption("build_index") or \
+            config.getoption("rows") is not None:
+        try:
+            _row_range(config)
+        except ValueError as e:
+            raise UsageError(str(e))
+        if any(_is_colfile(path) or
+               path.check(file=1) and compress.detect(path)
+               for path in paths):
+            raise UsageError("--build-index and --rows need uncompressed "
+                             "csv inputs")
+        if config.getoption("rows") is not None and (
+                config.getoption("grep") is not None or
+                config.getoption("incremental")):
+            raise UsageError("--rows cannot be combined with --grep or "
+                             "--incremental")
+    if config.getoption("build_index"):
+        return _build_indexes(config, paths, workers)
+    output = config.getoption("output")
+    binary = _is_colfile(output)
+    if config.getoption("count") and binary:
+        raise UsageError("--count cannot write .pdc output")
+    if config.getoption("sketch"):
+        if config.getoption("incremental") or binary:
+            raise UsageError("--sketch cannot be combined with --incremental "
+                             "or .pdc output")
+        if not config.getoption("sketch_top").isdigit() or \
+                int(config.getoption("sketch_top")) <= 0:
+            raise UsageError("invalid --sketch-top: %r" % (
+                config.getoption("sketch_top"),))
+    if binary or any(_is_colfile(path) for path in paths):
+        if config.getoption("grep") is not None and any(
+                _is_colfile(path) for path in paths):
+            raise UsageError("--grep only works with csv inputs")
+        if config.getoption("incremental"):
+            raise UsageError("--incremental only works with csv files")
+        if not config.getoption("row_group_size").isdigit() or \
+                int(config.getoption("row_group_size")) <= 0:
+            raise UsageError("invalid --row-group-size: %r" % (
+                config.getoption("row_group_size"),))
+        try:
+            import _pydistill.colfile  # noqa: F401
+        except ImportError:
+            raise UsageError(".pdc files require numpy to be installed")
+    if binary:
+        out = open(output, 'wb')
+    elif output:
+        out = stream.open_text(output, 'w',
+                               encoding=config.getoption("encoding"))
+    else:
+        out = sys.stdout
+    try:
+        results = _result_cache(config)
+        if config.getoption("pipeline"):
+            stats = _distill_pipeline(config, paths, out)
+        else:
+            writer = _open_writer(config, out)
+            if config.getoption("count"):
+                stats = _count(config, paths, out)
+            elif config.getoption("incremental"):
+                stats = _distill_incremental(config, paths, writer)
+            elif config.getoption("sketch"):
+                stats = _distill_sketch(config, paths, writer, workers)
+            elif not binary and (
+                    any(_cacheable(results, path) for path in paths) or
+                    workers > 1 and (len(paths) > 1 or
+                                     _load_index(config, paths[0]))):
+                # spool files are concatenated as text
+                stats = _distill_spooled(config, paths, writer, workers,
+                                         results)
+            else:
+                stats = _distill_serial(config, paths, writer)
+            writer.flush()
+            if hasattr(writer, "finish"):
+                writer.finish()
+    finally:
+        if output:
+            out.close()
+    tw = py.io.TerminalWriter(sys.stderr)
+    tw.line("distilled %d of %d rows from %d file(s)" % (
+        stats['rows_out'], stats['rows_in'], len(paths)))
+    return 0
+
+
+#: names of the csv files found in directories
+_INPUT_SUFFIXES = (".csv", ".csv.gz", ".csv.bz2", ".csv.xz")
+
+
+def _is_input(path):
+    return path.basename.endswith(_INPUT_SUFFIXES) and path.check(file=1)
+
+
+def collect_inputs(args):
+    """ expand ``file_or_dir`` arguments into a sorted list of csv files,
+    compressed ones included. """
+    paths = []
+    for arg in args:
+        path = py.path.local(arg)
+        if path.check(dir=1):
+            paths.extend(sorted(path.visit(fil=_is_input, rec=True)))
+        else:
+            paths.append(path)
+    return paths
+
+
+def distill_file(config, path, writer, expected_header=None, span=None):
+    """ stream one csv file through the configured transforms into ``writer``.
+
+    Returns the header of the written rows (plugins may change it) and the
+    :class:`Stream <_pydistill.stream.Stream>` statistics.  With
+    ``--columnar`` the column types inferred for ``path`` are remembered
+    until it changes.  ``span`` restricts the records read to a ``(start,
+    end)`` byte range, see :meth:`RowIndex.split
+    <_pydistill.rowindex.RowIndex.split>`.
+    """
+    schema = None
+    if config.getoption("columnar"):
+        from _pydistill.table import Schema
+        info = _input_info(config, path)
+        schema = Schema.from_json(info.get("schema"))
+    with _open_reader(config, path, span) as reader, _input_errors(path):
+        if expected_header is not None and reader.header != expected_header:
+            raise UsageError("%s: header does not match the first input" % (
+                path,))
+        result = distill_reader(config, reader, writer, schema=schema)
+    if schema is not None:
+        info.set("schema", schema.to_json())
+    return result
+
+
+def distill_reader(config, reader, writer, before=(), after=(), schema=None):
+    """ like :func:`distill_file` for an open reader; ``before`` and
+    ``after`` are extra transforms run around the configured ones: the
+    ``pydistill_transform_batch`` and ``pydistill_transform`` hooks, then
+    the columnar conversion.  With
+    ``--columnar`` chunks are converted with ``schema``, a :class:`Schema
+    <_pydistill.table.Schema>` inferred from the first chunk if not given.
+    """
+    transforms = list(before) + _hook_transforms(config)
+    header = reader.header
+    if config.getoption("columnar"):
+        from _pydistill.table import ColumnTable, Schema
+        columnar = _ColumnarTransform(config, ColumnTable, header, writer,
+                                      schema if schema is not None
+                                      else Schema())
+        transforms.append(columnar)
+    else:
+        columnar = None
+        writer.writeheader(header)
+    transforms.extend(after)
+    stats = stream.Stream(reader, writer, transforms).run()
+    if columnar is not None and columnar.out_header is not None:
+        header = columnar.out_header
+    return header, stats
+
+
+def _hook_transforms(config):
+    """ the chunk transforms running the ``pydistill_transform_batch`` and
+    ``pydistill_transform`` implementations, each batch transform on the
+    batch size of its plugin; run by every engine. """
+    transforms = getattr(config, "_csv_transforms", None)
+    if transforms is None:
+        pm = config.pluginmanager
+        chain = stream.hook_chain(pm, "pydistill_transform_batch", "chunk",
+                                  config=config)
+        records = stream.hook_chain(pm, "pydistill_transform", "record",
+                                    config=config)
+        if records:
+            chain.append(stream.per_record(records))
+        try:
+            sizes = stream.batch_sizes(pm, "pydistill_batch_size",
+                                       config=config)
+        except ValueError as e:
+            raise UsageError(str(e))
+        transforms = stream.rebatched(chain, sizes)
+        config._csv_transforms = transforms
+    return transforms
+
+
+@contextlib.contextmanager
+def _input_errors(path):
+    """ report malformed csv data found while reading ``path`` as a
+    :class:`UsageError` naming it. """
+    try:
+        yield
+    except (CsvError, pycsv.Error) as e:
+        raise UsageError("%s: %s" % (path, e))
+
+
+def _is_colfile(path):
+    # without importing numpy, see _pydistill.colfile.SUFFIX
+    return path is not None and str(path).endswith(".pdc")
+
+
+def _open_reader(config, path, span=None):
+    chunksize = config.getoption("chunk_size")
+    encoding = config.getoption("encoding")
+    selection = _selection(config)
+    rows = _row_range(config)
+    try:
+        if _is_colfile(path):
+            from _pydistill.colfile import ColumnFile
+            return ColumnFile(path, selection["columns"])
+        # compressed inputs cannot be mapped; selections are pushed down
+        # into the tokenizer
+        if (config.getoption("mmap") or selection["columns"] is not None or
+                selection["pattern"] is not None or span is not None or
+                rows is not None) and not compress.detect(path):
+            from _pydistill.tokenizer import MmapCsvReader
+            try:
+                reader = MmapCsvReader(path, chunksize, encoding=encoding,
+                                       **dict(selection,
+                                              **_fmtparams(config, path)))
+            except CsvError:
+                # line ends only csv.reader understands, the byte ranges
+                # of span and rows need the tokenizer
+                if span is not None or rows is not None:
+                    raise
+            else:
+                if span is not None:
+                    reader.select(*span)
+                if rows is not None:
+                    _seek_rows(config, path, reader, rows)
+                return reader
+        threads = _decompress_threads(config)
+        return stream.CsvReader(
+            stream.open_text(path, encoding=encoding, threads=threads),
+            chunksize, **dict(selection, **_fmtparams(config, path)))
+    except ValueError as e:
+        raise UsageError("%s: %s" % (path, e))
+
+
+def _decompress_threads(config):
+    """ threads decompressing one input; with ``auto`` every worker gets
+    its share of the cpus, so workers do not oversubscribe them. """
+    spec = config.getoption("decompress_threads")
+    if str(spec).lower() != "auto":
+        return parallel.parse_workers(spec)
+    workers = parallel.parse_workers(config.getoption("workers"))
+    return max(1, parallel.parse_workers("auto") // workers)
+
+
+def _row_range(config):
+    """ the ``(start, stop)`` of ``--rows``, ``stop`` may be ``None``. """
+    spec = config.getoption("rows")
+    if spec is None:
+        return None
+    start, sep, stop = spec.partition(":")
+    try:
+        start = int(start or 0)
+        stop = int(stop) if stop else None
+    except ValueError:
+        start = -1
+    if not sep or start < 0 or stop is not None and stop < start:
+        raise ValueError("invalid --rows: %r" % (spec,))
+    return start, stop
+
+
+def _seek_rows(config, path, reader, rows):
+    start, stop = rows
+    index = _load_index(config, path)
+    if index is not None:
+        offset, skip = index.seek(start)
+    else:
+        offset, skip = reader.data_start, start
+    reader.select(offset, None, skip,
+                  None if stop is None else stop - start)
+
+
+def _load_index(config, path):
+    """ the fresh :class:`RowIndex <_pydistill.rowindex.RowIndex>` of
+    ``path`` or ``None``. """
+    if _is_colfile(path) or not os.path.exists(str(path)):
+        return None
+    from _pydistill.rowindex import RowIndex
+    return RowIndex.load(path, encoding=config.getoption("encoding"),
+                         **_fmtparams(config, path))
+
+
+def _build_indexes(config, paths, workers):
+    """ write the index of every path, in worker processes if ``workers``
+    > 1. """
+    total = 0
+    with parallel.shared(config) as token:
+        for rows in parallel.imap_ordered(
+                functools.partial(_index_in_worker, token),
+                [str(path) for path in paths], workers):
+            total += rows
+    tw = py.io.TerminalWriter(sys.stderr)
+    tw.line("indexed %d rows of %d file(s)" % (total, len(paths)))
+    return 0
+
+
+def _count(config, paths, out):
+    """ write the number of records of every path to ``out``; indexed
+    inputs are not read. """
+    writer = stream.CsvWriter(out, **_fmtparams(config))
+    writer.writeheader(["path", "rows"])
+    total = 0
+    for path in paths:
+        index = _load_index(config, path)
+        if index is not None and config.getoption("grep") is None and \
+                config.getoption("rows") is None:
+            rows = index.num_rows
+        else:
+            with _open_reader(config, path) as reader, _input_errors(path):
+                rows = sum(len(chunk) for chunk in reader)
+        writer.write([[str(path), rows]])
+        total += rows
+    return dict(rows_in=total, rows_out=total)
+
+
+def _spans(config, path, workers):
+    """ the byte ranges ``path`` is split into for ``workers`` workers,
+    ``[None]`` if it is distilled as a whole. """
+    if workers > 1 and config.getoption("rows") is None:
+        index = _load_index(config, path)
+        if index is not None and len(index.starts) > 1:
+            return index.split(workers)
+    return [None]
+
+
+def _open_writer(config, out):
+    if config.getoption("sketch"):
+        return _SketchWriter(out, config)
+    if _is_colfile(config.getoption("output")):
+        from _pydistill.colfile import ColumnFileWriter
+        return ColumnFileWriter(out, int(config.getoption("row_group_size")))
+    return stream.CsvWriter(out, **_fmtparams(config))
+
+
+def _fmtparams(config, path=None):
+    """ csv format parameters of the input ``path``, or of the output. """
+    delimiter = config.getoption("delimiter")
+    if delimiter == "auto":
+        delimiter = _sniff_delimiter(config, path) if path is not None else ","
+    return dict(delimiter=delimiter)
+
+
+def _selection(config):
+    """ the columns and the prefilter of records selected by ``--columns``
+    and ``--grep``. """
+    columns = config.getoption("columns")
+    if columns is not None:
+        columns = [name.strip() for name in columns.split(",")]
+    return dict(columns=columns, pattern=config.getoption("grep"),
+                fixed=config.getoption("grep_fixed"))
+
+
+#: bytes of an input looked at to detect its delimiter
+SNIFF_SIZE = 64 * 1024
+
+_SNIFF_DELIMITERS = ",;\t|"
+
+
+def _sniff_delimiter(config, path):
+    info = _input_info(config, path)
+    dialect = info.get("dialect")
+    if dialect is None:
+        with stream.open_text(path,
+                              encoding=config.getoption("encoding")) as f:
+            sample = f.read(SNIFF_SIZE)
+        if len(sample) == SNIFF_SIZE and "\n" in sample:
+            # only whole lines
+            sample = sample[:sample.rindex("\n") + 1]
+        try:
+            delimiter = pycsv.Sniffer().sniff(sample,
+                                              _SNIFF_DELIMITERS).delimiter
+        except pycsv.Error:
+            delimiter = ","
+        dialect = dict(delimiter=delimiter)
+        info.set("dialect", dialect)
+    return dialect["delimiter"]
+
+
+class _InputInfo(object):
+    """ what earlier runs learned about an input, its dialect and schema,
+    kept in the cache as long as the size and mtime of the input match. """
+
+    def __init__(self, cache, path):
+        self.cache = cache
+        self.key = "csv/inputs/" + ResultCache.key(str(path))
+        st = os.stat(str(path))
+        self.fingerprint = [st.st_size, st.st_mtime]
+        data = cache.get(self.key, None)
+        if not data or data.get("fingerprint") != self.fingerprint:
+            data = dict(fingerprint=self.fingerprint)
+        self.data = data
+
+    def get(self, name):
+        return self.data.get(name)
+
+    def set(self, name, value):
+        if self.data.get(name) != value:
+            self.data[name] = value
+            self.cache.set(self.key, self.data)
+
+
+def _input_info(config, path):
+    infos = getattr(config, "_csv_inputs", None)
+    if infos is None:
+        infos = config._csv_inputs = {}
+    info = infos.get(str(path))
+    if info is None:
+        info = infos[str(path)] = _InputInfo(getcache(config), path)
+    return info
+
+
+def _merge_stats(total, stats):
+    for key, value in stats.items():
+        total[key] = total.get(key, 0) + value
+
+
+def _distill_serial(config, paths, writer):
+    total = {}
+    expected = _read_header(config, paths[0])
+    for path in paths:
+        header, stats = distill_file(config, path, writer, expected)
+        _merge_stats(total, stats)
+    writer.writeheader(header)
+    return total
+
+
+def _distill_spooled(config, paths, writer, workers, results=None):
+    """ distill every path (in worker processes if ``workers`` > 1) into its
+    own spool file, then concatenate the spool files in input order.
+
+    With a :class:`ResultCache <_pydistill.cacheprovider.ResultCache>`
+    unchanged inputs are served from the cache and fresh spool files are
+    moved into it.
+    """
+    expected = _read_header(config, paths[0])
+    keys = [_result_key(config, results, path, expected)
+            if _cacheable(results, path) else None for path in paths]
+    cached = [None if key is None else results.get(key) for key in keys]
+    spooldir = tempfile.mkdtemp(prefix="pydistill-")
+    # indexed inputs are split into byte ranges distilled by several workers
+    spans = [_spans(config, path, workers) if cached[i] is None else []
+             for i, path in enumerate(paths)]
+    jobs = [(i, part, str(path), spooldir, expected, span)
+            for i, path in enumerate(paths)
+            for part, span in enumerate(spans[i])]
+    total = {}
+    with parallel.shared(config) as token:
+        try:
+            computed = parallel.imap_ordered(
+                functools.partial(_distill_to_spool, token), jobs, workers)
+            for key, entry, parts in zip(keys, cached, spans):
+                if entry is None:
+                    spoolpath, header, stats = next(computed)
+                    for part in parts[1:]:
+                        morepath, _, morestats = next(computed)
+                        _append_file(spoolpath, morepath)
+                        _merge_stats(stats, morestats)
+                    meta = dict(header=header, stats=stats)
+                    if key is not None:
+                        entry = results.put(key, spoolpath, meta)
+                    if entry is None:
+                        entry = py.path.local(spoolpath), meta
+                datapath, meta = entry
+                writer.writeheader(meta['header'])
+                writer.flush()
+                encoding = config.getoption("encoding")
+                with stream.open_text(datapath, encoding=encoding) as f:
+                    shutil.copyfileobj(f, writer.stream)
+                _merge_stats(total, meta['stats'])
+        finally:
+            shutil.rmtree(spooldir, ignore_errors=True)
+    return total
+
+
+def _distill_sketch(config, paths, writer, workers):
+    """ sketch every path, in worker processes if ``workers`` > 1, and
+    merge the sketches into the :class:`_SketchWriter` ``writer``. """
+    if workers <= 1 or len(paths) < 2:
+        return _distill_serial(config, paths, writer)
+    expected = _read_header(config, paths[0])
+    jobs = [(str(path), expected) for path in paths]
+    total = {}
+    with parallel.shared(config) as token:
+        for data, stats in parallel.imap_ordered(
+                functools.partial(_sketch_in_worker, token), jobs, workers):
+            writer.merge(TableSketch.from_json(data))
+            _merge_stats(total, stats)
+    return total
+
+
+#: csv options which change the distilled output, the engines included;
+#: the options and ini values of other plugins always do
+_RESULT_OPTIONS = ("delimiter", "encoding", "columnar", "mmap", "columns",
+                   "grep", "grep_fixed", "rows")
+
+#: option groups and ini values of the builtin plugins
+_BUILTIN_GROUPS = frozenset(["general", "debugconfig", "csv"])
+_BUILTIN_INIVALUES = frozenset(["addopts", "cache_dir", "result_cache_size",
+                                "parse_cache_size"])
+
+#: hooks run while distilling a file
+_RESULT_HOOKS = ("pydistill_csv_table", "pydistill_csv_aggregate",
+                 "pydistill_transform", "pydistill_transform_batch")
+
+
+def _config_fingerprint(config):
+    """ key of everything besides the input that determines the output:
+    the options and ini values which change results and the versions of all
+    plugins.  Input paths and tuning options like ``--chunk-size`` are not
+    part of it. """
+    parser = config._parser
+    names = list(_RESULT_OPTIONS)
+    for group in parser._groups + [parser._anonymous]:
+        if group.name not in _BUILTIN_GROUPS:
+            names.extend(opt.dest for opt in group.options)
+    options = dict((name, config.getoption(name, None)) for name in names)
+    inivalues = dict((name, config.getini(name)) for name in parser._ininames
+                     if name not in _BUILTIN_INIVALUES)
+    plugins = sorted("%s-%s" % (dist.project_name, dist.version)
+                     for plugin, dist in
+                     config.pluginmanager.list_plugin_distinfo())
+    return ResultCache.key("csv", __version__, options, inivalues, plugins)
+
+
+def _result_cache(config):
+    """ the :class:`ResultCache <_pydistill.cacheprovider.ResultCache>`
+    outputs are stored in, ``None`` if it is disabled or plugins which are
+    not installed distributions (conftest files, ``-p`` modules, plugin
+    objects) implement the distilling hooks: their code is not versioned, so
+    it cannot be part of a result key. """
+    results = getcache(config).results()
+    if results is None:
+        return None
+    pm = config.pluginmanager
+    versioned = set(id(plugin) for plugin, dist in pm.list_plugin_distinfo())
+    for name in _RESULT_HOOKS:
+        for hookimpl in getattr(pm.hook, name).get_hookimpls():
+            plugin = hookimpl.plugin
+            if id(plugin) not in versioned and not getattr(
+                    plugin, "__name__", "").startswith("_pydistill."):
+                return None
+    return results
+
+
+def _cacheable(results, path):
+    """ whether the output of ``path`` is worth storing in ``results``:
+    inputs larger than the whole cache are streamed straight to the
+    output instead of paying for a digest and a spool file. """
+    return results is not None and path.check(file=1) and \
+        path.size() <= results.maxsize
+
+
+def _result_key(config, results, path, expected_header):
+    """ key of the distilled output of ``path``, by its content. """
+    return results.key(_config_fingerprint(config),
+                       _input_digest(config, path), expected_header)
+
+
+def _input_digest(config, path):
+    """ the content digest of ``path``, computed again only after it
+    changed. """
+    info = _input_info(config, path)
+    digest = info.get("digest")
+    if digest is None:
+        digest = file_digest(path)
+        info.set("digest", digest)
+    return digest
+
+
+def _distill_incremental(config, paths, writer):
+    """ distill only the records appended to every input since the last
+    ``--incremental`` run and merge them into the saved state.
+
+    The header is written only if the first input is distilled from its
+    beginning, so the output can be appended to the previous one.
+    """
+    from _pydistill.tokenizer import MmapCsvReader
+    cache = getcache(config)
+    fingerprint = _config_fingerprint(config)
+    expected = _read_header(config, paths[0])
+    total = {}
+    for i, path in enumerate(paths):
+        # separate states for separate option sets
+        key = "csv/incremental/" + ResultCache.key(str(path), fingerprint)
+        state = IncrementalState.from_json(cache.get(key, None))
+        with _input_errors(path), \
+                MmapCsvReader(path, config.getoption("chunk_size"),
+                              encoding=config.getoption("encoding"),
+                              **dict(_selection(config),
+                                     **_fmtparams(config, path))) as reader:
+            if reader.header != expected:
+                raise UsageError("%s: header does not match the first "
+                                 "input" % (path,))
+            buf = reader.buffer
+            start = state.resume_offset(buf, fingerprint, reader.header)
+            if i == 0 and start:
+                writer.writeheader(None)
+            start = max(start, reader.data_start)
+            reader.select(start, partial=False)
+            progress = _Progress(start)
+            aggregate = _AggregateTransform(config, reader.header,
+                                            state.aggregates)
+            header, stats = distill_reader(config, reader, writer,
+                                           before=[progress],
+                                           after=[aggregate])
+            state.advance(buf, progress.laststart, progress.end)
+        _merge_stats(state.stats, stats)
+        _merge_stats(total, stats)
+        cache.set(key, state.to_json())
+    writer.writeheader(header)
+    return total
+
+
+def _distill_pipeline(config, paths, out):
+    """ distill every path through the reader, transform and writer hooks,
+    see :mod:`_pydistill.pipeline`. """
+    from _pydistill.pipeline import Pipeline
+    hook = config.hook
+    writer = hook.pydistill_writer(config=config, out=out)
+    transforms = _hook_transforms(config)
+    maxsize = int(config.getoption("queue_size"))
+    total = {}
+    for i, path in enumerate(paths):
+        reader = hook.pydistill_reader(config=config, path=path)
+        try:
+            header = getattr(reader, "header", None)
+            if i == 0:
+                expected = header
+            elif header != expected:
+                raise UsageError("%s: header does not match the first "
+                                 "input" % (path,))
+            if hasattr(writer, "writeheader"):
+                writer.writeheader(header)
+            with _input_errors(path):
+                stats = Pipeline(reader, writer, transforms, maxsize).run()
+        finally:
+            if hasattr(reader, "close"):
+                reader.close()
+        _merge_stats(total, stats)
+    if hasattr(writer, "flush"):
+        writer.flush()
+    if hasattr(writer, "finish"):
+        writer.finish()
+    return total
+
+
+@exthookimpl(trylast=True)
+def pydistill_reader(config, path):
+    return _open_reader(config, path)
+
+
+@exthookimpl(trylast=True)
+def pydistill_writer(config, out):
+    return _open_writer(config, out)
+
+
+def _read_header(config, path):
+    if _is_colfile(path):
+        with _open_reader(config, path) as reader:
+            return reader.header
+    columns = _selection(config)["columns"]
+    with stream.open_text(path, encoding=config.getoption("encoding")) as f:
+        try:
+            return stream.CsvReader(f, columns=columns,
+                                    **_fmtparams(config, path)).header
+        except ValueError as e:
+            raise UsageError("%s: %s" % (path, e))
+
+
+def _distill_to_spool(token, job):
+    index, part, path, spooldir, expected, span = job
+    config = parallel.lookup(token)
+    spoolpath = os.path.join(spooldir, "%06d-%06d.csv" % (index, part))
+    with stream.open_text(spoolpath, 'w',
+                          encoding=config.getoption("encoding")) as f:
+        writer = stream.CsvWriter(f, **_fmtparams(config))
+        # the parent writes the header once, spool files only hold rows
+        writer.writeheader(None)
+        header, stats = distill_file(config, path, writer, expected, span)
+    return spoolpath, header, stats
+
+
+def _append_file(target, source):
+    with open(target, 'ab') as dst, open(source, 'rb') as src:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def _index_in_worker(token, path):
+    from _pydistill.rowindex import RowIndex
+    config = parallel.lookup(token)
+    key = config.getoption("index_key")
+    try:
+        index = RowIndex.build(path, encoding=config.getoption("encoding"),
+                               key=key, **_fmtparams(config, path))
+    except ValueError as e:
+        raise UsageError("%s: %s" % (path, e))
+    index.save(path)
+    return index.num_rows
+
+
+def _sketch_in_worker(token, job):
+    path, expected = job
+    config = parallel.lookup(token)
+    writer = _SketchWriter(None, config)
+    header, stats = distill_file(config, path, writer, expected)
+    return writer.sketch.to_json(), stats
+
+
+class _SketchWriter(object):
+    """ sketches the distilled rows and writes the summary of every column
+    instead of them when finished, see :mod:`_pydistill.sketch`. """
+
+    def __init__(self, out, config):
+        self.out = out
+        self.config = config
+        self.top = int(config.getoption("sketch_top"))
+        self.sketch = None
+
+    def writeheader(self, header):
+        if header is not None and self.sketch is None:
+            self.sketch = TableSketch(header, top=self.top)
+
+    def write(self, chunk):
+        self.sketch.update(chunk)
+
+    def merge(self, sketch):
+        if self.sketch is None:
+            self.sketch = sketch
+        else:
+            self.sketch.merge(sketch)
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        writer = stream.CsvWriter(self.out, **_fmtparams(self.config))
+        writer.writeheader(SUMMARY_HEADER)
+        if self.sketch is not None:
+            writer.write(self.sketch.summary())
+        writer.flush()
+
+
+class _ColumnarTransform(object):
+    """ converts a chunk to a ColumnTable and runs the table hooks on it. """
+
+    def __init__(self, config, table_cls, header, writer, schema=None):
+        self.config = config
+        self.table_cls = table_cls
+        self.header = header
+        self.writer = writer
+        self.schema = schema
+        self.out_header = None
+
+    def __call__(self, chunk):
+        try:
+            table = self.table_cls.from_rows(self.header, chunk,
+                                             schema=self.schema)
+        except ValueError as e:
+            raise UsageError(str(e))
+        self.config.hook.pydistill_csv_table(config=self.config, table=table)
+        # the hooks may add or drop columns, the first table decides
+        if self.out_header is None:
+            self.out_header = table.header
+        self.writer.writeheader(self.out_header)
+        return table.to_rows()
+
+
+class _Progress(object):
+    """ tracks the offsets of the last record read by a mmap reader. """
+
+    def __init__(self, start):
+        self.laststart = self.end = start
+
+    def __call__(self, chunk):
+        self.laststart = chunk[-2].end if len(chunk) > 1 else self.end
+        self.end = chunk[-1].end
+        return chunk
+
+
+class _AggregateTransform(object):
+    """ lets plugins fold every distilled chunk into their saved state. """
+
+    def __init__(self, config, header, aggregates):
+        self.config = config
+        self.header = header
+        self.aggregates = aggregates
+
+    def __call__(self, chunk):
+        self.config.hook.pydistill_csv_aggregate(
+            config=self.config, header=self.header, chunk=chunk,
+            aggregates=self.aggregates)
+        return chunk
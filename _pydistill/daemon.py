@@ -0,0 +1,264 @@
+"""
+warm daemon process answering ``distill`` invocations over a unix socket.
+
+``distill --daemon`` imports pydistill, its builtin plugins and the
+installed plugins once and then waits for jobs.  Every job runs in a
+process forked from the warm daemon, so it starts with everything imported
+but shares no state with other jobs.
+
+``distillc`` is the thin client: it sends its arguments, working directory
+and environment along with its stdin, stdout and stderr file descriptors,
+so the job writes straight to the client's terminal, and exits with the
+exit code of the job.  Without a running daemon it runs the job itself.
+
+The socket is ``$PYDISTILL_SOCKET``, or ``pydistill.sock`` in
+``$XDG_RUNTIME_DIR``, or in a ``pydistill-<uid>`` directory only the user
+can access in the temporary directory; ``distill --daemon --socket PATH``
+overrides it.  Both ends check with ``SO_PEERCRED`` that the other one runs
+as the same user before a job, its environment and file descriptors are
+sent or run, so jobs never cross users.  The client only imports the
+standard library.  Both need python 3.3 or later and a platform with unix
+sockets.
+"""
+from __future__ import absolute_import, division, print_function
+import array
+import importlib
+import io
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import tempfile
+
+_HEADER = struct.Struct("!I")
+_EXIT = struct.Struct("!i")
+# struct ucred
+_CREDS = struct.Struct("3i")
+
+#: exit code if the daemon lost the job, as for an internal error
+EXIT_INTERNALERROR = 3
+
+
+def default_socket_path():
+    """ return the socket path, creating the private directory holding it
+    if needed; raises ``RuntimeError`` if that directory is not private. """
+    path = os.environ.get("PYDISTILL_SOCKET")
+    if path:
+        return path
+    rundir = os.environ.get("XDG_RUNTIME_DIR")
+    if not rundir:
+        rundir = os.path.join(tempfile.gettempdir(),
+                              "pydistill-%d" % os.getuid())
+        _private_dir(rundir)
+    return os.path.join(rundir, "pydistill.sock")
+
+
+def _private_dir(path):
+    """ create the directory ``path`` accessible by this user only, or
+    check that the existing one is. """
+    try:
+        os.mkdir(path, 0o700)
+    except OSError:
+        pass
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or \
+            st.st_mode & 0o077:
+        raise RuntimeError("%s is not a private directory of this user" % (
+            path,))
+
+
+def _peer_uid(sock):
+    """ return the uid of the process at the other end of the unix socket
+    ``sock``, or ``None`` if the platform cannot tell. """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                            _CREDS.size)
+    pid, uid, gid = _CREDS.unpack(creds)
+    return uid
+
+
+def _same_user(sock):
+    return _peer_uid(sock) == os.getuid()
+
+
+def _recv_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("connection closed")
+        data += chunk
+    return data
+
+
+#
+# client
+#
+def run_job(argv, socketpath=None, fds=(0, 1, 2)):
+    """ run ``distill argv`` in the daemon and return its exit code, or
+    ``None`` if no daemon of this user is listening on ``socketpath``. """
+    if not hasattr(socket, "AF_UNIX") or not hasattr(socket.socket,
+                                                     "sendmsg"):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socketpath or default_socket_path())
+        except (OSError, IOError, RuntimeError):
+            return None
+        if not _same_user(sock):
+            # never hand the environment and terminal to another user
+            return None
+        job = json.dumps(dict(argv=list(argv), cwd=os.getcwd(),
+                              env=dict(os.environ))).encode("utf-8")
+        sock.sendmsg([_HEADER.pack(len(job))],
+                     [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                       array.array("i", fds))])
+        sock.sendall(job)
+        try:
+            return _EXIT.unpack(_recv_exactly(sock, _EXIT.size))[0]
+        except EOFError:
+            sys.stderr.write("ERROR: pydistill daemon lost the job\n")
+            return EXIT_INTERNALERROR
+    finally:
+        sock.close()
+
+
+def client_main(argv=None):
+    """ entry point of ``distillc``. """
+    if argv is None:
+        argv = sys.argv[1:]
+    code = run_job(argv)
+    if code is None:
+        from _pydistill.config import main
+        code = main(list(argv))
+    sys.exit(code)
+
+
+#
+# server
+#
+def _receive_job(sock):
+    msg, ancdata, flags, addr = sock.recvmsg(
+        _HEADER.size, socket.CMSG_LEN(3 * array.array("i").itemsize))
+    fds = array.array("i")
+    for level, type, data in ancdata:
+        if level == socket.SOL_SOCKET and type == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+    if len(msg) < _HEADER.size:
+        msg += _recv_exactly(sock, _HEADER.size - len(msg))
+    size, = _HEADER.unpack(msg)
+    job = json.loads(_recv_exactly(sock, size).decode("utf-8"))
+    return job, list(fds)
+
+
+def _run_forked_job(sock, session=None):
+    """ run the job of the connection ``sock`` in this (forked) process, in
+    ``session`` if given, and send back its exit code.  Connections of
+    other users are closed without reading anything. """
+    if not _same_user(sock):
+        return
+    job, fds = _receive_job(sock)
+    for target, fd in enumerate(fds[:3]):
+        os.dup2(fd, target)
+        os.close(fd)
+    # whatever the daemon's streams were, the job writes to the client's
+    sys.stdin = io.open(0, "r", closefd=False)
+    sys.stdout = io.open(1, "w", closefd=False)
+    sys.stderr = io.open(2, "w", buffering=1, closefd=False)
+    os.chdir(job["cwd"])
+    os.environ.clear()
+    os.environ.update(job["env"])
+    sys.argv = ["distill"] + job["argv"]
+    try:
+        from _pydistill.config import _version_requested
+        if session is not None and not _version_requested(job["argv"]):
+            code = session.run(job["argv"])
+        else:
+            from _pydistill.config import main
+            code = main(job["argv"])
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = EXIT_INTERNALERROR
+    sys.stdout.flush()
+    sys.stderr.flush()
+    sock.sendall(_EXIT.pack(code or 0))
+
+
+def preload():
+    """ import everything a job would import and return the
+    :class:`Session <_pydistill.session.Session>` running the jobs. """
+    from _pydistill.session import Session
+    # imported lazily by every job otherwise
+    for modname in ("argparse", "shlex", "six"):
+        importlib.import_module(modname)
+    return Session()
+
+
+def make_server(socketpath, session=None):
+    import socketserver
+
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            _run_forked_job(self.request, session)
+
+    class Server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+        pass
+
+    if os.path.exists(socketpath):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socketpath)
+        except (OSError, IOError):
+            # stale socket of a daemon which is gone
+            os.remove(socketpath)
+        else:
+            raise RuntimeError("a daemon is already listening on %s" % (
+                socketpath,))
+        finally:
+            probe.close()
+    umask = os.umask(0o177)
+    try:
+        return Server(socketpath, Handler)
+    finally:
+        os.umask(umask)
+
+
+def serve(socketpath=None):
+    """ preload and answer jobs on ``socketpath`` until interrupted. """
+    socketpath = socketpath or default_socket_path()
+    server = make_server(socketpath, preload())
+    sys.stderr.write("pydistill daemon listening on %s\n" % socketpath)
+    sys.stderr.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socketpath)
+    return 0
+
+
+def daemon_args(args):
+    """ return the socket path if ``args`` ask for ``--daemon``, else
+    ``None``; the path is empty for the default socket. """
+    if args is None:
+        args = sys.argv[1:]
+    if not isinstance(args, (list, tuple)) or not args or \
+            args[0] != "--daemon":
+        return None
+    rest = list(args[1:])
+    if not rest:
+        return ""
+    if len(rest) == 2 and rest[0] == "--socket":
+        return rest[1]
+    if len(rest) == 1 and rest[0].startswith("--socket="):
+        return rest[0][len("--socket="):]
+    raise ValueError("usage: distill --daemon [--socket PATH]")
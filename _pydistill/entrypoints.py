@@ -0,0 +1,146 @@
+"""
+persisted index of setuptools entry point plugins.
+
+Finding entry points means reading the metadata of every installed
+distribution.  The index keeps the result in ``config.cache`` together with
+a fingerprint of the import path and is only rebuilt when that fingerprint
+changes: the interpreter, the prefix, the mtime of every ``sys.path``
+directory, which changes whenever a distribution is installed or removed
+there, and the mtimes of the ``.dist-info`` and ``.egg-info`` metadata and
+their ``entry_points.txt`` in them, which catch metadata edited in place.
+``--cache-clear`` forces a rebuild.
+
+Entry points named ``<subcmd>.<name>`` are only loaded for that
+sub-command, all others are loaded for every sub-command.
+"""
+from __future__ import absolute_import, division, print_function
+import importlib
+import os
+import sys
+
+
+_METADATA_SUFFIXES = (".dist-info", ".egg-info")
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _metadata_mtimes(directory):
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        # a file, e.g. a zip archive, or gone
+        return []
+    found = []
+    for name in sorted(names):
+        if name.endswith(_METADATA_SUFFIXES):
+            path = os.path.join(directory, name)
+            found.append([name, _mtime(path),
+                          _mtime(os.path.join(path, "entry_points.txt"))])
+    return found
+
+
+def site_fingerprint():
+    """ return a json serializable fingerprint of the import path. """
+    entries = []
+    for entry in sys.path:
+        directory = entry or os.curdir
+        entries.append([entry, _mtime(directory),
+                        _metadata_mtimes(directory)])
+    return [sys.version, sys.prefix, entries]
+
+
+class DistInfo(object):
+    """ name and version of the distribution providing an entry point,
+    with the attribute names of ``pkg_resources.Distribution``. """
+
+    def __init__(self, project_name, version):
+        self.project_name = project_name
+        self.version = version
+
+    def __repr__(self):
+        return "<DistInfo %s-%s>" % (self.project_name, self.version)
+
+
+class IndexedEntryPoint(object):
+
+    def __init__(self, name, value, dist, version):
+        self.name = name
+        self.value = value
+        self.dist = DistInfo(dist, version)
+
+    def applies_to(self, subcmd):
+        """ true if the plugin is loaded for ``subcmd``; without a
+        sub-command every plugin is. """
+        prefix, sep, _ = self.name.partition(".")
+        return not sep or subcmd is None or prefix == subcmd
+
+    def load(self):
+        modname, _, attrs = self.value.partition(":")
+        obj = importlib.import_module(modname.strip())
+        for attr in attrs.strip().split("."):
+            if attr:
+                obj = getattr(obj, attr)
+        return obj
+
+    def to_json(self):
+        return [self.name, self.value, self.dist.project_name,
+                self.dist.version]
+
+    def __repr__(self):
+        return "<IndexedEntryPoint %s = %s>" % (self.name, self.value)
+
+
+def scan_entrypoints(group):
+    """ read the entry points of ``group`` from all distribution metadata. """
+    try:
+        from importlib import metadata
+    except ImportError:
+        metadata = None
+    found = []
+    if metadata is not None:
+        seen = set()
+        for dist in metadata.distributions():
+            distname = dist.metadata["Name"]
+            if distname in seen:
+                # shadowed by an earlier sys.path entry
+                continue
+            seen.add(distname)
+            for ep in dist.entry_points:
+                if ep.group == group:
+                    found.append(IndexedEntryPoint(
+                        ep.name, ep.value, distname, dist.version))
+    else:
+        import pkg_resources
+        for ep in pkg_resources.iter_entry_points(group):
+            value = ep.module_name
+            if ep.attrs:
+                value += ":" + ".".join(ep.attrs)
+            found.append(IndexedEntryPoint(
+                ep.name, value, ep.dist.project_name, ep.dist.version))
+    return found
+
+
+class EntryPointIndex(object):
+    """ entry points of one group, cached in a
+    :class:`Cache <_pydistill.cacheprovider.Cache>`. """
+
+    def __init__(self, cache, group):
+        self.cache = cache
+        self.group = group
+        self._key = "entrypoints/" + group
+
+    def entries(self):
+        fingerprint = site_fingerprint()
+        cached = self.cache.get(self._key, None)
+        if cached and cached.get("fingerprint") == fingerprint:
+            return [IndexedEntryPoint(*entry) for entry in cached["entries"]]
+        entries = scan_entrypoints(self.group)
+        self.cache.set(self._key, dict(
+            fingerprint=fingerprint,
+            entries=[ep.to_json() for ep in entries]))
+        return entries
@@ -103,7 +103,7 @@ def pydistill_configure(config):
 
 
 @hookspec(firstresult=True)
-def pydistill_cmdline_parse(pluginmanager, args):
+def pydistill_cmdline_parse(pluginmanager, subcmd, args):
     """return initialized config object, parsing the specified args.
 
     Stops at first non-None result, see :ref:`firstresult`
@@ -112,7 +112,9 @@ def pydistill_cmdline_parse(pluginmanager, args):
         This hook will not be called for ``confextract.py`` files, only for setuptools plugins.
 
     :param _pydistill.config.PyDistillPluginManager pluginmanager: pydistill plugin manager
+    :param str subcmd: the sub-command, the first command line argument
     :param list[str] args: list of arguments passed on the command line
+        after the sub-command
     """
 
 
@@ -130,7 +132,8 @@ def pydistill_cmdline_main(config):
     """
 
 
-def pydistill_load_initial_conftests(early_config, parser, args):
+@hookspec
+def pydistill_load_initial_conftests(early_config, parser, subcmd, args):
     """ implements the loading of initial conftest files ahead
     of command line option parsing.
 
@@ -138,7 +141,140 @@ def pydistill_load_initial_conftests(early_config, parser, args):
         This hook will not be called for ``confextract.py`` files, only for setuptools plugins.
 
     :param _pydistill.config.Config early_config: pydistill config object
+    :param str subcmd: the sub-command
     :param list[str] args: list of arguments passed on the command line
     :param _pydistill.config.Parser parser: to add command line options
     """
 
+
+@hookspec
+def pydistill_unconfigure(config):
+    """ called before the process exits, after the sub-command ran.
+
+    :arg _pydistill.config.Config config: pydistill config object
+    """
+
+
+@hookspec(historic=True)
+def pydistill_logwarning(message, code, nodeid, fslocation):
+    """ process a warning specified by a message, a code string,
+    a nodeid and fslocation (both of which may be None
+    if the warning is not tied to a particular node/location).
+
+    .. note::
+        This hook is incompatible with ``hookwrapper=True``.
+    """
+
+
+# -------------------------------------------------------------------------
+# reader and writer hooks, run by _pydistill.pipeline; transform hooks, run
+# by every engine of the csv sub-command
+# -------------------------------------------------------------------------
+
+
+@hookspec(firstresult=True)
+def pydistill_reader(config, path):
+    """ return a reader for the input ``path``.
+
+    A reader is an iterable, or an async iterable, of chunks (lists of
+    records).  It may have a ``header`` attribute, which is passed to the
+    writer, and a ``close()`` method called when the input is done.
+
+    Stops at first non-None result, see :ref:`firstresult`
+
+    :param _pydistill.config.Config config: pydistill config object
+    :param py.path.local path: the input
+    """
+
+
+@hookspec
+def pydistill_transform(config, record):
+    """ transform one record on its way from the reader to the writer.
+
+    Implementations are chained in the order pluggy calls hooks: each one
+    receives the record returned by the previous one.  Return ``None`` to
+    drop the record.
+
+    :param _pydistill.config.Config config: pydistill config object
+    :param record: the record, as produced by the reader
+    """
+
+
+@hookspec
+def pydistill_transform_batch(config, chunk):
+    """ transform a whole chunk of records; the batch variant of
+    :func:`pydistill_transform`.
+
+    Implementations are chained like those of ``pydistill_transform`` and
+    run before them.  Return the transformed chunk, any sequence of records
+    (e.g. a list or an array), or ``None`` to drop it.  Dispatch is paid
+    once per chunk instead of once per record.
+
+    :param _pydistill.config.Config config: pydistill config object
+    :param chunk: sequence of records, at most as many as this plugin asks
+        for with :func:`pydistill_batch_size`
+    """
+
+
+@hookspec
+def pydistill_batch_size(config):
+    """ return the largest number of records ``pydistill_transform_batch``
+    implementations of this plugin want at once, or ``None`` for no limit.
+
+    Only the ``pydistill_transform_batch`` implementation of this plugin
+    gets batches of this size; records are rebatched where the sizes of
+    chained implementations differ.
+
+    :param _pydistill.config.Config config: pydistill config object
+    """
+
+
+@hookspec(firstresult=True)
+def pydistill_writer(config, out):
+    """ return a writer for the output stream ``out``.
+
+    A writer has a ``write(chunk)`` method, which may be a coroutine
+    function, and optionally ``writeheader(header)``, ``flush()`` and
+    ``finish()``, called once after the last input.
+
+    Stops at first non-None result, see :ref:`firstresult`
+
+    :param _pydistill.config.Config config: pydistill config object
+    :param out: the opened output stream, binary for ``.pdc`` outputs
+    """
+
+
+# -------------------------------------------------------------------------
+# csv distillation hooks
+# -------------------------------------------------------------------------
+
+
+@hookspec
+def pydistill_csv_table(config, table):
+    """ called for every chunk of csv data when running with ``--columnar``.
+
+    Implementations work on whole columns and change the table in place,
+    e.g. ``table.filter(table["x"] > 0)`` or ``table["y"] = table["x"] * 2``.
+    Rows left in the table afterwards are written to the output.
+
+    :param _pydistill.config.Config config: pydistill config object
+    :param _pydistill.table.ColumnTable table: one chunk of the input as
+        typed NumPy columns
+    """
+
+
+@hookspec
+def pydistill_csv_aggregate(config, header, chunk, aggregates):
+    """ fold a distilled chunk into persistent aggregate state.
+
+    Called for every chunk when running with ``--incremental``.  The
+    ``aggregates`` dict is saved between runs, so implementations only
+    ever see the rows appended since the previous run and merge them into
+    what they stored before.  Use a key named after the plugin and keep
+    the values json serializable.
+
+    :param _pydistill.config.Config config: pydistill config object
+    :param list header: the header of the input
+    :param list chunk: the distilled rows of this chunk
+    :param dict aggregates: state saved by previous runs
+    """
@@ -0,0 +1,166 @@
+"""
+per hook implementation timing, enabled with ``--hook-durations``.
+
+Every hook implementation called once the command line was preparsed is
+wrapped to count its calls and record its cumulative and maximal wall
+time; every hook call is timed as a whole as well, which includes the
+dispatch overhead of pluggy.  Times are inclusive: a hook
+calling other hooks is charged for them, too.  The report is printed when
+the run ends and can also be written as json.
+"""
+from __future__ import absolute_import, division, print_function
+import json
+import sys
+import time
+
+import py
+
+_timer = getattr(time, "perf_counter", time.time)
+
+
+class Timing(object):
+
+    __slots__ = ("calls", "total", "max")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        self.calls += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def to_json(self):
+        return dict(calls=self.calls, total=self.total, max=self.max)
+
+
+class HookProfiler(object):
+    """ records :class:`Timing` per hook and per ``(hook, plugin)``.
+
+    :meth:`enable` starts wrapping hook implementations of ``pluginmanager``
+    as they are called, :meth:`disable` restores them.
+    """
+
+    def __init__(self, pluginmanager):
+        self.pluginmanager = pluginmanager
+        self.hooks = {}
+        self.impls = {}
+        self._seen = set()
+        self._wrapped = []
+        self._starts = []
+        self._undo = None
+
+    def enable(self):
+        if self._undo is None:
+            self._undo = self.pluginmanager.add_hookcall_monitoring(
+                self._before, self._after)
+
+    def disable(self):
+        if self._undo is not None:
+            self._undo()
+            self._undo = None
+        while self._wrapped:
+            hookimpl, function = self._wrapped.pop()
+            hookimpl.function = function
+
+    def _before(self, hook_name, hook_impls, kwargs):
+        for hookimpl in hook_impls:
+            if hookimpl not in self._seen:
+                self._wrap(hook_name, hookimpl)
+        self._starts.append(_timer())
+
+    def _after(self, outcome, hook_name, hook_impls, kwargs):
+        duration = _timer() - self._starts.pop()
+        timing = self.hooks.get(hook_name)
+        if timing is None:
+            timing = self.hooks[hook_name] = Timing()
+        timing.add(duration)
+
+    def _wrap(self, hook_name, hookimpl):
+        self._seen.add(hookimpl)
+        if hookimpl.hookwrapper or getattr(hookimpl, "wrapper", False):
+            # generators, only their creation could be timed
+            return
+        function = hookimpl.function
+        timing = self.impls.setdefault(
+            (hook_name, hookimpl.plugin_name), Timing())
+
+        def timed(*args):
+            start = _timer()
+            try:
+                return function(*args)
+            finally:
+                timing.add(_timer() - start)
+
+        hookimpl.function = timed
+        self._wrapped.append((hookimpl, function))
+
+    def to_json(self):
+        """ return the timings as a list of hooks, slowest first. """
+        hooks = []
+        for name, timing in self.hooks.items():
+            entry = timing.to_json()
+            entry["name"] = name
+            entry["impls"] = sorted(
+                (dict(timing.to_json(), plugin=plugin)
+                 for (hook_name, plugin), timing in self.impls.items()
+                 if hook_name == name and timing.calls),
+                key=lambda impl: -impl["total"])
+            hooks.append(entry)
+        hooks.sort(key=lambda hook: -hook["total"])
+        return hooks
+
+    def report(self, tw):
+        tw.sep("=", "hook durations")
+        tw.line("%-40s %8s %10s %10s" % ("hook / plugin", "calls",
+                                         "total[s]", "max[s]"))
+        for hook in self.to_json():
+            tw.line("%-40s %8d %10.6f %10.6f" % (
+                hook["name"], hook["calls"], hook["total"], hook["max"]))
+            for impl in hook["impls"]:
+                tw.line("  %-38s %8d %10.6f %10.6f" % (
+                    _shortname(impl["plugin"]), impl["calls"], impl["total"],
+                    impl["max"]))
+
+
+def _shortname(plugin_name, width=38):
+    # confdistill.py plugins are registered under their full path
+    if len(plugin_name) > width:
+        return "..." + plugin_name[-(width - 3):]
+    return plugin_name
+
+
+def pydistill_addoption(parser):
+    group = parser.getgroup("debugconfig")
+    group.addoption(
+        '--hook-durations', action="store_true", dest="hook_durations",
+        default=False,
+        help="report calls and wall time of every hook implementation "
+             "at the end of the run.")
+    group.addoption(
+        '--hook-durations-json', action="store", dest="hook_durations_json",
+        default=None, metavar="PATH",
+        help="also write the --hook-durations report as json to PATH.")
+
+
+def pydistill_load_initial_conftests(early_config):
+    ns = early_config.known_args_namespace
+    if ns.hook_durations or ns.hook_durations_json:
+        profiler = early_config._hookprofiler = HookProfiler(
+            early_config.pluginmanager)
+        profiler.enable()
+
+
+def pydistill_unconfigure(config):
+    profiler = getattr(config, "_hookprofiler", None)
+    if profiler is None:
+        return
+    profiler.disable()
+    profiler.report(py.io.TerminalWriter(sys.stderr))
+    path = config.getoption("hook_durations_json")
+    if path:
+        with open(path, "w") as f:
+            json.dump(profiler.to_json(), f, indent=2)
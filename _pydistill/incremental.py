@@ -0,0 +1,67 @@
+"""
+bookkeeping for distilling append-only inputs incrementally.
+
+For every input the offset behind the last distilled record, a digest of
+that record and the accumulated statistics and plugin aggregates are kept
+in ``config.cache``.  A later run verifies the digest and continues at the
+saved offset; if the file was truncated or rewritten it starts over.  A
+last record which may still be written to is left for the next run, see
+:meth:`MmapCsvReader.select <_pydistill.tokenizer.MmapCsvReader.select>`.
+"""
+from __future__ import absolute_import, division, print_function
+import hashlib
+
+
+def _digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+class IncrementalState(object):
+    """ how far an input has been distilled.
+
+    :ivar offset: offset behind the last distilled record
+    :ivar laststart: offset where that record begins
+    :ivar lastdigest: digest of the bytes between the two
+    :ivar fingerprint: key of the options the state was produced with
+    :ivar header: header of the input
+    :ivar stats: accumulated statistics of all runs
+    :ivar aggregates: json serializable state of ``pydistill_csv_aggregate``
+        implementations
+    """
+
+    def __init__(self, offset=0, laststart=0, lastdigest=None,
+                 fingerprint=None, header=None, stats=None, aggregates=None):
+        self.offset = offset
+        self.laststart = laststart
+        self.lastdigest = lastdigest
+        self.fingerprint = fingerprint
+        self.header = header
+        self.stats = stats or {}
+        self.aggregates = aggregates or {}
+
+    @classmethod
+    def from_json(cls, data):
+        if not data:
+            return cls()
+        return cls(**data)
+
+    def to_json(self):
+        return dict(vars(self))
+
+    def resume_offset(self, buf, fingerprint, header):
+        """ return the offset to continue from in ``buf``, or 0 (after
+        resetting this state) if the saved state does not apply to it. """
+        if (self.offset and self.fingerprint == fingerprint and
+                self.header == header and self.offset <= len(buf) and
+                _digest(buf[self.laststart:self.offset]) == self.lastdigest):
+            return self.offset
+        self.__init__(fingerprint=fingerprint, header=header)
+        return 0
+
+    def advance(self, buf, laststart, offset):
+        """ record that everything up to ``offset`` has been distilled, the
+        last record starting at ``laststart``. """
+        if offset > self.offset:
+            self.laststart = laststart
+            self.offset = offset
+            self.lastdigest = _digest(buf[laststart:offset])
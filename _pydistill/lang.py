@@ -0,0 +1,254 @@
+"""
+language plugins and the parse cache they share.
+
+Language plugins implement the hooks of :mod:`_pydistill.langhookspec`
+and are registered with a separate :class:`LangPluginManager`, created on
+first use and loaded from the ``pydistill_lang`` setuptools entry points.
+
+Parsing large source trees is the expensive part of distilling source
+code, so :func:`parse_file` keeps the parsed trees in a :class:`ParseCache`
+keyed by the parser name and version and the digest of the source.  A new
+plugin version therefore never sees trees of the old one; those age out of
+the size bounded cache.  :func:`parse_files` parses whole source trees in
+worker processes, ordered by the module dependencies between the files.
+"""
+from __future__ import absolute_import, division, print_function
+import functools
+import os
+import pickle
+import sys
+
+import py
+from pluggy import PluginManager
+
+from _pydistill.cacheprovider import ResultCache, _newhash, getcache
+from _pydistill.config import UsageError, langhookimpl
+from _pydistill.stream import parse_bytes
+
+#: changes whenever the layout of cached entries changes
+CACHE_FORMAT = 1
+
+_missing = object()
+
+
+class ParseCache(object):
+    """ pickled parse trees stored in a
+    :class:`ResultCache <_pydistill.cacheprovider.ResultCache>`. """
+
+    def __init__(self, results):
+        self.results = results
+
+    @staticmethod
+    def key(parser, source):
+        """ return the key of the tree ``parser`` makes of ``source``. """
+        h = _newhash()
+        h.update(source)
+        return ResultCache.key(CACHE_FORMAT, parser.name, str(parser.version),
+                               h.hexdigest())
+
+    def __contains__(self, key):
+        # only the metadata is read, the tree is loaded lazily by
+        # ParsedFiles when it is looked up
+        return self.results.get(key) is not None
+
+    def get(self, key, default=None):
+        entry = self.results.get(key)
+        if entry is None:
+            return default
+        try:
+            with open(str(entry[0]), "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            # truncated, or pickled objects which moved
+            return default
+
+    def put(self, key, tree, parser=None):
+        tmp = self.results.directory.join("%s.%d.pickle" % (key, os.getpid()))
+        with open(str(tmp), "wb") as f:
+            pickle.dump(tree, f, pickle.HIGHEST_PROTOCOL)
+        meta = {}
+        if parser is not None:
+            meta = dict(parser=parser.name, version=str(parser.version))
+        if self.results.put(key, tmp, meta) is None:
+            # larger than the whole cache
+            tmp.remove()
+
+
+class LangPluginManager(PluginManager):
+    """ plugin manager of the ``pydistill_lang`` hooks.
+
+    Implementations must be marked with ``pydistill.langhookimpl``.
+    """
+
+    def __init__(self):
+        super(LangPluginManager, self).__init__("pydistill_lang")
+        import _pydistill.langhookspec
+        self.add_hookspecs(_pydistill.langhookspec)
+        self.register(sys.modules[__name__], "lang")
+
+    def load_entrypoints(self, cache, group="pydistill_lang"):
+        from _pydistill.entrypoints import EntryPointIndex
+        for ep in EntryPointIndex(cache, group).entries():
+            if self.get_plugin(ep.name) or self.is_blocked(ep.name):
+                continue
+            self.register(ep.load(), name=ep.name)
+
+
+def get_langmanager(config):
+    """ return ``config.langmanager``, creating it on first use. """
+    langmanager = getattr(config, "langmanager", None)
+    if langmanager is None:
+        langmanager = config.langmanager = LangPluginManager()
+        langmanager.load_entrypoints(getcache(config))
+    return langmanager
+
+
+def get_parser(config, path):
+    """ return the parser of the language plugin handling ``path``. """
+    parser = get_langmanager(config).hook.pydistill_lang_parser(
+        config=config, path=path)
+    if parser is None:
+        raise UsageError("no language plugin handles %s" % (path,))
+    return parser
+
+
+def parse_file(config, path):
+    """ return the parsed tree of the source file ``path``, from the parse
+    cache if the source did not change since it was parsed last. """
+    path = py.path.local(path)
+    parser = get_parser(config, path)
+    cache = get_langmanager(config).hook.pydistill_lang_parse_cache(
+        config=config)
+    source = path.read_binary()
+    if cache is None:
+        return parser.parse(path, source)
+    key = cache.key(parser, source)
+    tree = cache.get(key, _missing)
+    if tree is _missing:
+        tree = parser.parse(path, source)
+        cache.put(key, tree, parser)
+    return tree
+
+
+class ParsedFiles(object):
+    """ read-only mapping of source paths to parse trees.
+
+    Trees parsed in worker processes are passed through the parse cache
+    rather than pickled back to the parent; they are loaded from the cache
+    when they are first looked up.
+    """
+
+    def __init__(self, cache=None):
+        self._cache = cache
+        self._trees = {}
+        self._keys = {}
+
+    def __getitem__(self, path):
+        path = py.path.local(path)
+        try:
+            return self._trees[path]
+        except KeyError:
+            key = self._keys[path]
+        tree = self._cache.get(key, _missing)
+        if tree is _missing:
+            raise LookupError("parse tree of %s was evicted from the parse "
+                              "cache, raise parse_cache_size" % (path,))
+        self._trees[path] = tree
+        return tree
+
+    def __contains__(self, path):
+        path = py.path.local(path)
+        return path in self._trees or path in self._keys
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self._trees) + len(self._keys)
+
+    @property
+    def paths(self):
+        return sorted(set(self._trees) | set(self._keys))
+
+    def items(self):
+        for path in self.paths:
+            yield path, self[path]
+
+
+def dependencies(config, paths):
+    """ return ``{path: set(paths)}`` of the files every source file
+    requires, according to ``pydistill_lang_dependencies``. """
+    hook = get_langmanager(config).hook
+    provided = {}
+    required = {}
+    for path in paths:
+        found = hook.pydistill_lang_dependencies(
+            config=config, path=path, source=path.read_binary())
+        if found is None:
+            continue
+        provides, requires = found
+        for name in provides:
+            provided.setdefault(name, path)
+        required[path] = requires
+    return dict((path, set(provided[name] for name in names
+                           if name in provided))
+                for path, names in required.items())
+
+
+def _parse_in_worker(token, path):
+    """ parse ``path`` into the parse cache and return its key, or return
+    the tree itself if there is no parse cache. """
+    from _pydistill import parallel
+    config = parallel.lookup(token)
+    parser = get_parser(config, path)
+    cache = get_langmanager(config).hook.pydistill_lang_parse_cache(
+        config=config)
+    source = path.read_binary()
+    if cache is None:
+        return None, parser.parse(path, source)
+    key = cache.key(parser, source)
+    if key not in cache:
+        cache.put(key, parser.parse(path, source), parser)
+    return key, None
+
+
+def parse_files(config, paths, workers=1):
+    """ parse the source files ``paths`` in up to ``workers`` processes and
+    return the trees as :class:`ParsedFiles`.
+
+    A file is parsed only after the files providing the modules it uses,
+    see ``pydistill_lang_dependencies``.
+    """
+    from _pydistill import parallel
+    paths = [py.path.local(path) for path in paths]
+    langmanager = get_langmanager(config)
+    cache = langmanager.hook.pydistill_lang_parse_cache(config=config)
+    parsed = ParsedFiles(cache)
+    if workers <= 1:
+        for path, tree in parallel.imap_dependency_ordered(
+                lambda path: parse_file(config, path), paths,
+                dependencies(config, paths)):
+            parsed._trees[path] = tree
+        return parsed
+    with parallel.shared(config) as token:
+        for path, (key, tree) in parallel.imap_dependency_ordered(
+                functools.partial(_parse_in_worker, token), paths,
+                dependencies(config, paths), workers):
+            if key is None:
+                parsed._trees[path] = tree
+            else:
+                parsed._keys[path] = key
+    return parsed
+
+
+@langhookimpl(trylast=True)
+def pydistill_lang_parse_cache(config):
+    cache = getattr(config, "_parsecache", _missing)
+    if cache is _missing:
+        maxsize = parse_bytes(config.getini("parse_cache_size"))
+        cache = None
+        if maxsize:
+            cache = ParseCache(ResultCache(getcache(config).makedir("parse"),
+                                           maxsize))
+        config._parsecache = cache
+    return cache
@@ -1,144 +1,85 @@
-""" hook specifications for pydistill plugins, invoked from main.py and builtin plugins.  """
+""" hook specifications for pydistill language plugins, which distill source
+code.  Language plugins are registered with the
+:class:`LangPluginManager <_pydistill.lang.LangPluginManager>` and mark their
+implementations with ``pydistill.langhookimpl``.  """
 
 from pluggy import HookspecMarker
 
-hookspec = HookspecMarker("pydistill")
+hookspec = HookspecMarker("pydistill_lang")
 
 # -------------------------------------------------------------------------
-# Initialization hooks called for every plugin
+# parsing
 # -------------------------------------------------------------------------
 
 
-@hookspec(historic=True)
-def pydistill_addhooks(pluginmanager):
-    """called at plugin registration time to allow adding new hooks via a call to
-    ``pluginmanager.add_hookspecs(module_or_class, prefix)``.
-
+@hookspec(firstresult=True)
+def pydistill_lang_parser(config, path):
+    """ return the parser for the source file ``path``, or ``None`` if the
+    plugin does not handle its language.
 
-    :param _pydistill.config.PyDistillPluginManager pluginmanager: pydistill plugin manager
+    A parser has ``name`` and ``version`` attributes and a
+    ``parse(path, source)`` method returning the parsed tree of the
+    ``source`` bytes.  Trees are cached keyed by the parser name and
+    version and the source content, so they must be picklable and the
+    version must change whenever the parser produces different trees.
 
-    .. note::
-        This hook is incompatible with ``hookwrapper=True``.
-    """
+    Stops at first non-None result, see :ref:`firstresult`
 
-@hookspec(historic=True)
-def pydistill_namespace():
+    :param _pydistill.config.Config config: pydistill config object
+    :param py.path.local path: the source file
     """
-    (**Deprecated**) this hook causes direct monkeypatching on pydistill, its use is strongly discouraged
-    return dict of name->object to be made globally available in
-    the pydistill namespace.
 
-    This hook is called at plugin registration time.
-
-    .. note::
-        This hook is incompatible with ``hookwrapper=True``.
-    """
 
+@hookspec(firstresult=True)
+def pydistill_lang_parse_cache(config):
+    """ return the :class:`ParseCache <_pydistill.lang.ParseCache>` shared by
+    all language plugins, or ``None`` to parse every file anew.
 
-@hookspec(historic=True)
-def pydistill_plugin_registered(plugin, manager):
-    """ a new pydistill plugin got registered.
+    The default implementation keeps the cache below the cache directory,
+    bounded by the ``parse_cache_size`` ini value.
 
-    :param plugin: the plugin module or instance
-    :param _pydistill.config.PyDistillPluginManager manager: pydistill plugin manager
+    Stops at first non-None result, see :ref:`firstresult`
 
-    .. note::
-        This hook is incompatible with ``hookwrapper=True``.
+    :param _pydistill.config.Config config: pydistill config object
     """
 
-@hookspec(historic=True)
-def pydistill_addoption(parser):
-    """register argparse-style options and ini-style config values,
-    called once at the beginning of a test run.
 
-    .. note::
-
-        This function should be implemented only in plugins or ``conftest.py``
-        files situated at the tests root directory due to how pydistill
-        :ref:`discovers plugins during startup <pluginorder>`.
-
-    :arg _pydistill.config.Parser parser: To add command line options, call
-        :py:func:`parser.addoption(...) <_pydistill.config.Parser.addoption>`.
-        To add ini-file values call :py:func:`parser.addini(...)
-        <_pydistill.config.Parser.addini>`.
-
-    Options can later be accessed through the
-    :py:class:`config <_pydistill.config.Config>` object, respectively:
-
-    - :py:func:`config.getoption(name) <_pydistill.config.Config.getoption>` to
-      retrieve the value of a command line option.
-
-    - :py:func:`config.getini(name) <_pydistill.config.Config.getini>` to retrieve
-      a value read from an ini-style file.
-
-    The config object is passed around on many internal objects via the ``.config``
-    attribute or can be retrieved as the ``pydistillconfig`` fixture.
+@hookspec(firstresult=True)
+def pydistill_lang_dependencies(config, path, source):
+    """ return ``(provides, requires)``, the names of the modules the source
+    file ``path`` defines and the names of those it uses, e.g. from Fortran
+    ``module`` and ``use`` statements.
 
-    .. note::
-        This hook is incompatible with ``hookwrapper=True``.
-    """
+    Files are parsed after the files providing the modules they require.
+    Implementations should only scan ``source`` cheaply, it is not parsed
+    yet.  Return ``None`` if the file has no dependencies.
 
+    Stops at first non-None result, see :ref:`firstresult`
 
-@hookspec(historic=True)
-def pydistill_configure(config):
+    :param _pydistill.config.Config config: pydistill config object
+    :param py.path.local path: the source file
+    :param bytes source: the content of ``path``
     """
-    Allows plugins and conftest files to perform initial configuration.
-
-    This hook is called for every plugin and initial conftest file
-    after command line options have been parsed.
-
-    After that, the hook is called for other conftest files as they are
-    imported.
 
-    .. note::
-        This hook is incompatible with ``hookwrapper=True``.
-
-    :arg _pydistill.config.Config config: pydistill config object
-    """
 
 # -------------------------------------------------------------------------
-# Bootstrapping hooks called for plugins registered early enough:
-# internal and 3rd party plugins.
+# symbol index
 # -------------------------------------------------------------------------
 
 
 @hookspec(firstresult=True)
-def pydistill_cmdline_parse(pluginmanager, args):
-    """return initialized config object, parsing the specified args.
-
-    Stops at first non-None result, see :ref:`firstresult`
-
-    .. note::
-        This hook will not be called for ``confextract.py`` files, only for setuptools plugins.
-
-    :param _pydistill.config.PyDistillPluginManager pluginmanager: pydistill plugin manager
-    :param list[str] args: list of arguments passed on the command line
-    """
+def pydistill_lang_symbols(config, path, tree):
+    """ return ``(definitions, references)`` of a parsed source file for
+    the symbol index, see :mod:`_pydistill.symbols`.
 
-
-@hookspec(firstresult=True)
-def pydistill_cmdline_main(config):
-    """ called for performing the main command line action. The default
-    implementation will invoke the configure hooks and runtest_mainloop.
-
-    .. note::
-        This hook will not be called for ``confextract.py`` files, only for setuptools plugins.
+    ``definitions`` are ``(name, kind, line)`` tuples of the symbols the
+    file defines, e.g. ``("mo_physics", "module", 1)``; ``references`` are
+    ``(src, dst, kind)`` tuples of symbol ``src`` using symbol ``dst``,
+    e.g. ``("sub_a", "sub_b", "call")``.
 
     Stops at first non-None result, see :ref:`firstresult`
 
     :param _pydistill.config.Config config: pydistill config object
+    :param py.path.local path: the source file
+    :param tree: the tree the parser of ``path`` returned
     """
-
-
-def pydistill_load_initial_conftests(early_config, parser, args):
-    """ implements the loading of initial conftest files ahead
-    of command line option parsing.
-
-    .. note::
-        This hook will not be called for ``confextract.py`` files, only for setuptools plugins.
-
-    :param _pydistill.config.Config early_config: pydistill config object
-    :param list[str] args: list of arguments passed on the command line
-    :param _pydistill.config.Parser parser: to add command line options
-    """
-
@@ -0,0 +1,195 @@
+"""
+process pool helpers for spreading independent inputs over several cores.
+
+Workers are forked from the fully configured parent process so the config,
+the plugin manager and all registered plugins are inherited instead of being
+pickled or rebuilt.  Results always come back in input order.
+"""
+from __future__ import absolute_import, division, print_function
+import contextlib
+import itertools
+import multiprocessing
+import sys
+
+
+def parse_workers(value):
+    """ parse a ``-n/--workers`` value; ``auto`` means one per cpu. """
+    if value in (None, ""):
+        return 1
+    if str(value).lower() == "auto":
+        return multiprocessing.cpu_count()
+    workers = int(value)
+    if workers < 0:
+        raise ValueError("number of workers must not be negative: %r" % (value,))
+    return max(workers, 1)
+
+
+def can_fork():
+    get_start_methods = getattr(multiprocessing, "get_all_start_methods", None)
+    if get_start_methods is None:
+        # python2: multiprocessing always forks on posix
+        import os
+        return os.name == "posix"
+    return "fork" in get_start_methods()
+
+
+_shared = {}
+_tokens = itertools.count()
+
+
+@contextlib.contextmanager
+def shared(obj):
+    """ make ``obj`` available to the worker functions of one run: yields a
+    token which :func:`lookup` turns back into ``obj``.
+
+    Pass the token with the jobs, e.g. bound with :func:`functools.partial`.
+    Forked workers inherit the registry, so ``obj`` is never pickled, and
+    runs in several threads of one process each have their own entry.
+    """
+    token = next(_tokens)
+    _shared[token] = obj
+    try:
+        yield token
+    finally:
+        del _shared[token]
+
+
+def lookup(token):
+    """ return the object registered under ``token`` by :func:`shared`. """
+    return _shared[token]
+
+
+def _pool(workers, initializer, initargs):
+    get_context = getattr(multiprocessing, "get_context", None)
+    if get_context is None:
+        return multiprocessing.Pool(workers, initializer, initargs)
+    return get_context("fork").Pool(workers, initializer, initargs)
+
+
+def imap_ordered(func, items, workers=1, initializer=None, initargs=()):
+    """ yield ``func(item)`` for every item, in the order of ``items``.
+
+    With more than one worker (and a platform that can fork) the calls run in
+    a process pool whose processes first call ``initializer(*initargs)``;
+    ``initargs`` are inherited through fork and need not be picklable, but
+    ``func``, the items and the results must be.  Otherwise everything runs
+    in the current process.
+    """
+    items = list(items)
+    workers = min(workers, len(items))
+    if workers <= 1 or not can_fork():
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            yield func(item)
+        return
+    pool = _pool(workers, initializer, initargs)
+    try:
+        for result in pool.imap(func, items):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _guarded(func, item):
+    try:
+        return True, func(item)
+    except Exception as e:
+        return False, e
+
+
+def imap_dependency_ordered(func, items, requires, workers=1,
+                            initializer=None, initargs=()):
+    """ yield ``(item, func(item))`` for every item, in completion order.
+
+    ``func(item)`` is only called once it returned for all the items in
+    ``requires[item]``; requirements which are not among ``items`` are
+    ignored and cycles are broken in the order of ``items``.  Workers are
+    set up like for :func:`imap_ordered`, every item is submitted as soon
+    as its requirements are done.
+    """
+    items = list(items)
+    known = set(items)
+    pending = {}
+    dependents = {}
+    for item in items:
+        pending[item] = set(r for r in requires.get(item, ())
+                            if r in known and r != item)
+        for r in pending[item]:
+            dependents.setdefault(r, []).append(item)
+    order = dict((item, i) for i, item in enumerate(items))
+    ready = [item for item in items if not pending[item]]
+    waiting = set(item for item in items if pending[item])
+
+    def done(item):
+        for dependent in dependents.get(item, ()):
+            pending[dependent].discard(item)
+            if not pending[dependent] and dependent in waiting:
+                waiting.discard(dependent)
+                ready.append(dependent)
+        ready.sort(key=order.get)
+
+    def break_cycle():
+        item = min(waiting, key=order.get)
+        waiting.discard(item)
+        ready.append(item)
+
+    workers = min(workers, len(items))
+    if workers <= 1 or not can_fork():
+        if initializer is not None:
+            initializer(*initargs)
+        while ready or waiting:
+            if not ready:
+                break_cycle()
+            item = ready.pop(0)
+            result = func(item)
+            done(item)
+            yield item, result
+        return
+
+    import threading
+    finished = []
+    cond = threading.Condition()
+    pool = _pool(workers, initializer, initargs)
+    try:
+        running = 0
+        while ready or waiting or running:
+            while ready:
+                item = ready.pop(0)
+
+                def callback(result, item=item):
+                    with cond:
+                        finished.append((item, result))
+                        cond.notify()
+
+                def error_callback(exc, item=item):
+                    callback((False, exc), item)
+
+                kwargs = {}
+                if sys.version_info >= (3,):
+                    # e.g. a result which cannot be pickled; python2 has
+                    # no error callback
+                    kwargs["error_callback"] = error_callback
+                pool.apply_async(_guarded, (func, item), callback=callback,
+                                 **kwargs)
+                running += 1
+            if not running:
+                break_cycle()
+                continue
+            with cond:
+                while not finished:
+                    cond.wait()
+                completed = finished[:]
+                del finished[:]
+            for item, (ok, result) in completed:
+                running -= 1
+                if not ok:
+                    raise result
+                done(item)
+                yield item, result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,123 @@
+"""
+reader -> transform -> writer pipeline driven by an asyncio event loop.
+
+The three stages run concurrently and are connected by bounded queues of
+chunks: a slow writer fills its queue, which blocks the transforms, which
+blocks the reader, so at most ``2 * maxsize`` chunks are in flight however
+fast the source is.  Blocking reads and writes run in worker threads and
+overlap with the transforms running on the event loop; readers and writers
+written with asyncio (async iterables, coroutine ``write`` methods) are
+awaited directly.
+
+Transforms work on whole chunks, so hook dispatch is paid once per chunk
+rather than once per record; :func:`per_record
+<_pydistill.stream.per_record>` adapts record transforms.  Plugins can ask
+for smaller batches, see :func:`rebatched <_pydistill.stream.rebatched>`.
+
+Requires python 3.5 or later.
+"""
+from __future__ import absolute_import, division, print_function
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+#: default bound of every queue, in chunks
+DEFAULT_QUEUE_SIZE = 8
+
+_DONE = object()
+
+
+class Pipeline(object):
+    """ runs chunks from ``reader`` through ``transforms`` into ``writer``.
+
+    :param reader: iterable or async iterable of chunks (sequences of
+        records, e.g. lists or arrays).
+    :param writer: object with a ``write(chunk)`` method, which may be a
+        coroutine function.
+    :param transforms: callables taking a chunk and returning the
+        transformed chunk; ``None`` or an empty chunk drops it.
+    :param maxsize: bound of the queues between the stages, in chunks.
+    """
+
+    def __init__(self, reader, writer, transforms=(),
+                 maxsize=DEFAULT_QUEUE_SIZE):
+        if maxsize <= 0:
+            raise ValueError("queue size must be positive")
+        self.reader = reader
+        self.writer = writer
+        self.transforms = list(transforms)
+        self.maxsize = maxsize
+        self.stats = {'chunks': 0, 'rows_in': 0, 'rows_out': 0}
+
+    def run(self):
+        """ run the pipeline in a new event loop and return its statistics. """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.arun())
+        finally:
+            loop.close()
+
+    async def arun(self):
+        """ coroutine running the pipeline on the current event loop. """
+        loop = asyncio.get_event_loop()
+        # one thread each, so reading and writing overlap
+        executor = ThreadPoolExecutor(max_workers=2)
+        toprocess = asyncio.Queue(self.maxsize)
+        towrite = asyncio.Queue(self.maxsize)
+        tasks = [
+            asyncio.ensure_future(self._read(loop, executor, toprocess)),
+            asyncio.ensure_future(self._transform(toprocess, towrite)),
+            asyncio.ensure_future(self._write(loop, executor, towrite)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            executor.shutdown(wait=True)
+        return self.stats
+
+    async def _read(self, loop, executor, queue):
+        if hasattr(self.reader, "__aiter__"):
+            async for chunk in self.reader:
+                await queue.put(chunk)
+        else:
+            chunks = iter(self.reader)
+            while True:
+                chunk = await loop.run_in_executor(executor, next, chunks,
+                                                   _DONE)
+                if chunk is _DONE:
+                    break
+                await queue.put(chunk)
+        await queue.put(_DONE)
+
+    async def _transform(self, inqueue, outqueue):
+        stats = self.stats
+        transforms = self.transforms
+        while True:
+            chunk = await inqueue.get()
+            if chunk is _DONE:
+                break
+            stats['rows_in'] += len(chunk)
+            stats['chunks'] += 1
+            for transform in transforms:
+                chunk = transform(chunk)
+                # len() as arrays have no truth value
+                if chunk is None or not len(chunk):
+                    break
+            else:
+                stats['rows_out'] += len(chunk)
+                await outqueue.put(chunk)
+        await outqueue.put(_DONE)
+
+    async def _write(self, loop, executor, queue):
+        write = self.writer.write
+        native = asyncio.iscoroutinefunction(write)
+        while True:
+            chunk = await queue.get()
+            if chunk is _DONE:
+                break
+            if native:
+                await write(chunk)
+            else:
+                await loop.run_in_executor(executor, write, chunk)
+
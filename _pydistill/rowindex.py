@@ -0,0 +1,217 @@
+"""
+sidecar row offset index of csv files.
+
+``pydistill csv --build-index`` writes ``<input>.pdx`` next to every input:
+the byte offset at which every block of ``block_rows`` records starts, the
+number of records and optionally the minimum and maximum of a key column
+per block.  Offsets are found with the tokenizer, so they are record
+boundaries even in files with quoted fields spanning several lines, which
+cannot be split safely at arbitrary newlines.  Records are counted like
+:func:`csv.reader` reads them, blank lines included.
+
+With a fresh index the ``csv`` sub-command counts the rows of an input
+without reading it, seeks directly to ``--rows`` and splits a large input
+into byte ranges distilled by several workers.  An index goes stale as soon
+as the size or the modification time of its input changes.
+"""
+from __future__ import absolute_import, division, print_function
+import bisect
+import io
+import json
+import os
+
+from _pydistill.stream import column_indexes
+from _pydistill.tokenizer import MmapCsvReader, iter_rows
+
+#: file name suffix of index files, appended to the input name
+SUFFIX = ".pdx"
+
+#: changes whenever the layout or the meaning of the offsets changes
+FORMAT_VERSION = 2
+
+#: default number of records per indexed block
+DEFAULT_BLOCK_ROWS = 65536
+
+
+def index_path(path):
+    """ return the path of the index of the input ``path``. """
+    return str(path) + SUFFIX
+
+
+def _fingerprint(path):
+    st = os.stat(str(path))
+    return [st.st_size, st.st_mtime]
+
+
+def _number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+class _Range(object):
+    """ minimum and maximum of the key values of one block, as numbers as
+    long as all values are numbers, as text otherwise. """
+
+    def __init__(self):
+        self.numeric = True
+        self.low = self.high = None
+        self.textlow = self.texthigh = None
+
+    def add(self, text):
+        if self.textlow is None or text < self.textlow:
+            self.textlow = text
+        if self.texthigh is None or text > self.texthigh:
+            self.texthigh = text
+        if self.numeric:
+            value = _number(text)
+            if value is None:
+                self.numeric = False
+            else:
+                if self.low is None or value < self.low:
+                    self.low = value
+                if self.high is None or value > self.high:
+                    self.high = value
+
+
+class RowIndex(object):
+    """ record offsets of one csv file.
+
+    :ivar starts: offset of the first record of every block
+    :ivar end: offset behind the last record
+    :ivar rows: number of records, the header excluded
+    :ivar keys: ``[min, max]`` of the key column per block, or ``None``
+    """
+
+    def __init__(self, fingerprint, delimiter, encoding, block_rows, starts,
+                 end, rows, key=None, keys=None):
+        self.fingerprint = fingerprint
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.block_rows = block_rows
+        self.starts = starts
+        self.end = end
+        self.rows = rows
+        self.key = key
+        self.keys = keys
+
+    @classmethod
+    def build(cls, path, block_rows=DEFAULT_BLOCK_ROWS, delimiter=',',
+              encoding='utf-8', key=None):
+        """ index the csv file ``path`` with one scan over it.
+
+        :param key: name of a column whose minimum and maximum are kept per
+            block.
+        """
+        if block_rows <= 0:
+            raise ValueError("block size must be positive")
+        fingerprint = _fingerprint(path)
+        with MmapCsvReader(path, delimiter=delimiter,
+                           encoding=encoding) as reader:
+            column = 0
+            if key is not None:
+                column, = column_indexes(reader.header, [key])
+            # only the key field is split off, nothing is decoded
+            # without a key
+            starts = []
+            ranges = []
+            rows = 0
+            end = reader.data_start
+            for row in iter_rows(reader.buffer, delimiter.encode(encoding),
+                                 b'"', encoding, reader.data_start,
+                                 columns=[column]):
+                if rows % block_rows == 0:
+                    starts.append(end)
+                    ranges.append(_Range())
+                if key is not None:
+                    ranges[-1].add(row[0])
+                rows += 1
+                end = row.end
+        keys = None
+        if key is not None:
+            numeric = all(r.numeric for r in ranges)
+            keys = [[r.low, r.high] if numeric else [r.textlow, r.texthigh]
+                    for r in ranges]
+        return cls(fingerprint, delimiter, encoding, block_rows, starts, end,
+                   rows, key, keys)
+
+    @classmethod
+    def load(cls, path, delimiter=',', encoding='utf-8'):
+        """ return the index of the input ``path``, or ``None`` if there is
+        none, it is stale or was built with another delimiter or encoding.
+        """
+        try:
+            with io.open(index_path(path), encoding="utf-8") as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if data.pop("version", None) != FORMAT_VERSION:
+            return None
+        index = cls(**data)
+        if (index.fingerprint != _fingerprint(path) or
+                index.delimiter != delimiter or index.encoding != encoding):
+            return None
+        return index
+
+    def save(self, path):
+        """ write the index of the input ``path`` next to it. """
+        data = dict(vars(self), version=FORMAT_VERSION)
+        target = index_path(path)
+        tmp = target + ".tmp"
+        with io.open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps(data, separators=(",", ":")))
+        os.rename(tmp, target)
+
+    @property
+    def num_rows(self):
+        return self.rows
+
+    def seek(self, row):
+        """ return the offset of the block holding record number ``row``
+        and the number of records to skip from there. """
+        block = min(row // self.block_rows, len(self.starts) - 1)
+        if block < 0:
+            return self.end, 0
+        return self.starts[block], row - block * self.block_rows
+
+    def split(self, parts):
+        """ return up to ``parts`` ``(start, end)`` byte ranges of about
+        equal size, covering all records and starting at block
+        boundaries. """
+        if not self.starts:
+            return []
+        first = self.starts[0]
+        size = self.end - first
+        bounds = [first]
+        for i in range(1, parts):
+            wanted = first + size * i // parts
+            # the block start closest to the wanted offset
+            j = bisect.bisect_left(self.starts, wanted)
+            candidates = self.starts[max(j - 1, 0):j + 1]
+            start = min(candidates, key=lambda s: abs(s - wanted))
+            if start > bounds[-1]:
+                bounds.append(start)
+        bounds.append(self.end)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def blocks_between(self, low=None, high=None):
+        """ return the ``(start, end)`` byte ranges of the blocks in which
+        the key column may have values between ``low`` and ``high``
+        (inclusive). """
+        if self.keys is None:
+            raise ValueError("the index has no key column")
+        found = []
+        for i, (kmin, kmax) in enumerate(self.keys):
+            if kmin is None:
+                continue
+            if low is not None and kmax < low:
+                continue
+            if high is not None and kmin > high:
+                continue
+            end = self.starts[i + 1] if i + 1 < len(self.starts) else self.end
+            found.append((self.starts[i], end))
+        return found
+
+    def __repr__(self):
+        return "<RowIndex rows=%d blocks=%d>" % (self.rows, len(self.starts))
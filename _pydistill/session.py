@@ -0,0 +1,77 @@
+"""
+in-process sessions running many jobs, for embedding pydistill in services.
+
+:func:`pydistill.main` imports the builtin plugins and looks up the
+installed plugins on every call.  A :class:`Session` does that once and
+then runs any number of jobs, concurrently from several threads if need
+be::
+
+    session = pydistill.Session(plugins=[MyPlugin()])
+    session.run(["csv", "--output", "a.out.csv", "a.csv"])
+
+Every job still gets its own plugin manager and :class:`Config
+<_pydistill.config.Config>`, so options, ini values and plugin state of
+one job never leak into another; only registering the already imported
+plugins is repeated.  Plugin objects passed to the session are registered
+with every job and must be safe to use from several threads.  Caches below
+the cache directory are shared by all jobs as they are by separate
+processes.  Jobs writing to ``sys.stdout`` share it, concurrent jobs
+should write to ``--output`` files.
+"""
+from __future__ import absolute_import, division, print_function
+import contextlib
+import importlib
+
+from _pydistill import config as _config
+
+
+class Session(object):
+    """ runs jobs with the builtin and installed plugins loaded once.
+
+    :param plugins: plugin objects, or names of plugin modules, registered
+        with every job, as with :func:`main <_pydistill.config.main>`.
+    :param entrypoints: load the plugins of the ``pydistill11`` setuptools
+        entry points; they are looked up when the session is created.
+    """
+
+    def __init__(self, plugins=(), entrypoints=True):
+        from _pydistill.entrypoints import scan_entrypoints
+        self.plugins = tuple(plugins)
+        for name in _config.default_plugins:
+            importlib.import_module("_pydistill." + name)
+        self.entrypoints = []
+        if entrypoints:
+            self.entrypoints = scan_entrypoints("pydistill11")
+            for ep in self.entrypoints:
+                try:
+                    ep.load()
+                except Exception:
+                    # jobs loading it report the error
+                    pass
+
+    def _plugins(self, plugins):
+        return list(self.plugins) + list(plugins)
+
+    def run(self, args, plugins=()):
+        """ run the job ``args``, a list of command line arguments starting
+        with the sub-command, and return its exit code.
+
+        :param plugins: plugins registered with this job only.
+        """
+        return _config._run(list(args), self._plugins(plugins),
+                            self.entrypoints)
+
+    @contextlib.contextmanager
+    def config(self, args, plugins=()):
+        """ context manager yielding the parsed :class:`Config
+        <_pydistill.config.Config>` of the job ``args`` without running it,
+        e.g. to call :func:`parse_files <_pydistill.lang.parse_files>` with
+        it; the configure hooks run before it is yielded, the unconfigure
+        hooks on exit. """
+        config = _config._prepareconfig(list(args), self._plugins(plugins),
+                                        self.entrypoints)
+        try:
+            config._do_configure()
+            yield config
+        finally:
+            config._ensure_unconfigure()
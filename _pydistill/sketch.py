@@ -0,0 +1,425 @@
+"""
+mergeable streaming sketches summarizing columns in small, fixed memory.
+
+* :class:`HyperLogLog` estimates the number of distinct values,
+* :class:`TDigest` estimates quantiles of numeric values,
+* :class:`HeavyHitters` keeps the most frequent values, counted by a
+  :class:`CountMin` sketch.
+
+Every sketch sees each value once and can be merged with a sketch of the
+same parameters built over other chunks, files or processes; the merged
+sketch is the sketch of all their values.  Sketches round-trip through
+json so worker processes can send them back to their parent.
+:class:`TableSketch` combines them into a per column summary, as produced
+by ``distill csv --sketch``.
+"""
+from __future__ import absolute_import, division, print_function
+import base64
+import bisect
+import hashlib
+import math
+import struct
+from array import array
+
+#: default precision of :class:`HyperLogLog`, 2**14 registers (16 KiB) for
+#: a standard error of about 0.8%
+DEFAULT_PRECISION = 14
+
+#: default compression of :class:`TDigest`, bounding its number of centroids
+DEFAULT_COMPRESSION = 100
+
+#: default number of values kept by :class:`HeavyHitters`
+DEFAULT_TOP = 10
+
+#: quantiles reported by :meth:`TableSketch.summary`
+SUMMARY_QUANTILES = (0.25, 0.5, 0.75, 0.99)
+
+SUMMARY_HEADER = ["column", "count", "missing", "distinct", "min", "p25",
+                  "median", "p75", "p99", "max", "top"]
+
+_HASH = struct.Struct("<Q")
+
+
+def hash64(value):
+    """ return a 64 bit hash of the string ``value`` which is the same in
+    every process, unlike ``hash()``. """
+    return _HASH.unpack_from(hashlib.md5(value.encode("utf-8")).digest())[0]
+
+
+def _check_same(what, mine, theirs):
+    if mine != theirs:
+        raise ValueError("cannot merge %s with different parameters: "
+                         "%r != %r" % (what, mine, theirs))
+
+
+class HyperLogLog(object):
+    """ distinct count estimate from ``2**precision`` registers. """
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add_hash(self, h):
+        bits = 64 - self.precision
+        index = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add(self, value):
+        self.add_hash(hash64(value))
+
+    def merge(self, other):
+        _check_same("HyperLogLog", self.precision, other.precision)
+        self.registers = bytearray(max(a, b) for a, b in
+                                   zip(self.registers, other.registers))
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # small range correction: linear counting
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_json(self):
+        return dict(precision=self.precision, registers=base64.b64encode(
+            bytes(self.registers)).decode("ascii"))
+
+    @classmethod
+    def from_json(cls, data):
+        sketch = cls(data["precision"])
+        sketch.registers = bytearray(base64.b64decode(data["registers"]))
+        return sketch
+
+
+class TDigest(object):
+    """ quantile estimate from fewer than ``compression`` weighted
+    centroids; accurate at the tails, where centroids are kept small. """
+
+    def __init__(self, compression=DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.centroids = []
+        self.count = 0
+        self.min = self.max = None
+        self._buffer = []
+
+    def add(self, x):
+        self._buffer.append(x)
+        self.count += 1
+        if len(self._buffer) >= 10 * self.compression:
+            self._compress()
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        buffer = self._buffer
+        self._buffer = []
+        low, high = min(buffer), max(buffer)
+        if self.min is None or low < self.min:
+            self.min = low
+        if self.max is None or high > self.max:
+            self.max = high
+        self.centroids = self._merged(self.centroids + [[x, 1] for x in buffer])
+
+    def _merged(self, centroids):
+        # a centroid may span one unit of the scale function
+        # k(q) = compression / (2 pi) * asin(2q - 1), which keeps centroids
+        # near the tails small and their number below ``compression``
+        centroids.sort()
+        total = sum(w for _, w in centroids)
+        scale = self.compression / (2 * math.pi)
+        merged = [list(centroids[0])]
+        done = 0
+        klow = -scale * math.pi / 2
+        for mean, weight in centroids[1:]:
+            last = merged[-1]
+            q = min((done + last[1] + weight) / total, 1.0)
+            if scale * math.asin(2 * q - 1) - klow <= 1:
+                last[1] += weight
+                last[0] += (mean - last[0]) * weight / last[1]
+            else:
+                done += last[1]
+                klow = scale * math.asin(min(2.0 * done / total - 1, 1.0))
+                merged.append([mean, weight])
+        return merged
+
+    def merge(self, other):
+        _check_same("TDigest", self.compression, other.compression)
+        self._compress()
+        other._compress()
+        if not other.count:
+            return
+        self.count += other.count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.centroids = self._merged(
+            self.centroids + [list(c) for c in other.centroids])
+
+    def quantile(self, q):
+        """ return the estimated ``q`` quantile, ``None`` without values. """
+        self._compress()
+        if not self.count:
+            return None
+        # centroid means sit at the middle of their cumulative weight
+        positions = [0.0]
+        values = [self.min]
+        done = 0
+        for mean, weight in self.centroids:
+            positions.append(done + weight / 2.0)
+            values.append(mean)
+            done += weight
+        positions.append(float(done))
+        values.append(self.max)
+        target = q * done
+        i = bisect.bisect_left(positions, target, 1, len(positions) - 1)
+        x0, x1 = positions[i - 1], positions[i]
+        y0, y1 = values[i - 1], values[i]
+        if x1 == x0:
+            return y1
+        return y0 + (y1 - y0) * (target - x0) / (x1 - x0)
+
+    def to_json(self):
+        self._compress()
+        return dict(compression=self.compression, centroids=self.centroids,
+                    count=self.count, min=self.min, max=self.max)
+
+    @classmethod
+    def from_json(cls, data):
+        sketch = cls(data["compression"])
+        sketch.centroids = [list(c) for c in data["centroids"]]
+        sketch.count = data["count"]
+        sketch.min = data["min"]
+        sketch.max = data["max"]
+        return sketch
+
+
+class CountMin(object):
+    """ frequency estimates which never undercount, from ``depth`` rows of
+    ``width`` counters. """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.tables = [array("q", [0]) * width for _ in range(depth)]
+
+    def _indexes(self, h):
+        # double hashing: row i uses h1 + i * h2
+        h1, h2 = h & 0xffffffff, h >> 32
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add_hash(self, h, count=1):
+        """ count the value of hash ``h`` and return its new estimate. """
+        estimate = None
+        for table, index in zip(self.tables, self._indexes(h)):
+            table[index] += count
+            if estimate is None or table[index] < estimate:
+                estimate = table[index]
+        return estimate
+
+    def estimate_hash(self, h):
+        return min(table[index] for table, index in
+                   zip(self.tables, self._indexes(h)))
+
+    def merge(self, other):
+        _check_same("CountMin", (self.width, self.depth),
+                    (other.width, other.depth))
+        for table, theirs in zip(self.tables, other.tables):
+            for i, count in enumerate(theirs):
+                if count:
+                    table[i] += count
+
+    def to_json(self):
+        return dict(width=self.width, depth=self.depth, tables=[
+            base64.b64encode(table.tobytes()).decode("ascii")
+            for table in self.tables])
+
+    @classmethod
+    def from_json(cls, data):
+        sketch = cls(data["width"], data["depth"])
+        for i, encoded in enumerate(data["tables"]):
+            sketch.tables[i] = array("q")
+            sketch.tables[i].frombytes(base64.b64decode(encoded))
+        return sketch
+
+
+class HeavyHitters(object):
+    """ the ``top`` most frequent values with their estimated counts. """
+
+    def __init__(self, top=DEFAULT_TOP, countmin=None):
+        self.top = top
+        self.countmin = countmin if countmin is not None else CountMin()
+        self.candidates = {}
+        # lower bound of the smallest candidate count, estimates only grow
+        self._floor = 0
+
+    def add_hash(self, value, h):
+        estimate = self.countmin.add_hash(h)
+        candidates = self.candidates
+        if value in candidates or len(candidates) < self.top:
+            candidates[value] = estimate
+        elif estimate > self._floor:
+            low = min(candidates, key=candidates.get)
+            if estimate > candidates[low]:
+                del candidates[low]
+                candidates[value] = estimate
+            self._floor = min(candidates.values())
+
+    def add(self, value):
+        self.add_hash(value, hash64(value))
+
+    def merge(self, other):
+        _check_same("HeavyHitters", self.top, other.top)
+        self.countmin.merge(other.countmin)
+        values = set(self.candidates) | set(other.candidates)
+        estimates = dict((value, self.countmin.estimate_hash(hash64(value)))
+                         for value in values)
+        self.candidates = dict(sorted(estimates.items(),
+                                      key=lambda item: -item[1])[:self.top])
+        self._floor = 0
+
+    def most_common(self):
+        """ return ``(value, count)`` pairs, most frequent first. """
+        return sorted(self.candidates.items(),
+                      key=lambda item: (-item[1], item[0]))
+
+    def to_json(self):
+        return dict(top=self.top, countmin=self.countmin.to_json(),
+                    candidates=self.candidates)
+
+    @classmethod
+    def from_json(cls, data):
+        sketch = cls(data["top"], CountMin.from_json(data["countmin"]))
+        sketch.candidates = dict(data["candidates"])
+        return sketch
+
+
+class ColumnSketch(object):
+    """ the sketches of one column.
+
+    Empty fields count as missing.  Quantiles are only kept while every
+    value is a number.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION, top=DEFAULT_TOP):
+        self.count = 0
+        self.missing = 0
+        self.distinct = HyperLogLog(precision)
+        self.quantiles = TDigest()
+        self.heavy = HeavyHitters(top)
+
+    def update(self, values):
+        distinct = self.distinct
+        heavy = self.heavy
+        quantiles = self.quantiles
+        for value in values:
+            if not value:
+                self.missing += 1
+                continue
+            self.count += 1
+            h = hash64(value)
+            distinct.add_hash(h)
+            heavy.add_hash(value, h)
+            if quantiles is not None:
+                try:
+                    x = float(value)
+                except ValueError:
+                    quantiles = self.quantiles = None
+                else:
+                    if x == x:
+                        quantiles.add(x)
+
+    def merge(self, other):
+        self.count += other.count
+        self.missing += other.missing
+        self.distinct.merge(other.distinct)
+        self.heavy.merge(other.heavy)
+        if self.quantiles is None or other.quantiles is None:
+            self.quantiles = None
+        else:
+            self.quantiles.merge(other.quantiles)
+
+    def to_json(self):
+        return dict(count=self.count, missing=self.missing,
+                    distinct=self.distinct.to_json(),
+                    heavy=self.heavy.to_json(),
+                    quantiles=self.quantiles.to_json()
+                    if self.quantiles is not None else None)
+
+    @classmethod
+    def from_json(cls, data):
+        sketch = cls.__new__(cls)
+        sketch.count = data["count"]
+        sketch.missing = data["missing"]
+        sketch.distinct = HyperLogLog.from_json(data["distinct"])
+        sketch.heavy = HeavyHitters.from_json(data["heavy"])
+        sketch.quantiles = TDigest.from_json(data["quantiles"]) \
+            if data["quantiles"] is not None else None
+        return sketch
+
+
+class TableSketch(object):
+    """ a :class:`ColumnSketch` per column of ``header``. """
+
+    def __init__(self, header, precision=DEFAULT_PRECISION, top=DEFAULT_TOP):
+        self.header = list(header)
+        self.columns = [ColumnSketch(precision, top) for _ in self.header]
+
+    def update(self, rows):
+        """ add a chunk of rows; short rows are padded with empty fields,
+        which count as missing, fields beyond the header are ignored. """
+        width = len(self.header)
+        padding = [""] * width
+        rows = [row if len(row) == width else (list(row) + padding)[:width]
+                for row in rows]
+        for sketch, values in zip(self.columns, zip(*rows)):
+            sketch.update(values)
+
+    def merge(self, other):
+        if other.header != self.header:
+            raise ValueError("cannot merge sketches of different columns: "
+                             "%r != %r" % (self.header, other.header))
+        for sketch, theirs in zip(self.columns, other.columns):
+            sketch.merge(theirs)
+
+    def summary(self):
+        """ return one row of strings per column, see
+        :data:`SUMMARY_HEADER`. """
+        rows = []
+        for name, sketch in zip(self.header, self.columns):
+            row = [name, str(sketch.count), str(sketch.missing),
+                   str(sketch.distinct.count())]
+            digest = sketch.quantiles
+            if digest is not None and digest.count:
+                # quantile() folds buffered values into min and max
+                quantiles = [_number(digest.quantile(q))
+                             for q in SUMMARY_QUANTILES]
+                row.append(_number(digest.min))
+                row.extend(quantiles)
+                row.append(_number(digest.max))
+            else:
+                row.extend([""] * (len(SUMMARY_QUANTILES) + 2))
+            row.append(" ".join("%s:%d" % item
+                                for item in sketch.heavy.most_common()))
+            rows.append(row)
+        return rows
+
+    def to_json(self):
+        return dict(header=self.header,
+                    columns=[sketch.to_json() for sketch in self.columns])
+
+    @classmethod
+    def from_json(cls, data):
+        sketch = cls.__new__(cls)
+        sketch.header = data["header"]
+        sketch.columns = [ColumnSketch.from_json(column)
+                          for column in data["columns"]]
+        return sketch
+
+
+def _number(x):
+    return "%.6g" % x
@@ -0,0 +1,383 @@
+"""
+chunked reader/transform/writer core used by the ``csv`` sub-command.
+
+Inputs are never loaded as a whole: a reader yields bounded chunks of rows,
+every transform sees one chunk at a time and the writer flushes each chunk
+before the next one is read, so memory use only depends on the chunk size.
+"""
+from __future__ import absolute_import, division, print_function
+import csv
+import io
+import re
+
+#: default number of rows per chunk if no ``--chunk-size`` is given
+DEFAULT_CHUNK_ROWS = 10000
+
+_UNITS = {
+    '': 1,
+    'b': 1,
+    'k': 1024, 'kb': 1024, 'kib': 1024,
+    'm': 1024 ** 2, 'mb': 1024 ** 2, 'mib': 1024 ** 2,
+    'g': 1024 ** 3, 'gb': 1024 ** 3, 'gib': 1024 ** 3,
+}
+
+_size_re = re.compile(r'^\s*(\d+)\s*([a-zA-Z]*)\s*$')
+
+
+def _split_size(spec, what):
+    m = _size_re.match(str(spec))
+    if m is None or m.group(2).lower() not in _UNITS:
+        raise ValueError("invalid %s: %r" % (what, spec))
+    return int(m.group(1)), m.group(2).lower()
+
+
+def parse_bytes(spec):
+    """ parse a byte size like ``512``, ``64KB`` or ``1GB`` into bytes. """
+    value, unit = _split_size(spec, "size")
+    return value * _UNITS[unit]
+
+
+class ChunkSize(object):
+    """ upper bound of a chunk, either in rows or in (approximate) bytes.
+
+    Exactly one of ``rows`` and ``nbytes`` is set.
+    """
+
+    def __init__(self, rows=None, nbytes=None):
+        if (rows is None) == (nbytes is None):
+            raise ValueError("need exactly one of rows or nbytes")
+        if (nbytes if rows is None else rows) <= 0:
+            raise ValueError("chunk size must be positive")
+        self.rows = rows
+        self.nbytes = nbytes
+
+    @classmethod
+    def parse(cls, spec):
+        """ parse a ``--chunk-size`` value.
+
+        A plain number is a row count, a number followed by a unit
+        (``B``, ``KB``, ``MB``, ``GB``) is a byte budget::
+
+            ChunkSize.parse("5000")   # 5000 rows per chunk
+            ChunkSize.parse("64MB")   # about 64 MiB of field data per chunk
+        """
+        if isinstance(spec, cls):
+            return spec
+        value, unit = _split_size(spec, "chunk size")
+        if not unit:
+            return cls(rows=value)
+        return cls(nbytes=value * _UNITS[unit])
+
+    def __repr__(self):
+        if self.rows is not None:
+            return "<ChunkSize rows=%d>" % self.rows
+        return "<ChunkSize nbytes=%d>" % self.nbytes
+
+
+def iter_chunks(rows, chunksize):
+    """ group an iterable of rows into lists bounded by ``chunksize``.
+
+    The byte size of a row is its ``nbytes`` attribute if it has one,
+    otherwise it is estimated from the length of its fields plus one
+    separator per field, which is what the row takes up on disk for
+    unquoted single-byte data.
+    """
+    chunksize = ChunkSize.parse(chunksize)
+    chunk = []
+    if chunksize.rows is not None:
+        limit = chunksize.rows
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= limit:
+                yield chunk
+                chunk = []
+    else:
+        limit = chunksize.nbytes
+        size = 0
+        for row in rows:
+            chunk.append(row)
+            size += _rowsize(row)
+            if size >= limit:
+                yield chunk
+                chunk = []
+                size = 0
+    if chunk:
+        yield chunk
+
+
+def _rowsize(row):
+    try:
+        return row.nbytes
+    except AttributeError:
+        return sum(map(len, row)) + len(row)
+
+
+def column_indexes(header, columns):
+    """ return the indexes of the column names ``columns`` in ``header``;
+    without a header columns are given by index. """
+    if header is None:
+        return [int(name) for name in columns]
+    indexes = []
+    for name in columns:
+        if name not in header:
+            raise ValueError("unknown column %r" % (name,))
+        indexes.append(header.index(name))
+    return indexes
+
+
+class _RecordLines(object):
+    """ feeds the lines of a stream to ``csv.reader`` and keeps the lines of
+    the record being parsed. """
+
+    def __init__(self, stream):
+        self._lines = iter(stream)
+        self._record = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self._lines)
+        self._record.append(line)
+        return line
+
+    next = __next__
+
+    def take(self):
+        """ return the raw text of the last record, without the newline
+        ending it, and forget it. """
+        text = "".join(self._record)
+        del self._record[:]
+        if text.endswith("\n"):
+            text = text[:-1]
+        return text
+
+
+class CsvReader(object):
+    """ reads a csv text stream as a header followed by chunks of rows.
+
+    ``columns`` and ``pattern`` select columns and records as with
+    :class:`MmapCsvReader <_pydistill.tokenizer.MmapCsvReader>`, but only
+    after records are parsed; ``pattern`` is matched against the raw text
+    of every record, like there.  Used as a context manager the reader
+    closes its stream on exit.
+    """
+
+    def __init__(self, stream, chunksize=DEFAULT_CHUNK_ROWS, header=True,
+                 columns=None, pattern=None, fixed=False, **fmtparams):
+        self.stream = stream
+        self.chunksize = ChunkSize.parse(chunksize)
+        lines = _RecordLines(stream) if pattern is not None else stream
+        self._rows = csv.reader(lines, **fmtparams)
+        self.header = None
+        if header:
+            self.header = next(self._rows, None)
+        if pattern is not None:
+            search = re.compile(re.escape(pattern) if fixed else pattern,
+                                re.MULTILINE).search
+            lines.take()
+            self._rows = (row for row in self._rows if search(lines.take()))
+        if columns is not None:
+            indexes = column_indexes(self.header, columns)
+            if self.header is not None:
+                self.header = [self.header[i] for i in indexes]
+            self._rows = ([row[i] if i < len(row) else '' for i in indexes]
+                          for row in self._rows)
+
+    def __iter__(self):
+        return iter_chunks(self._rows, self.chunksize)
+
+    def close(self):
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CsvWriter(object):
+    """ writes a header and chunks of rows to a csv text stream. """
+
+    def __init__(self, stream, **fmtparams):
+        self.stream = stream
+        self._writer = csv.writer(stream, **fmtparams)
+        self._header_written = False
+
+    def writeheader(self, header):
+        if header is not None and not self._header_written:
+            self._writer.writerow(header)
+        self._header_written = True
+
+    def write(self, chunk):
+        self._writer.writerows(chunk)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def open_text(path, mode='r', encoding='utf-8', threads=1):
+    """ open ``path`` the way the csv module expects text streams.
+
+    Inputs compressed with gzip, bzip2 or xz are decompressed while they
+    are read, by up to ``threads`` threads, see :mod:`_pydistill.compress`.
+    """
+    if mode == 'r':
+        from _pydistill.compress import open_input
+        raw = open_input(path, threads)
+        if raw is not None:
+            return io.TextIOWrapper(raw, encoding=encoding, newline='')
+    return io.open(str(path), mode, encoding=encoding, newline='')
+
+
+class Stream(object):
+    """ drives chunks from a reader through transforms into a writer.
+
+    :param reader: iterable of chunks (lists of rows), usually a
+        :class:`CsvReader`.
+    :param writer: object with a ``write(chunk)`` method.
+    :param transforms: callables taking a chunk and returning the
+        transformed chunk.
+
+    Only a single chunk is alive at any time.
+    """
+
+    def __init__(self, reader, writer, transforms=()):
+        self.reader = reader
+        self.writer = writer
+        self.transforms = list(transforms)
+        self.stats = {'chunks': 0, 'rows_in': 0, 'rows_out': 0}
+
+    def run(self):
+        stats = self.stats
+        for chunk in self.reader:
+            stats['chunks'] += 1
+            stats['rows_in'] += len(chunk)
+            for transform in self.transforms:
+                chunk = transform(chunk)
+                # len() as arrays have no truth value
+                if chunk is None or not len(chunk):
+                    break
+            else:
+                stats['rows_out'] += len(chunk)
+                self.writer.write(chunk)
+        return stats
+
+
+def _is_wrapper(hookimpl):
+    return hookimpl.hookwrapper or getattr(hookimpl, "wrapper", False)
+
+
+def hook_chain(pluginmanager, name, argname, **kwargs):
+    """ return one callable per implementation of the hook ``name``, in the
+    order pluggy would call them.
+
+    Every callable takes the value of ``argname`` and calls its
+    implementation with it and ``kwargs``, so the implementations can be
+    chained, each one receiving the result of the previous one.  The calls
+    are dispatched by pluggy, so hook wrappers and ``--hook-durations`` see
+    every one of them.
+    """
+    return [_bind(hookcaller, plugin, argname, kwargs)
+            for plugin, hookcaller in _single_callers(pluginmanager, name)]
+
+
+def _single_callers(pluginmanager, name):
+    """ yield ``(plugin, hookcaller)`` for every implementation of the hook
+    ``name``, in calling order; each hookcaller calls only that
+    implementation and the hook wrappers. """
+    hookimpls = [hookimpl for hookimpl in
+                 getattr(pluginmanager.hook, name).get_hookimpls()
+                 if not _is_wrapper(hookimpl)]
+    for hookimpl in reversed(hookimpls):
+        others = [other.plugin for other in hookimpls if other is not hookimpl]
+        yield hookimpl.plugin, pluginmanager.subset_hook_caller(name, others)
+
+
+def _bind(hookcaller, plugin, argname, kwargs):
+    kwargs = dict(kwargs)
+
+    def call(value):
+        kwargs[argname] = value
+        results = hookcaller(**kwargs)
+        return results[0] if results else None
+
+    call.plugin = plugin
+    return call
+
+
+def per_record(transforms):
+    """ return a chunk transform applying the record ``transforms`` in turn
+    to every record, dropping records for which one returns ``None``. """
+    transforms = list(transforms)
+
+    def transform(chunk):
+        out = []
+        for record in chunk:
+            for func in transforms:
+                record = func(record)
+                if record is None:
+                    break
+            else:
+                out.append(record)
+        return out
+
+    return transform
+
+
+def batched(transforms, batchsize):
+    """ return a chunk transform running the chunk ``transforms`` in turn
+    on batches of at most ``batchsize`` records; the results are joined
+    into one list unless the chunk is a single batch. """
+    transforms = list(transforms)
+
+    def run(batch):
+        for transform in transforms:
+            batch = transform(batch)
+            if batch is None or not len(batch):
+                return None
+        return batch
+
+    def transform(chunk):
+        if batchsize is None or len(chunk) <= batchsize:
+            return run(chunk)
+        out = []
+        for i in range(0, len(chunk), batchsize):
+            batch = run(chunk[i:i + batchsize])
+            if batch is not None:
+                out.extend(batch)
+        return out
+
+    return transform
+
+
+def batch_sizes(pluginmanager, name, **kwargs):
+    """ return the batch size every plugin implementing the hook ``name``
+    asks for, by plugin; ``None`` means no limit. """
+    sizes = {}
+    for plugin, hookcaller in _single_callers(pluginmanager, name):
+        results = hookcaller(**kwargs)
+        size = results[0] if results else None
+        if size is not None and size <= 0:
+            raise ValueError("batch sizes must be positive: %r" % (size,))
+        sizes[plugin] = size
+    return sizes
+
+
+def rebatched(transforms, sizes):
+    """ return chunk transforms running each of the ``transforms`` made by
+    :func:`hook_chain` on batches of the size its plugin asks for in
+    ``sizes``.
+
+    Records are only rebatched where the size changes, so a plugin asking
+    for small batches does not put the others on small batches too.
+    """
+    groups = []
+    for transform in transforms:
+        size = sizes.get(getattr(transform, "plugin", None))
+        if groups and groups[-1][0] == size:
+            groups[-1][1].append(transform)
+        else:
+            groups.append((size, [transform]))
+    return [batched(group, size) for size, group in groups]
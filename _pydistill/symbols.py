@@ -0,0 +1,250 @@
+"""
+persistent symbol table and use-graph of source files, kept in sqlite.
+
+Language plugins report the symbols a parsed file defines and the
+references between symbols through ``pydistill_lang_symbols``.  The index
+remembers per file its size, mtime and parser, so :func:`update_index`
+only re-parses the files which changed since the last update.  Questions
+like "where is this symbol defined and what does it transitively depend
+on" are answered with indexed lookups and recursive queries instead of
+loading the whole program.
+"""
+from __future__ import absolute_import, division, print_function
+import os
+import sqlite3
+
+import py
+
+#: changes whenever the schema changes, older indexes are rebuilt
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    parser TEXT
+);
+CREATE TABLE symbols (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    kind TEXT,
+    line INTEGER
+);
+CREATE TABLE refs (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    src TEXT NOT NULL,
+    dst TEXT NOT NULL,
+    kind TEXT
+);
+CREATE INDEX symbols_name ON symbols(name);
+CREATE INDEX symbols_file ON symbols(file_id);
+CREATE INDEX refs_src ON refs(src);
+CREATE INDEX refs_dst ON refs(dst);
+CREATE INDEX refs_file ON refs(file_id);
+"""
+
+_CLOSURE = """
+WITH RECURSIVE closure(name) AS (
+    SELECT ?
+    UNION
+    SELECT refs.{next} FROM refs JOIN closure ON refs.{this} = closure.name
+    {kinds}
+)
+SELECT name FROM closure WHERE name != ? ORDER BY name
+"""
+
+
+class Definition(object):
+    """ where a symbol is defined. """
+
+    __slots__ = ("name", "kind", "path", "line")
+
+    def __init__(self, name, kind, path, line):
+        self.name = name
+        self.kind = kind
+        self.path = path
+        self.line = line
+
+    def __eq__(self, other):
+        return (isinstance(other, Definition) and
+                (self.name, self.kind, self.path, self.line) ==
+                (other.name, other.kind, other.path, other.line))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "<Definition %s %s at %s:%s>" % (self.kind, self.name,
+                                                self.path, self.line)
+
+
+class SymbolIndex(object):
+    """ symbol definitions and symbol references of source files.
+
+    :param path: the sqlite database, created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        try:
+            self._connect()
+        except sqlite3.DatabaseError:
+            # not a database, the index is only a cache
+            self._db.close()
+            os.remove(self.path)
+            self._connect()
+
+    def _connect(self):
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._ensure_schema()
+
+    def _ensure_schema(self):
+        db = self._db
+        try:
+            row = db.execute("SELECT value FROM meta WHERE key = 'schema'"
+                             ).fetchone()
+        except sqlite3.DatabaseError:
+            row = None
+        if row is not None and row[0] == str(SCHEMA_VERSION):
+            return
+        with db:
+            for (name,) in db.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'"
+                    ).fetchall():
+                db.execute("DROP TABLE %s" % name)
+            db.executescript(_SCHEMA)
+            db.execute("INSERT INTO meta VALUES ('schema', ?)",
+                       (str(SCHEMA_VERSION),))
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    #
+    # updating
+    #
+    def is_current(self, path, parser):
+        """ true if ``path`` is indexed as it is on disk, by ``parser``. """
+        try:
+            st = os.stat(str(path))
+        except OSError:
+            return False
+        row = self._db.execute(
+            "SELECT size, mtime, parser FROM files WHERE path = ?",
+            (str(path),)).fetchone()
+        return row is not None and tuple(row) == (st.st_size, st.st_mtime,
+                                                  parser)
+
+    def update_file(self, path, parser, definitions, references):
+        """ replace what is indexed for ``path``.
+
+        :param definitions: ``(name, kind, line)`` of every defined symbol
+        :param references: ``(src, dst, kind)``: symbol ``src`` uses
+            symbol ``dst``
+        """
+        st = os.stat(str(path))
+        db = self._db
+        with db:
+            db.execute("DELETE FROM files WHERE path = ?", (str(path),))
+            file_id = db.execute(
+                "INSERT INTO files (path, size, mtime, parser) "
+                "VALUES (?, ?, ?, ?)",
+                (str(path), st.st_size, st.st_mtime, parser)).lastrowid
+            db.executemany(
+                "INSERT INTO symbols (file_id, name, kind, line) "
+                "VALUES (?, ?, ?, ?)",
+                ((file_id, name, kind, line)
+                 for name, kind, line in definitions))
+            db.executemany(
+                "INSERT INTO refs (file_id, src, dst, kind) "
+                "VALUES (?, ?, ?, ?)",
+                ((file_id, src, dst, kind) for src, dst, kind in references))
+
+    def remove_files(self, paths):
+        with self._db:
+            self._db.executemany("DELETE FROM files WHERE path = ?",
+                                 ((str(path),) for path in paths))
+
+    def files(self):
+        return [py.path.local(path) for (path,) in self._db.execute(
+            "SELECT path FROM files ORDER BY path")]
+
+    #
+    # queries
+    #
+    def definitions(self, name):
+        """ return the :class:`Definition` objects of ``name``. """
+        return [Definition(*row) for row in self._db.execute(
+            "SELECT symbols.name, symbols.kind, files.path, symbols.line "
+            "FROM symbols JOIN files ON symbols.file_id = files.id "
+            "WHERE symbols.name = ? ORDER BY files.path, symbols.line",
+            (name,))]
+
+    def dependencies(self, name, kinds=None):
+        """ return the names of all symbols ``name`` transitively uses,
+        following only references of ``kinds`` if given. """
+        return self._closure(name, "src", "dst", kinds)
+
+    def dependents(self, name, kinds=None):
+        """ return the names of all symbols transitively using ``name``. """
+        return self._closure(name, "dst", "src", kinds)
+
+    def _closure(self, name, this, next, kinds):
+        params = [name]
+        condition = ""
+        if kinds:
+            kinds = list(kinds)
+            condition = "WHERE refs.kind IN (%s)" % ", ".join("?" * len(kinds))
+            params.extend(kinds)
+        params.append(name)
+        sql = _CLOSURE.format(this=this, next=next, kinds=condition)
+        return [row[0] for row in self._db.execute(sql, params)]
+
+
+def get_symbolindex(config):
+    """ return the :class:`SymbolIndex` below the cache directory. """
+    from _pydistill.cacheprovider import getcache
+    index = getattr(config, "_symbolindex", None)
+    if index is None:
+        path = getcache(config).makedir("symbols").join("index.sqlite")
+        index = config._symbolindex = SymbolIndex(path)
+    return index
+
+
+def update_index(config, paths, workers=1):
+    """ bring the symbol index up to date with the source files ``paths``
+    and return it.
+
+    Only files which changed since they were indexed, or whose parser
+    changed, are parsed (see :func:`parse_files
+    <_pydistill.lang.parse_files>`); indexed files which no longer exist
+    are dropped.
+    """
+    from _pydistill.lang import get_langmanager, get_parser, parse_files
+    index = get_symbolindex(config)
+    paths = [py.path.local(path) for path in paths]
+    parsers = {}
+    stale = []
+    for path in paths:
+        parser = get_parser(config, path)
+        parsers[path] = "%s-%s" % (parser.name, parser.version)
+        if not index.is_current(path, parsers[path]):
+            stale.append(path)
+    index.remove_files(path for path in index.files() if not path.check())
+    if stale:
+        hook = get_langmanager(config).hook
+        for path, tree in parse_files(config, stale, workers).items():
+            found = hook.pydistill_lang_symbols(config=config, path=path,
+                                                tree=tree)
+            definitions, references = found or ((), ())
+            index.update_file(path, parsers[path], definitions, references)
+    return index
@@ -0,0 +1,283 @@
+"""
+columnar, NumPy backed representation of distilled csv data.
+
+A :class:`ColumnTable` keeps every column as one contiguous, typed array so
+plugins can work on whole columns at once instead of looping over rows::
+
+    def pydistill_csv_table(config, table):
+        table.filter(table["price"] > 0)
+        table["total"] = table["price"] * table["qty"]
+
+NumPy is only required when the ``csv`` sub-command runs with
+``--columnar``; importing this module without it raises ``ImportError``.
+"""
+from __future__ import absolute_import, division, print_function
+from collections import OrderedDict
+
+import numpy as np
+
+#: column dtypes tried in order when converting the text of a column
+CANDIDATE_DTYPES = (np.int64, np.float64)
+
+#: column types of a :class:`Schema`, tried in order when inferring one
+TYPES = ("bool", "int", "float", "datetime", "category", "string")
+
+#: the types a column is widened to, in order, if a chunk does not fit;
+#: ``category`` is only inferred from the first chunk, whose values are
+#: all known
+WIDER_TYPES = {
+    "bool": ("string",),
+    "int": ("float", "string"),
+    "float": ("string",),
+    "datetime": ("string",),
+    "category": ("string",),
+    "string": (),
+}
+
+#: most distinct values of a ``category`` column
+CATEGORY_MAX_VALUES = 256
+
+#: longest integers held exactly by a float64
+_FLOAT_DIGITS = 15
+
+
+def _lossless(text, array):
+    """ whether the typed ``array`` holds everything ``text`` says:
+    integers must be written canonically, without leading zeros or signs,
+    and floats must not round integers. """
+    if array.dtype.kind == "i":
+        return bool((array.astype(np.str_) == text).all())
+    if array.dtype.kind == "f":
+        digits = np.char.lstrip(text, "-")
+        length = np.char.str_len(digits)
+        integral = np.char.isdigit(digits)
+        return not (integral & ((length > _FLOAT_DIGITS) | (length > 1) &
+                                np.char.startswith(digits, "0"))).any()
+    return True
+
+
+def column_from_text(values, dtype=None):
+    """ convert a sequence of field strings to a typed array.
+
+    Without an explicit ``dtype`` the narrowest of :data:`CANDIDATE_DTYPES`
+    that holds every value without loss is used, falling back to a fixed
+    width unicode array: ``00700`` or integers beyond int64 stay text.  The
+    conversion runs inside NumPy, not per value in Python.
+    """
+    text = np.asarray(values, dtype=np.str_)
+    if dtype is not None:
+        return text.astype(dtype)
+    for candidate in CANDIDATE_DTYPES:
+        try:
+            array = text.astype(candidate)
+        except (ValueError, OverflowError):
+            continue
+        if _lossless(text, array):
+            return array
+    return text
+
+
+def convert(text, type):
+    """ convert the unicode array ``text`` to an array of the column type
+    ``type``, or raise ``ValueError`` if a value does not fit without loss.
+
+    Empty fields are NaN in ``float`` and NaT in ``datetime`` columns.
+    ``category`` columns stay unicode arrays, their number of distinct
+    values is checked by :class:`Schema`.
+    """
+    try:
+        if type == "bool":
+            lower = np.char.lower(text)
+            if not np.isin(lower, ("true", "false")).all():
+                raise ValueError("not a bool column")
+            return lower == "true"
+        if type == "int":
+            array = text.astype(np.int64)
+        elif type == "float":
+            array = np.where(text == "", "nan", text).astype(np.float64)
+        elif type == "datetime":
+            return text.astype("datetime64[us]")
+    except OverflowError as e:
+        raise ValueError(str(e))
+    if type in ("int", "float"):
+        if not _lossless(text, array):
+            raise ValueError("not a lossless %s column" % (type,))
+        return array
+    if type in ("category", "string"):
+        return text
+    raise ValueError("unknown column type %r" % (type,))
+
+
+class Schema(object):
+    """ the types of the columns of a csv input, see :data:`TYPES`.
+
+    The type of a column is inferred from the first chunk it appears in
+    and widened, see :data:`WIDER_TYPES`, when a later chunk does not fit.
+    Every chunk is converted with a few vectorized NumPy operations per
+    column, not per value.
+    """
+
+    def __init__(self, types=None, categories=None):
+        self.types = OrderedDict(types or ())
+        self.categories = dict((name, set(values)) for name, values in
+                               (categories or {}).items())
+
+    def _convert(self, name, text, types):
+        for type in types:
+            try:
+                array = convert(text, type)
+            except ValueError:
+                continue
+            if type == "category":
+                seen = self.categories.get(name, set())
+                seen = seen.union(np.unique(text).tolist())
+                if len(seen) > CATEGORY_MAX_VALUES or \
+                        len(seen) > len(text) // 2 and name not in self.types:
+                    continue
+                self.categories[name] = seen
+            else:
+                self.categories.pop(name, None)
+            self.types[name] = type
+            return array
+        raise AssertionError("string columns take any value")
+
+    def column(self, name, values):
+        """ return the typed array of the field strings ``values`` of column
+        ``name``, widening its type if they do not fit. """
+        text = np.asarray(values, dtype=np.str_)
+        type = self.types.get(name)
+        if type is None:
+            return self._convert(name, text, TYPES)
+        return self._convert(name, text, (type,) + WIDER_TYPES[type])
+
+    def to_json(self):
+        return dict(types=[[name, type] for name, type in self.types.items()],
+                    categories=dict((name, sorted(values)) for name, values
+                                    in self.categories.items()))
+
+    @classmethod
+    def from_json(cls, data):
+        if not data:
+            return cls()
+        return cls(data["types"], data["categories"])
+
+
+def column_to_text(array):
+    """ convert a typed array back to a unicode array, the inverse of
+    :func:`column_from_text`; NaN and NaT are empty fields. """
+    if array.dtype.kind == "M":
+        text = np.datetime_as_string(array, unit="auto")
+    else:
+        text = array.astype(np.str_)
+    if array.dtype.kind in "fM":
+        text[np.isnan(array)] = ""
+    return text
+
+
+class ColumnTable(object):
+    """ an ordered collection of equally long, named NumPy arrays.
+
+    Tables built :meth:`from_rows` remember the text of their columns and
+    write it back unchanged for the columns which were not assigned since;
+    assign a column again after changing single values in place.
+    """
+
+    def __init__(self, columns=()):
+        self._columns = OrderedDict()
+        self._text = {}
+        for name, array in (columns.items() if hasattr(columns, 'items')
+                            else columns):
+            self[name] = array
+
+    @classmethod
+    def from_rows(cls, header, rows, dtypes=None, schema=None):
+        """ build a table from a header and a chunk of csv rows.
+
+        :param dtypes: optional mapping of column name to dtype; columns not
+            mentioned are inferred with :func:`column_from_text`.
+        :param schema: optional :class:`Schema` converting (and updated
+            with) the columns not mentioned in ``dtypes``.
+
+        Short rows are padded with empty fields, rows with more fields than
+        the header raise ``ValueError``.
+        """
+        dtypes = dtypes or {}
+        width = len(header)
+        widths = set(len(row) for row in rows)
+        if widths and max(widths) > width:
+            raise ValueError("a row has %d fields, the header has %d" % (
+                max(widths), width))
+        if widths and min(widths) < width:
+            rows = [list(row) + [""] * (width - len(row)) for row in rows]
+        if rows:
+            fields = list(zip(*rows))
+        else:
+            fields = [()] * width
+        table = cls()
+        for name, values in zip(header, fields):
+            text = np.asarray(values, dtype=np.str_)
+            if name in dtypes or schema is None:
+                table[name] = column_from_text(text, dtypes.get(name))
+            else:
+                table[name] = schema.column(name, text)
+            table._text[name] = text
+        return table
+
+    @property
+    def header(self):
+        return list(self._columns)
+
+    @property
+    def dtypes(self):
+        return OrderedDict((name, a.dtype) for name, a in self._columns.items())
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self._columns.values())
+
+    def __len__(self):
+        for array in self._columns.values():
+            return len(array)
+        return 0
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def __setitem__(self, name, array):
+        array = np.ascontiguousarray(array)
+        if array.ndim != 1:
+            raise ValueError("column %r must be one dimensional" % (name,))
+        if list(self._columns) not in ([], [name]) and len(array) != len(self):
+            raise ValueError("column %r has %d values, table has %d rows" % (
+                name, len(array), len(self)))
+        self._columns[name] = array
+        self._text.pop(name, None)
+
+    def __delitem__(self, name):
+        del self._columns[name]
+        self._text.pop(name, None)
+
+    def filter(self, selector):
+        """ keep only the rows picked by a boolean mask or index array. """
+        for name, array in self._columns.items():
+            self._columns[name] = array[selector]
+        for name, text in self._text.items():
+            self._text[name] = text[selector]
+
+    def to_rows(self):
+        """ return the table as a list of rows of strings for writing.
+
+        Columns read :meth:`from_rows` and not assigned since are written
+        as they were read; NaN and NaT, the missing values, are written as
+        empty fields.
+        """
+        columns = [self._text[name].tolist() if name in self._text
+                   else column_to_text(a).tolist()
+                   for name, a in self._columns.items()]
+        return [list(row) for row in zip(*columns)]
+
+    def __repr__(self):
+        return "<ColumnTable rows=%d columns=%r>" % (len(self), self.header)
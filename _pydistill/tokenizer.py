@@ -0,0 +1,393 @@
+"""
+memory mapped, zero-copy csv tokenizer.
+
+The source file is ``mmap``-ed and split into rows of byte offsets; the
+bytes of a field are only decoded when the field is actually accessed.
+Unquoted lines, by far the common case, are split with ``mmap.find`` without
+looking at single bytes from Python.
+
+Projections and prefilters are pushed down into the tokenizer: lines are
+only split up to the last selected column, and records are skipped without
+being split at all up to the next match of the prefilter, see
+:func:`prefilter`.
+"""
+from __future__ import absolute_import, division, print_function
+import codecs
+import io
+import itertools
+import mmap
+import re
+
+from _pydistill.stream import (DEFAULT_CHUNK_ROWS, ChunkSize, column_indexes,
+                              iter_chunks)
+
+# values for the per field quoting state; the span of a _MIXED field, with
+# text after its closing quote, includes the quotes
+_UNQUOTED, _QUOTED, _ESCAPED, _MIXED = 0, 1, 2, 3
+
+
+class CsvError(ValueError):
+    """ malformed csv data found while tokenizing. """
+
+
+class IncompleteRecord(CsvError):
+    """ a quoted field is still open at the end of the data. """
+
+
+class Row(object):
+    """ one csv record as offsets into a shared buffer.
+
+    Indexing and iterating return decoded text; :meth:`raw` returns the
+    undecoded field as a ``memoryview`` slice of the buffer.
+    """
+    __slots__ = ('_view', '_spans', '_quoting', '_encoding', '_quotechar',
+                 'end')
+
+    def __init__(self, view, spans, quoting, encoding, end, quotechar=u'"'):
+        self._view = view
+        self._spans = spans
+        self._quoting = quoting
+        self._encoding = encoding
+        self._quotechar = quotechar
+        #: buffer offset just behind the record and its line terminator
+        self.end = end
+
+    def __len__(self):
+        return len(self._spans)
+
+    @property
+    def nbytes(self):
+        """ approximate size of the record on disk. """
+        return sum(end - start for start, end in self._spans) + len(self._spans)
+
+    def raw(self, i):
+        start, end = self._spans[i]
+        return self._view[start:end]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, end = self._spans[i]
+        value = codecs.decode(self._view[start:end], self._encoding)
+        if self._quoting is not None and self._quoting[i] != _UNQUOTED:
+            q = self._quotechar
+            if self._quoting[i] == _MIXED:
+                return _unquote_mixed(value, q)
+            if self._quoting[i] == _ESCAPED:
+                value = value.replace(q + q, q)
+        return value
+
+    def __iter__(self):
+        for i in range(len(self._spans)):
+            yield self[i]
+
+    def tolist(self):
+        return list(self)
+
+    def __repr__(self):
+        return "<Row %r>" % (self.tolist(),)
+
+
+def _unquote_mixed(value, q):
+    # like csv.reader: the quoted part, then the rest verbatim
+    j = 1
+    while True:
+        k = value.find(q, j)
+        if value[k + 1:k + 2] != q:
+            break
+        j = k + 2
+    return value[1:k].replace(q + q, q) + value[k + 1:]
+
+
+def prefilter(buf, pattern, fixed=False):
+    """ return a function finding the matches of the bytes ``pattern`` in
+    ``buf``, as used by :func:`iter_rows`.
+
+    ``pattern`` is a regular expression, in which ``^`` and ``$`` match at
+    line boundaries, or a literal if ``fixed`` is true.  The function
+    returns the start of the first match in ``buf[pos:end]``, ``-1`` if
+    there is none.
+    """
+    if fixed:
+        find = buf.find
+        return lambda pos, end: find(pattern, pos, end)
+    search = re.compile(pattern, re.MULTILINE).search
+
+    def match(pos, end):
+        found = search(buf, pos, end)
+        return found.start() if found is not None else -1
+
+    return match
+
+
+def _project(spans, quoting, columns, empty):
+    # fields missing in short records are empty
+    count = len(spans)
+    spans = [spans[i] if i < count else (empty, empty) for i in columns]
+    if quoting is not None:
+        quoting = [quoting[i] if i < count else _UNQUOTED for i in columns]
+    return spans, quoting
+
+
+def iter_rows(buf, delimiter=b',', quotechar=b'"', encoding='utf-8',
+              start=0, end=None, columns=None, match=None, partial=True):
+    """ yield a :class:`Row` for every record of ``buf[start:end]``.
+
+    ``buf`` is any object supporting ``find`` and slicing (``bytes`` or an
+    ``mmap``).  Blank lines are empty records, ``\\r\\n`` line ends are
+    accepted.  Malformed quoting is read like :func:`csv.reader` does: text
+    after a closing quote belongs to the field, and with ``partial`` a
+    quoted field still open at ``end`` runs up to it; without ``partial``
+    this raises :class:`IncompleteRecord`.
+
+    :param columns: indexes of the fields to keep, in this order; unquoted
+        lines are not split beyond the last of them.
+    :param match: a :func:`prefilter`; only records whose raw text,
+        without the newline ending them, contains a match are yielded, the
+        others are not split.
+    """
+    if len(delimiter) != 1 or len(quotechar) != 1:
+        raise ValueError("delimiter and quotechar must be single bytes")
+    view = memoryview(buf)
+    find = buf.find
+    quotetext = quotechar.decode(encoding)
+    if end is None:
+        end = len(buf)
+    last = max(columns) if columns else None
+    nextmatch = -1
+    pos = start
+    while pos < end:
+        if match is not None:
+            if nextmatch < pos:
+                nextmatch = match(pos, end)
+                if nextmatch < 0:
+                    return
+            # without quotes every line before the one of the match is a
+            # record which cannot match
+            linestart = buf.rfind(b'\n', pos, nextmatch)
+            if linestart >= 0 and find(quotechar, pos, linestart) < 0:
+                pos = linestart + 1
+            recstart = pos
+        nl = find(b'\n', pos, end)
+        if nl < 0:
+            nl = end
+        if find(quotechar, pos, nl) < 0:
+            lineend = nl
+            if lineend > pos and buf[lineend - 1:lineend] == b'\r':
+                lineend -= 1
+            spans = []
+            fieldstart = pos
+            # a blank line is a record without fields, as with csv.reader
+            while lineend > pos:
+                d = find(delimiter, fieldstart, lineend)
+                if d < 0:
+                    spans.append((fieldstart, lineend))
+                    break
+                spans.append((fieldstart, d))
+                if last is not None and len(spans) > last:
+                    break
+                fieldstart = d + 1
+            quoting = None
+            pos = min(nl + 1, end)
+        else:
+            spans, quoting, pos = _split_quoted(buf, pos, end, delimiter,
+                                                quotechar, partial)
+            pos = min(pos, end)
+            lineend = spans[-1][1]
+        if match is not None and (nextmatch >= pos or
+                                  match(recstart, _rawend(buf, recstart,
+                                                          pos)) < 0):
+            # the match starts in a later record or does not fit in this one
+            continue
+        if columns is not None:
+            spans, quoting = _project(spans, quoting, columns, lineend)
+        yield Row(view, spans, quoting, encoding, pos, quotetext)
+
+
+def _rawend(buf, start, end):
+    """ the end of the raw text of the record ``buf[start:end]``, without
+    its newline; like for grep a ``\\r`` before it is part of the text. """
+    if end > start and buf[end - 1:end] == b'\n':
+        end -= 1
+    return end
+
+
+def _split_quoted(buf, pos, end, delimiter, quotechar, partial=True):
+    """ split one record which contains quote characters.
+
+    Returns the field spans, the per field quoting state and the offset of
+    the next record; quoted fields may span several lines.
+    """
+    find = buf.find
+    spans = []
+    quoting = []
+    i = pos
+    while True:
+        if buf[i:i + 1] == quotechar:
+            j = i + 1
+            state = _QUOTED
+            while True:
+                k = find(quotechar, j, end)
+                if k < 0:
+                    if not partial:
+                        raise IncompleteRecord(
+                            "unterminated quoted field at byte %d" % i)
+                    spans.append((i + 1, end))
+                    quoting.append(state)
+                    return spans, quoting, end
+                if buf[k + 1:k + 2] == quotechar:
+                    j = k + 2
+                    state = _ESCAPED
+                    continue
+                break
+            spans.append((i + 1, k))
+            quoting.append(state)
+            i = k + 1
+            after = buf[i:i + 1]
+            if after == delimiter:
+                i += 1
+                continue
+            if i >= end or after == b'\n':
+                return spans, quoting, i + 1
+            if after == b'\r' and buf[i + 1:i + 2] in (b'\n', b''):
+                return spans, quoting, i + 2
+            # text after the closing quote, the field ends at the delimiter
+            nl = find(b'\n', i, end)
+            if nl < 0:
+                nl = end
+            d = find(delimiter, i, nl)
+            fieldend = nl if d < 0 else d
+            if d < 0 and buf[fieldend - 1:fieldend] == b'\r':
+                fieldend -= 1
+            spans[-1] = (spans[-1][0] - 1, fieldend)
+            quoting[-1] = _MIXED
+            if d < 0:
+                return spans, quoting, nl + 1
+            i = d + 1
+            continue
+        nl = find(b'\n', i, end)
+        if nl < 0:
+            nl = end
+        d = find(delimiter, i, nl)
+        if d >= 0:
+            spans.append((i, d))
+            quoting.append(_UNQUOTED)
+            i = d + 1
+            continue
+        fieldend = nl
+        if fieldend > i and buf[fieldend - 1:fieldend] == b'\r':
+            fieldend -= 1
+        spans.append((i, fieldend))
+        quoting.append(_UNQUOTED)
+        return spans, quoting, nl + 1
+
+
+def _complete(rows, buf):
+    size = len(buf)
+    try:
+        for row in rows:
+            if row.end >= size and buf[size - 1:size] != b'\n':
+                return
+            yield row
+    except IncompleteRecord:
+        return
+
+
+class MmapCsvReader(object):
+    """ reads a csv file through ``mmap`` as a header and chunks of
+    :class:`Row` objects, mirroring :class:`_pydistill.stream.CsvReader`.
+
+    Only records between the byte offsets ``start`` and ``end`` are read,
+    the header is always taken from the beginning of the file.  Use it as a
+    context manager; the mapping is released on exit.
+
+    ``columns`` names the columns read, in this order, the others are never
+    decoded.  With ``pattern``, a regular expression or with ``fixed`` a
+    literal string, only records whose raw text contains a match are read:
+    the record as written in the file, quotes included, without the
+    newline ending it.  ``^`` and ``$`` match at line boundaries.
+    """
+
+    def __init__(self, path, chunksize=DEFAULT_CHUNK_ROWS, header=True,
+                 delimiter=',', quotechar='"', encoding='utf-8',
+                 start=0, end=None, columns=None, pattern=None, fixed=False):
+        self.chunksize = ChunkSize.parse(chunksize)
+        self.encoding = encoding
+        self._delimiter = delimiter.encode(encoding)
+        self._quotechar = quotechar.encode(encoding)
+        self._file = io.open(str(path), 'rb')
+        try:
+            self._buf = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can not be mapped
+            self._buf = b''
+        else:
+            if hasattr(self._buf, 'madvise'):
+                self._buf.madvise(mmap.MADV_SEQUENTIAL)
+        self.header = None
+        #: offset of the first data record
+        self.data_start = 0
+        if header:
+            row = next(iter_rows(self._buf, self._delimiter, self._quotechar,
+                                 encoding), None)
+            if row is not None:
+                # only \n ends records here, csv.reader also takes \r
+                if self._buf.find(b'\r', 0, row.end - 2) >= 0:
+                    self.close()
+                    raise CsvError("lone carriage return line ends are not "
+                                   "supported")
+                self.header = row.tolist()
+                self.data_start = row.end
+        self._columns = None
+        if columns is not None:
+            self._columns = column_indexes(self.header, columns)
+            if self.header is not None:
+                self.header = [self.header[i] for i in self._columns]
+        self._match = None
+        if pattern is not None:
+            self._match = prefilter(self._buf, pattern.encode(encoding), fixed)
+        self.select(start, end)
+
+    def select(self, start=0, end=None, skip=0, count=None, partial=True):
+        """ restrict the records read to those between ``start`` and
+        ``end``, after skipping ``skip`` of them at most ``count``.
+
+        Without ``partial`` a last record which may still be written to, one
+        without line terminator or with a quoted field still open, is left
+        out.
+        """
+        rows = iter_rows(self._buf, self._delimiter, self._quotechar,
+                         self.encoding, max(start, self.data_start), end,
+                         self._columns, self._match, partial)
+        if not partial:
+            rows = _complete(rows, self._buf)
+        if skip or count is not None:
+            rows = itertools.islice(rows, skip,
+                                    None if count is None else skip + count)
+        self._rows = rows
+
+    @property
+    def buffer(self):
+        """ the mapped file content. """
+        return self._buf
+
+    def __iter__(self):
+        return iter_chunks(self._rows, self.chunksize)
+
+    def close(self):
+        self._rows = iter(())
+        if isinstance(self._buf, mmap.mmap):
+            try:
+                self._buf.close()
+            except BufferError:
+                # rows handed out are still alive, the mapping goes away
+                # with the last of them
+                pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
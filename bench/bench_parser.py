@@ -0,0 +1,35 @@
+"""
+cost of parsing the command line depending on the number of options
+registered by plugins, with and without the cached argparse parser.
+
+One "parse" replays the three parser lookups of a single Config.parse
+(parse_known_and_unknown_args, parse_known_args and parse_setoption).
+
+    python bench/bench_parser.py [REPEAT]
+"""
+from __future__ import absolute_import, division, print_function
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from _pydistill.bench import make_parser, one_parse, OPTIONS_PER_PLUGIN  # noqa: E402
+
+
+def main(repeat=200):
+    sys.stdout.write("%8s %8s %12s %12s %8s\n" % (
+        "plugins", "options", "uncached ms", "cached ms", "speedup"))
+    for nplugins in (1, 10, 30, 100):
+        parser = make_parser(nplugins)
+        times = []
+        for cached in (False, True):
+            t = timeit.timeit(lambda: one_parse(parser, cached), number=repeat)
+            times.append(t / repeat * 1000)
+        sys.stdout.write("%8d %8d %12.3f %12.3f %7.1fx\n" % (
+            nplugins, nplugins * OPTIONS_PER_PLUGIN, times[0], times[1],
+            times[0] / times[1]))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:2]])
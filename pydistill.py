@@ -5,13 +5,39 @@ pydistill: Automated data distillation framework.
 
 
 # else we are imported
+import sys
 
-from _pydistill.config import (
-    main, UsageError, cmdline,
-    exthookspec, exthookimpl,
-    langhookspec, langhookimpl
+_config_names = (
+    'main', 'UsageError', 'cmdline',
+    'exthookspec', 'exthookimpl',
+    'langhookspec', 'langhookimpl',
 )
 
+_session_names = ('Session',)
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # _pydistill.config, and pluggy with it, is only imported once one
+        # of its names is looked up (PEP 562)
+        if name in _config_names:
+            import _pydistill.config
+            value = getattr(_pydistill.config, name)
+            globals()[name] = value
+            return value
+        if name in _session_names:
+            import _pydistill.session
+            value = getattr(_pydistill.session, name)
+            globals()[name] = value
+            return value
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+else:
+    from _pydistill.config import (
+        main, UsageError, cmdline,
+        exthookspec, exthookimpl,
+        langhookspec, langhookimpl
+    )
+    from _pydistill.session import Session
+
 #from _pydistill.fixtures import fixture, yield_fixture
 #from _pydistill.assertion import register_assert_rewrite
 #from _pydistill.freeze_support import freeze_includes
@@ -39,6 +65,7 @@ __all__ = [
     'exthookimpl',
     'langhookspec',
     'langhookimpl',
+    'Session',
     '__version__',
 #    'register_assert_rewrite',
 #    'freeze_includes',
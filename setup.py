@@ -54,7 +54,9 @@ def get_environment_marker_support_level():
 
 
 def main():
-    extras_require = {}
+    extras_require = {
+        'columnar': ['numpy'],
+    }
     install_requires = [
         'py>=1.5.0',
         'six>=1.10.0',
@@ -64,7 +66,7 @@ def main():
     # if _PYDISTILL_SETUP_SKIP_PLUGGY_DEP is set, skip installing pluggy;
     # used by tox.ini to test with pluggy master
     if '_PYDISTILL_SETUP_SKIP_PLUGGY_DEP' not in os.environ:
-        install_requires.append('pluggy>=0.5,<0.7')
+        install_requires.append('pluggy>=0.12,<2.0')
     environment_marker_support_level = get_environment_marker_support_level()
     if environment_marker_support_level >= 2:
         install_requires.append('funcsigs;python_version<"3.0"')
@@ -89,7 +91,10 @@ def main():
         license='MIT license',
         platforms=['unix', 'linux', 'osx', 'cygwin', 'win32'],
         author=('Youngsung Kim'),
-        entry_points={'console_scripts': ['distill=pydistill:main']},
+        entry_points={'console_scripts': [
+            'distill=pydistill:main',
+            'distillc=_pydistill.daemon:client_main',
+        ]},
         classifiers=classifiers,
         keywords="data distillation framework",
         cmdclass={'pydistill': PyDistill},
@@ -0,0 +1,73 @@
+"""
+the benchmark machinery; set ``PYDISTILL_BENCH_BASELINE`` to the path of a
+baseline written by ``distill bench --save-baseline`` to also fail on
+performance regressions against it.
+"""
+from __future__ import absolute_import, division, print_function
+import os
+
+import pytest
+
+from _pydistill import bench
+from _pydistill.bench import Metric
+
+
+def test_make_dataset(tmpdir):
+    path = bench.make_dataset(tmpdir, 100 * 1024)
+    assert path.size() >= 100 * 1024
+    assert path.readlines()[0] == "id,group,name,value\n"
+    assert bench.make_dataset(tmpdir, 100 * 1024) == path
+    assert tmpdir.listdir("*.tmp") == []
+
+
+def test_metric_change():
+    assert Metric("t", 12.0, "ms").change(10.0) == pytest.approx(0.2)
+    assert Metric("t", 8.0, "ms").change(10.0) < 0
+    assert Metric("mbps", 50.0, "MB/s", higher=True).change(100.0) \
+        == pytest.approx(1.0)
+    assert Metric("mbps", 200.0, "MB/s", higher=True).change(100.0) < 0
+
+
+def test_baseline_roundtrip_and_regressions(tmpdir):
+    path = tmpdir.join("base.json")
+    bench.save_baseline(path, [Metric("a", 10.0, "ms"),
+                               Metric("b", 100.0, "MB/s", higher=True)])
+    baseline = bench.load_baseline(path)
+    assert sorted(baseline) == ["a", "b"]
+    assert baseline["b"].higher
+
+    now = [Metric("a", 11.0, "ms"), Metric("b", 70.0, "MB/s", higher=True),
+           Metric("new", 1.0, "ms")]
+    found = bench.regressions(now, baseline, 0.25)
+    assert [metric.name for metric, base, change in found] == ["b"]
+
+
+def test_run_benchmarks(tmpdir):
+    metrics = list(bench.run_benchmarks(
+        tmpdir, sizes=[64 * 1024], plugins=[1, 10], impls=[1], repeat=1,
+        startup=False))
+    assert [m.name for m in metrics] == [
+        "parse[plugins=1]", "parse[plugins=10]", "dispatch[impls=1]",
+        "csv[64KB]", "csv_mmap[64KB]"]
+    assert all(m.value > 0 for m in metrics)
+
+
+def test_select(tmpdir):
+    metrics = bench.run_benchmarks(tmpdir, sizes=[1024], plugins=[1],
+                                   impls=[1], repeat=1, select=["mmap"])
+    assert [m.name for m in metrics] == ["csv_mmap[1KB]"]
+
+
+@pytest.mark.skipif("PYDISTILL_BENCH_BASELINE" not in os.environ,
+                    reason="no PYDISTILL_BENCH_BASELINE given")
+def test_no_regressions(tmpdir_factory):
+    baseline = bench.load_baseline(os.environ["PYDISTILL_BENCH_BASELINE"])
+    threshold = float(os.environ.get("PYDISTILL_BENCH_THRESHOLD", 0.25))
+    metrics = bench.run_benchmarks(
+        tmpdir_factory.mktemp("bench"), sizes=[10 * 1024 ** 2],
+        plugins=[1, 10, 30, 100], impls=[1, 10, 100], startup=False)
+    found = bench.regressions(list(metrics), baseline, threshold)
+    assert not found, "\n".join(
+        "%s: %.3f%s vs %.3f%s" % (metric.name, metric.value, metric.unit,
+                                   base.value, base.unit)
+        for metric, base, change in found)
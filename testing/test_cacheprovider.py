@@ -0,0 +1,108 @@
+from __future__ import absolute_import, division, print_function
+import os
+import threading
+from argparse import Namespace
+
+from _pydistill.cacheprovider import Cache, ResultCache, file_digest
+
+
+def _spool(tmpdir, name, size):
+    p = tmpdir.join(name)
+    p.write("x" * size)
+    return p
+
+
+def test_key_depends_on_every_part():
+    k = ResultCache.key("csv", {"a": 1}, ["x"])
+    assert k == ResultCache.key("csv", {"a": 1}, ["x"])
+    assert k != ResultCache.key("csv", {"a": 2}, ["x"])
+
+
+def test_file_digest(tmpdir):
+    a = tmpdir.join("a")
+    a.write("same")
+    b = tmpdir.join("b")
+    b.write("same")
+    assert file_digest(a) == file_digest(b)
+    b.write("other")
+    assert file_digest(a) != file_digest(b)
+
+
+def test_put_and_get(tmpdir):
+    cache = ResultCache(tmpdir.ensure_dir("cache"), 1000)
+    assert cache.get("k") is None
+    datapath, meta = cache.put("k", _spool(tmpdir, "s", 10), {"rows": 3})
+    assert datapath.read() == "x" * 10
+    assert cache.get("k") == (datapath, {"rows": 3})
+
+
+def test_too_large_is_not_cached(tmpdir):
+    cache = ResultCache(tmpdir.ensure_dir("cache"), 5)
+    assert cache.put("k", _spool(tmpdir, "s", 10), {}) is None
+    assert cache.get("k") is None
+
+
+def test_lru_eviction(tmpdir):
+    cache = ResultCache(tmpdir.ensure_dir("cache"), 200)
+    for i, key in enumerate(["a", "b"]):
+        datapath, _ = cache.put(key, _spool(tmpdir, key, 80), {})
+        os.utime(str(datapath.new(ext=".json")), (i, i))
+    # using "a" makes "b" the least recently used entry
+    assert cache.get("a") is not None
+    cache.put("c", _spool(tmpdir, "c", 80), {})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+class _EarlyConfig(object):
+    """ a config between the parse of the known arguments and the full
+    parse, when the entry point and confdistill caches are created. """
+
+    def __init__(self, cacheclear):
+        self.option = Namespace()
+        self.known_args_namespace = Namespace(cacheclear=cacheclear)
+
+    def getoption(self, name, default=None):
+        return getattr(self.option, name, default)
+
+
+def test_clear_requested_before_full_parse():
+    assert Cache.clear_requested(_EarlyConfig(True))
+    assert not Cache.clear_requested(_EarlyConfig(False))
+
+
+def _cache(cachedir):
+    cache = Cache.__new__(Cache)
+    cache._cachedir = cachedir
+    return cache
+
+
+def test_concurrent_clear(tmpdir):
+    cachedir = tmpdir.join("cache")
+    cachedir.ensure("v", "k")
+    errors = []
+
+    def clear():
+        try:
+            _cache(cachedir)._clear()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=clear) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert cachedir.listdir() == []
+    assert tmpdir.listdir() == [cachedir]
+
+
+def test_set_replaces_value(tmpdir):
+    cache = _cache(tmpdir.join("cache"))
+    cache.set("my/key", [1])
+    cache.set("my/key", {"a": 2})
+    assert cache.get("my/key", None) == {"a": 2}
+    assert cache._getvaluepath("my/key").dirpath().listdir() == [
+        cache._getvaluepath("my/key")]
@@ -0,0 +1,104 @@
+from __future__ import absolute_import, division, print_function
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from _pydistill.colfile import ColumnFile, ColumnFileWriter  # noqa: E402
+from _pydistill.table import ColumnTable  # noqa: E402
+
+
+def write(path, header, rows, rowgroup_rows=2):
+    with open(str(path), "wb") as f:
+        writer = ColumnFileWriter(f, rowgroup_rows)
+        writer.writeheader(header)
+        writer.write(rows)
+        writer.finish()
+
+
+@pytest.fixture
+def colfile(tmpdir):
+    path = tmpdir.join("x.pdc")
+    write(path, ["id", "price", "name"],
+          [["1", "2.5", "a"], ["2", "", "b"], ["3", "0.5", "c"],
+           ["4", "7.0", "d"], ["5", "1.0", "e"]])
+    with ColumnFile(path) as f:
+        yield f
+
+
+def test_roundtrip(colfile):
+    assert colfile.header == ["id", "price", "name"]
+    assert colfile.num_rows == 5
+    assert [group.rows for group in colfile.groups] == [2, 2, 1]
+    table = colfile.read()
+    assert table["id"].dtype == np.int64
+    assert table["id"].tolist() == [1, 2, 3, 4, 5]
+    assert table["name"].tolist() == ["a", "b", "c", "d", "e"]
+    assert [row for chunk in colfile for row in chunk][0] == ["1", "2.5", "a"]
+
+
+def test_projection_without_copy(colfile):
+    table = colfile.read(["price"], groups=[1])
+    assert table.header == ["price"]
+    assert table["price"].tolist() == [0.5, 7.0]
+    assert not table["price"].flags["OWNDATA"]
+    assert not table["price"].flags["WRITEABLE"]
+    with pytest.raises(KeyError):
+        colfile.read(["nope"])
+
+
+def test_stats_and_pruning(colfile):
+    assert colfile.groups[0].stats("price") == (2.5, 2.5)
+    assert colfile.groups[2].stats("name") == ("e", "e")
+    assert colfile.groups_between("id", low=3) == [1, 2]
+    assert colfile.groups_between("id", high=2) == [0]
+    assert colfile.groups_between("price", 3.0, 6.0) == [1]
+    assert colfile.groups_between("price", 8.0, 9.0) == []
+
+
+def test_dtypes_widened_across_groups(tmpdir):
+    path = tmpdir.join("y.pdc")
+    write(path, ["v"], [["1"], ["2"], ["x"]])
+    with ColumnFile(path) as f:
+        assert f.read()["v"].tolist() == ["1", "2", "x"]
+    write(path, ["v"], [["1"], ["2"], ["0.5"]])
+    with ColumnFile(path) as f:
+        assert f.read()["v"].tolist() == [1.0, 2.0, 0.5]
+
+
+def test_text_written_back_unchanged(tmpdir):
+    path = tmpdir.join("t.pdc")
+    rows = [["007", "1.50", "a" * 1000], ["10", "2", u"\xe4"],
+            ["1e3", "3", "x"]]
+    write(path, ["zip", "price", "text"], rows, rowgroup_rows=3)
+    # values are not padded to the longest one
+    assert path.size() < 3000
+    with ColumnFile(path) as f:
+        assert [row for chunk in f for row in chunk] == rows
+        assert f.read()["text"].tolist()[2] == "x"
+
+
+def test_write_table(tmpdir):
+    path = tmpdir.join("z.pdc")
+    with open(str(path), "wb") as f:
+        writer = ColumnFileWriter(f)
+        writer.write_table(ColumnTable([("a", np.array([True, False]))]))
+        with pytest.raises(ValueError):
+            writer.write_table(ColumnTable([("b", np.arange(2))]))
+        writer.finish()
+    with ColumnFile(path) as f:
+        assert f.read()["a"].tolist() == [True, False]
+
+
+def test_empty_and_invalid(tmpdir):
+    path = tmpdir.join("e.pdc")
+    write(path, ["a"], [])
+    with ColumnFile(path) as f:
+        assert f.num_rows == 0
+        assert len(f.read()) == 0
+    path.write_binary(b"a,b\n1,2\n")
+    with pytest.raises(ValueError):
+        ColumnFile(path)
+    path.write_binary(b"")
+    with pytest.raises(ValueError):
+        ColumnFile(path)
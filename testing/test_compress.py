@@ -0,0 +1,77 @@
+from __future__ import absolute_import, division, print_function
+import bz2
+import gzip
+import zlib
+
+import pytest
+
+from _pydistill import compress, stream
+
+lzma = pytest.importorskip("lzma")
+
+PARTS = [("".join("%d,row%d\n" % (i, i) for i in range(j * 500, (j + 1) * 500))
+          ).encode("ascii") for j in range(5)]
+
+COMPRESSORS = {"gzip": gzip.compress, "bz2": bz2.compress,
+               "xz": lzma.compress}
+
+
+@pytest.fixture(params=sorted(COMPRESSORS))
+def members(request, tmpdir):
+    """ a file of one compressed member per part. """
+    path = tmpdir.join("data.csv.z")
+    path.write_binary(b"".join(COMPRESSORS[request.param](part)
+                               for part in PARTS))
+    return request.param, path
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+def test_members_decompressed_in_order(members, threads):
+    name, path = members
+    assert compress.detect(path) == name
+    with compress.open_input(path, threads) as f:
+        assert f.read() == b"".join(PARTS)
+
+
+def test_large_members_are_streamed(members):
+    name, path = members
+    fmt = compress._detect(path)
+    data = path.read_binary()
+    assert b"".join(compress.iter_members(data, fmt, 2, limit=10)) == \
+        b"".join(PARTS)
+    # the budget shared by all members ahead bounds each of them, too
+    assert b"".join(compress.iter_members(data, fmt, 8, budget=40)) == \
+        b"".join(PARTS)
+
+
+def test_gzip_padding_and_false_starts(tmpdir):
+    path = tmpdir.join("x.gz")
+    # a member whose content looks like the start of another member
+    tricky = b"\x1f\x8b\x08" * 100
+    path.write_binary(gzip.compress(tricky) + gzip.compress(b"end") +
+                      b"\0" * 8)
+    with compress.open_input(path, 4) as f:
+        assert f.read() == tricky + b"end"
+
+
+def test_corrupt_data(tmpdir):
+    path = tmpdir.join("x.gz")
+    data = gzip.compress(PARTS[0]) + gzip.compress(PARTS[1])
+    path.write_binary(data[:len(data) // 2] + b"garbage" * 10)
+    with pytest.raises((IOError, zlib.error, EOFError)):
+        with compress.open_input(path, 2) as f:
+            f.read()
+
+
+def test_uncompressed(tmpdir):
+    path = tmpdir.join("x.csv")
+    path.write_binary(b"a,b\n")
+    assert compress.detect(path) is None
+    assert compress.open_input(path) is None
+
+
+def test_open_text(members):
+    with stream.open_text(members[1], threads=2) as f:
+        reader = stream.CsvReader(f)
+        assert reader.header == ["0", "row0"]
+        assert sum(len(chunk) for chunk in reader) == 2499
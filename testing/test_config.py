@@ -0,0 +1,29 @@
+from __future__ import absolute_import, division, print_function
+
+from _pydistill.config import Parser
+
+
+def test_parser_is_cached_per_subcmd():
+    parser = Parser()
+    parser.getgroup("csv").addoption("--foo", default="1")
+    optparser = parser._getparser("csv")
+    assert parser._getparser("csv") is optparser
+    assert parser._getparser("bench") is not optparser
+
+
+def test_addoption_invalidates_parser():
+    parser = Parser()
+    group = parser.getgroup("csv")
+    group.addoption("--foo", default="1")
+    optparser = parser._getparser("csv")
+    group.addoption("--bar", default="2")
+    assert parser._getparser("csv") is not optparser
+    ns = parser.parse_known_args("csv", ["--bar", "3", "x.csv"])
+    assert (ns.foo, ns.bar, ns.file_or_dir) == ("1", "3", ["x.csv"])
+
+
+def test_addini_invalidates_parser():
+    parser = Parser()
+    optparser = parser._getparser("csv")
+    parser.addini("late", "added by a confdistill.py")
+    assert parser._getparser("csv") is not optparser
@@ -0,0 +1,38 @@
+from __future__ import absolute_import, division, print_function
+import os
+
+from _pydistill import confindex
+from _pydistill.confindex import ConfdistillIndex
+
+
+def test_paths_outermost_first(tmpdir):
+    tmpdir.ensure("confdistill.py")
+    sub = tmpdir.ensure("a", "b", dir=True)
+    tmpdir.ensure("a", "b", "confdistill.py")
+    paths = ConfdistillIndex().confdistill_paths(sub)
+    assert paths[-2:] == [tmpdir.join("confdistill.py"),
+                          sub.join("confdistill.py")]
+
+
+def test_confcutdir(tmpdir):
+    tmpdir.ensure("confdistill.py")
+    sub = tmpdir.ensure("a", dir=True)
+    sub.ensure("confdistill.py")
+    paths = ConfdistillIndex().confdistill_paths(sub, confcutdir=sub)
+    assert paths == [sub.join("confdistill.py")]
+
+
+def test_directories_probed_once_per_run(tmpdir, monkeypatch):
+    probes = []
+    isfile = os.path.isfile
+    monkeypatch.setattr(confindex.os.path, "isfile",
+                        lambda path: probes.append(path) or isfile(path))
+    tmpdir.ensure("confdistill.py")
+    inputs = [tmpdir.ensure("deep", "tree", str(i), dir=True)
+              for i in range(10)]
+    index = ConfdistillIndex()
+    for directory in inputs:
+        assert index.confdistill_paths(directory, confcutdir=tmpdir) == [
+            tmpdir.join("confdistill.py")]
+    # tmpdir, deep and tree once, instead of once for every input
+    assert len(probes) == len(set(probes)) == 3 + len(inputs)
@@ -0,0 +1,147 @@
+from __future__ import absolute_import, division, print_function
+
+import sys
+
+import pytest
+
+from _pydistill.config import main
+
+
+@pytest.fixture
+def workdir(tmpdir, monkeypatch):
+    """ runs in ``tmpdir``, so the cache directory is created there. """
+    monkeypatch.chdir(tmpdir)
+    tmpdir.join("in.csv").write("name,value\na,1\nb,2\nc,3\n")
+    return tmpdir
+
+
+def test_csv_to_output(workdir):
+    out = workdir.join("out.csv")
+    assert main(["csv", "--output", str(out), "in.csv"]) == 0
+    assert out.read() == "name,value\na,1\nb,2\nc,3\n"
+
+
+def test_csv_plugin_hooks(workdir):
+    class DropB(object):
+        def pydistill_csv_table(self, config, table):
+            table.filter(table["name"] != "b")
+
+    pytest.importorskip("numpy")
+    out = workdir.join("out.csv")
+    assert main(["csv", "--columnar", "--output", str(out), "in.csv"],
+                plugins=[DropB()]) == 0
+    assert out.read() == "name,value\na,1\nc,3\n"
+
+
+def _cached_results(workdir):
+    return workdir.join(".pydistill_cache", "d", "results").listdir("*.json")
+
+
+def test_result_cache_key(workdir):
+    out = workdir.join("out.csv")
+    assert main(["csv", "--output", str(out), "in.csv"]) == 0
+    assert len(_cached_results(workdir)) == 1
+    # other spellings of the input and tuning options share the entry
+    assert main(["csv", "--chunk-size", "2", "--output", str(out),
+                 "./in.csv"]) == 0
+    assert len(_cached_results(workdir)) == 1
+    assert main(["csv", "--columns", "name", "--output", str(out),
+                 "in.csv"]) == 0
+    assert len(_cached_results(workdir)) == 2
+    assert out.read() == "name\na\nb\nc\n"
+    # each engine has entries of its own
+    assert main(["csv", "--mmap", "--output", str(out), "in.csv"]) == 0
+    assert len(_cached_results(workdir)) == 3
+
+
+def test_result_cache_skips_unversioned_plugins(workdir):
+    class Upper(object):
+        def pydistill_transform_batch(self, config, chunk):
+            return [[field.upper() for field in row] for row in chunk]
+
+    out = workdir.join("out.csv")
+    assert main(["csv", "--output", str(out), "in.csv"],
+                plugins=[Upper()]) == 0
+    assert _cached_results(workdir) == []
+
+
+def test_incremental_resume(workdir):
+    out = workdir.join("out.csv")
+    data = workdir.join("in.csv")
+    data.write('name,value\na,1\nb,"open')
+    assert main(["csv", "--incremental", "--output", str(out),
+                 "in.csv"]) == 0
+    assert out.read() == "name,value\na,1\n"
+    data.write('name,value\na,1\nb,"open\nquote"\nc,3\n')
+    # neither the spelling of the input nor the chunk size are part of
+    # the state key
+    assert main(["csv", "--incremental", "--chunk-size", "1", "--output",
+                 str(out), "./in.csv"]) == 0
+    assert out.read() == 'b,"open\nquote"\nc,3\n'
+
+
+def test_transform_hooks_in_every_engine(workdir):
+    class Upper(object):
+        def pydistill_transform_batch(self, config, chunk):
+            return [[field.upper() for field in row] for row in chunk]
+
+        def pydistill_transform(self, config, record):
+            return None if record[0] == "B" else record
+
+    out = workdir.join("out.csv")
+    for args in ([], ["--mmap"], ["--workers", "2", "in.csv"]):
+        assert main(["csv", "--output", str(out), "in.csv"] + args,
+                    plugins=[Upper()]) == 0
+        assert out.read().startswith("name,value\nA,1\nC,3\n")
+
+
+def test_engines_keep_blank_lines(workdir):
+    workdir.join("in.csv").write("name,value\na,1\n\nb,2\r\n\r\nc,3\n")
+    out = workdir.join("out.csv")
+    found = []
+    for args in ([], ["--mmap"]):
+        assert main(["csv", "--cache-clear", "--output", str(out), "in.csv"] +
+                    args) == 0
+        found.append(out.read())
+    assert found[0] == found[1]
+    assert found[0].count("\n") == 6
+
+
+def test_count_with_and_without_index(workdir):
+    workdir.join("in.csv").write("name,value\na,1\n\nb,2\n")
+    out = workdir.join("out.csv")
+    assert main(["csv", "--count", "--output", str(out), "in.csv"]) == 0
+    counted = out.read()
+    assert main(["csv", "--build-index", "in.csv"]) == 0
+    assert workdir.join("in.csv.pdx").check()
+    assert main(["csv", "--count", "--output", str(out), "in.csv"]) == 0
+    assert out.read() == counted
+    assert counted.endswith("in.csv,3\n")
+
+
+def test_csv_module_fallback(workdir, capsys):
+    workdir.join("mac.csv").write_binary(b"name,value\ra,1\rb,2\r")
+    out = workdir.join("out.csv")
+    assert main(["csv", "--mmap", "--output", str(out), "mac.csv"]) == 0
+    assert out.read() == "name,value\na,1\nb,2\n"
+    # malformed data found while reading names the input
+    workdir.join("big.csv").write("name\n%s\n" % ("x" * 200000,))
+    assert main(["csv", "big.csv"]) == 4
+    assert "big.csv: field larger than field limit" in \
+        capsys.readouterr().err
+
+
+def test_csv_usage_errors(workdir, capsys):
+    assert main(["csv", "--columns", "missing", "in.csv"]) == 4
+    assert "unknown column 'missing'" in capsys.readouterr().err
+    if sys.version_info >= (3, 5):
+        assert main(["csv", "--pipeline", "--count", "in.csv"]) == 4
+        assert "--pipeline cannot be combined with --count" in \
+            capsys.readouterr().err
+    assert main(["csv", "--no-such-option", "in.csv"]) == 4
+    assert main(["no-such-subcmd"]) == 4
+
+
+def test_help(workdir, capsys):
+    assert main(["csv", "--help"]) == 0
+    assert "--chunk-size" in capsys.readouterr().out
@@ -0,0 +1,124 @@
+from __future__ import absolute_import, division, print_function
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+from _pydistill import config, daemon
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, "AF_UNIX") or not hasattr(os, "fork") or
+    sys.version_info < (3, 3), reason="needs unix sockets and fork")
+
+
+@pytest.fixture
+def server(tmpdir, monkeypatch):
+    def fake_main(args):
+        sys.stdout.write("cwd=%s args=%s env=%s\n" % (
+            os.getcwd(), " ".join(args), os.environ.get("JOBVAR")))
+        sys.stderr.write("to stderr\n")
+        return 3 if "fail" in args else 0
+
+    # jobs are forked from this process and see the fake
+    monkeypatch.setattr(config, "main", fake_main)
+    socketpath = str(tmpdir.join("d.sock"))
+    server = daemon.make_server(socketpath)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield socketpath
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def run(socketpath, argv, tmpdir):
+    out = tmpdir.join("out")
+    err = tmpdir.join("err")
+    with out.open("w") as fout, err.open("w") as ferr:
+        code = daemon.run_job(argv, socketpath,
+                              fds=(0, fout.fileno(), ferr.fileno()))
+    return code, out.read(), err.read()
+
+
+def test_job_runs_in_client_context(server, tmpdir, monkeypatch):
+    workdir = tmpdir.ensure_dir("work")
+    monkeypatch.chdir(workdir)
+    monkeypatch.setenv("JOBVAR", "42")
+    code, out, err = run(server, ["csv", "x.csv"], tmpdir)
+    assert code == 0
+    assert out == "cwd=%s args=csv x.csv env=42\n" % workdir
+    assert err == "to stderr\n"
+    assert os.stat(server).st_mode & 0o077 == 0
+
+
+def test_exit_code(server, tmpdir):
+    assert run(server, ["fail"], tmpdir)[0] == 3
+    assert run(server, ["ok"], tmpdir)[0] == 0
+
+
+def test_no_daemon(tmpdir):
+    assert daemon.run_job(["csv"], str(tmpdir.join("none.sock"))) is None
+
+
+def test_other_users_are_refused(server, tmpdir, monkeypatch):
+    # the fake uid is seen by both ends, the server forks its handler
+    monkeypatch.setattr(daemon, "_peer_uid", lambda sock: os.getuid() + 1)
+    assert run(server, ["ok"], tmpdir) == (None, "", "")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(server)
+        assert sock.recv(4) == b""
+    finally:
+        sock.close()
+
+
+def test_peer_uid():
+    if not hasattr(socket, "SO_PEERCRED"):
+        pytest.skip("needs SO_PEERCRED")
+    a, b = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        assert daemon._peer_uid(a) == os.getuid()
+    finally:
+        a.close()
+        b.close()
+
+
+def test_default_socket_path(tmpdir, monkeypatch):
+    monkeypatch.delenv("PYDISTILL_SOCKET", raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmpdir))
+    assert daemon.default_socket_path() == str(tmpdir.join("pydistill.sock"))
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    monkeypatch.setattr(daemon.tempfile, "gettempdir", lambda: str(tmpdir))
+    path = daemon.default_socket_path()
+    rundir = os.path.dirname(path)
+    assert rundir == str(tmpdir.join("pydistill-%d" % os.getuid()))
+    assert os.stat(rundir).st_mode & 0o777 == 0o700
+    os.chmod(rundir, 0o755)
+    with pytest.raises(RuntimeError):
+        daemon.default_socket_path()
+
+
+def test_stale_socket_is_replaced(tmpdir):
+    socketpath = str(tmpdir.join("d.sock"))
+    daemon.make_server(socketpath).server_close()
+    server = daemon.make_server(socketpath)
+    try:
+        with pytest.raises(RuntimeError):
+            daemon.make_server(socketpath)
+    finally:
+        server.server_close()
+
+
+@pytest.mark.parametrize("args, expected", [
+    (["csv"], None), ([], None), (["--daemon"], ""),
+    (["--daemon", "--socket", "/s"], "/s"), (["--daemon", "--socket=/s"], "/s"),
+])
+def test_daemon_args(args, expected):
+    assert daemon.daemon_args(args) == expected
+
+
+def test_daemon_args_invalid():
+    with pytest.raises(ValueError):
+        daemon.daemon_args(["--daemon", "csv"])
@@ -0,0 +1,74 @@
+from __future__ import absolute_import, division, print_function
+import sys
+
+from _pydistill import entrypoints
+from _pydistill.entrypoints import EntryPointIndex, IndexedEntryPoint
+
+
+class DictCache(object):
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key, default):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+def test_applies_to():
+    assert IndexedEntryPoint("stats", "m", "d", "1").applies_to("csv")
+    assert IndexedEntryPoint("csv.stats", "m", "d", "1").applies_to("csv")
+    assert not IndexedEntryPoint("lang.f90", "m", "d", "1").applies_to("csv")
+    assert IndexedEntryPoint("lang.f90", "m", "d", "1").applies_to(None)
+
+
+def test_load():
+    ep = IndexedEntryPoint("x", "os.path:join", "d", "1")
+    import os.path
+    assert ep.load() is os.path.join
+
+
+def test_index_is_reused_until_fingerprint_changes(monkeypatch):
+    scans = []
+
+    def scan(group):
+        scans.append(group)
+        return [IndexedEntryPoint("p", "os", "dist", "1.0")]
+
+    monkeypatch.setattr(entrypoints, "scan_entrypoints", scan)
+    cache = DictCache()
+    index = EntryPointIndex(cache, "pydistill11")
+    assert [ep.name for ep in index.entries()] == ["p"]
+    entries = index.entries()
+    assert scans == ["pydistill11"]
+    assert entries[0].dist.project_name == "dist"
+    assert entries[0].dist.version == "1.0"
+
+    monkeypatch.setattr(entrypoints, "site_fingerprint", lambda: ["changed"])
+    index.entries()
+    assert scans == ["pydistill11", "pydistill11"]
+
+
+def test_fingerprint_sees_metadata_edited_in_place(tmpdir, monkeypatch):
+    dist = tmpdir.ensure("plugin-1.0.dist-info", dir=True)
+    eps = dist.ensure("entry_points.txt")
+    monkeypatch.setattr(sys, "path", [str(tmpdir)])
+    before = entrypoints.site_fingerprint()
+    # an in-place edit changes neither sys.path nor dist-info mtimes
+    mtime = dist.mtime()
+    eps.setmtime(eps.mtime() + 10)
+    assert dist.mtime() == mtime
+    assert entrypoints.site_fingerprint() != before
+
+
+def test_subcmd_filter_without_cache(monkeypatch):
+    from _pydistill.config import PyDistillPluginManager
+    monkeypatch.setattr(entrypoints, "scan_entrypoints", lambda group: [
+        IndexedEntryPoint("csv.mine", "os.path", "d", "1"),
+        IndexedEntryPoint("lang.mine", "os", "d", "1")])
+    pm = PyDistillPluginManager()
+    pm.load_setuptools_entrypoints("pydistill11", "csv")
+    assert pm.get_plugin("csv.mine") is not None
+    assert pm.get_plugin("lang.mine") is None
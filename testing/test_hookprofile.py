@@ -0,0 +1,95 @@
+from __future__ import absolute_import, division, print_function
+import json
+
+import py
+from pluggy import HookimplMarker, HookspecMarker, PluginManager
+
+from _pydistill.hookprofile import HookProfiler
+
+hookspec = HookspecMarker("example")
+hookimpl = HookimplMarker("example")
+
+
+class Spec(object):
+
+    @hookspec
+    def example_hook(self, value):
+        pass
+
+
+class Double(object):
+
+    @hookimpl
+    def example_hook(self, value):
+        return value * 2
+
+
+class Wrapper(object):
+
+    @hookimpl(hookwrapper=True)
+    def example_hook(self, value):
+        yield
+
+
+def make_pm():
+    pm = PluginManager("example")
+    pm.add_hookspecs(Spec)
+    pm.register(Double(), name="double")
+    return pm
+
+
+def test_counts_calls_per_hook_and_plugin():
+    pm = make_pm()
+    profiler = HookProfiler(pm)
+    profiler.enable()
+    assert pm.hook.example_hook(value=2) == [4]
+    pm.register(Wrapper(), name="wrapper")
+    pm.hook.example_hook(value=3)
+    profiler.disable()
+    pm.hook.example_hook(value=4)
+
+    hooks = profiler.to_json()
+    assert [hook["name"] for hook in hooks] == ["example_hook"]
+    assert hooks[0]["calls"] == 2
+    assert [(impl["plugin"], impl["calls"]) for impl in hooks[0]["impls"]] \
+        == [("double", 2)]
+    assert hooks[0]["max"] >= hooks[0]["impls"][0]["max"] >= 0
+
+
+def test_disable_restores_functions():
+    pm = make_pm()
+    function = pm.hook.example_hook.get_hookimpls()[0].function
+    profiler = HookProfiler(pm)
+    profiler.enable()
+    pm.hook.example_hook(value=1)
+    assert pm.hook.example_hook.get_hookimpls()[0].function is not function
+    profiler.disable()
+    assert pm.hook.example_hook.get_hookimpls()[0].function is function
+
+
+def test_report():
+    pm = make_pm()
+    profiler = HookProfiler(pm)
+    profiler.enable()
+    pm.hook.example_hook(value=1)
+    profiler.disable()
+    tw = py.io.TerminalWriter(stringio=True)
+    profiler.report(tw)
+    lines = tw.stringio.getvalue().splitlines()
+    assert "hook durations" in lines[0]
+    assert lines[2].startswith("example_hook ")
+    assert lines[3].split()[:2] == ["double", "1"]
+
+
+def test_report_at_end_of_run(tmpdir, monkeypatch, capsys):
+    from _pydistill.config import main
+    monkeypatch.chdir(tmpdir)
+    tmpdir.join("in.csv").write("a,b\n1,2\n")
+    report = tmpdir.join("durations.json")
+    assert main(["csv", "--hook-durations", "--hook-durations-json",
+                 str(report), "--output", "out.csv", "in.csv"]) == 0
+    err = capsys.readouterr().err
+    assert "hook durations" in err
+    assert "pydistill_cmdline_main" in err
+    hooks = json.loads(report.read())
+    assert "pydistill_cmdline_main" in [hook["name"] for hook in hooks]
@@ -0,0 +1,63 @@
+"""
+import time regression tests: measured with ``python -X importtime`` in a
+fresh interpreter, budgets in microseconds can be raised for slow machines
+through the ``PYDISTILL_IMPORT_BUDGET_FACTOR`` environment variable.
+"""
+from __future__ import absolute_import, division, print_function
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 7),
+                                reason="-X importtime needs python 3.7")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def importtime(statement):
+    """ return {module: cumulative import time in us} for ``statement``. """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    out = subprocess.check_output(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        stderr=subprocess.STDOUT, env=env, cwd=ROOT)
+    times = {}
+    for line in out.decode("utf-8").splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        try:
+            times[name.strip()] = int(cumulative)
+        except ValueError:
+            pass  # the header line
+    return times
+
+
+def budget(us):
+    return us * float(os.environ.get("PYDISTILL_IMPORT_BUDGET_FACTOR", 1))
+
+
+def test_import_pydistill_is_lazy():
+    times = importtime("import pydistill")
+    for name in ["_pydistill.config", "pluggy", "argparse", "py", "six",
+                 "_pydistill.exthookspec", "_pydistill.assertion"]:
+        assert name not in times
+    assert times["pydistill"] <= budget(5000)
+
+
+def test_import_config_skips_unused_modules():
+    times = importtime("import _pydistill.config")
+    for name in ["argparse", "traceback", "shlex", "six",
+                 "_pydistill.exthookspec", "_pydistill.langhookspec",
+                 "_pydistill.assertion"]:
+        assert name not in times
+    assert times["_pydistill.config"] <= budget(30000)
+
+
+def test_version_loads_no_plugins():
+    times = importtime("import sys; sys.argv[1:] = ['--version']\n"
+                       "from pydistill import main; main()")
+    for name in ["_pydistill.exthookspec", "_pydistill.cacheprovider",
+                 "_pydistill.csv"]:
+        assert name not in times
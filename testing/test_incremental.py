@@ -0,0 +1,28 @@
+from __future__ import absolute_import, division, print_function
+
+from _pydistill.incremental import IncrementalState
+
+
+def _advanced(buf):
+    state = IncrementalState()
+    assert state.resume_offset(buf, "fp", ["a"]) == 0
+    state.advance(buf, 2, 4)
+    return IncrementalState.from_json(state.to_json())
+
+
+def test_resume_after_append():
+    state = _advanced(b"a\n1\n")
+    assert state.resume_offset(b"a\n1\n2\n", "fp", ["a"]) == 4
+
+
+def test_restart_if_rewritten_or_truncated():
+    for buf in [b"a\n9\n2\n", b"a\n"]:
+        state = _advanced(b"a\n1\n")
+        state.aggregates["x"] = 1
+        assert state.resume_offset(buf, "fp", ["a"]) == 0
+        assert state.aggregates == {}
+
+
+def test_restart_if_options_changed():
+    state = _advanced(b"a\n1\n")
+    assert state.resume_offset(b"a\n1\n", "other", ["a"]) == 0
@@ -0,0 +1,181 @@
+from __future__ import absolute_import, division, print_function
+
+import py
+import pytest
+
+from _pydistill import lang
+from _pydistill.cacheprovider import ResultCache
+from _pydistill.config import UsageError, langhookimpl
+from _pydistill.lang import (LangPluginManager, ParseCache, parse_file,
+                             parse_files)
+
+
+class FakeCache(object):
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def makedir(self, name):
+        return self.directory.ensure_dir(name)
+
+
+class FakeConfig(object):
+
+    def __init__(self, tmpdir, parse_cache_size="1MB"):
+        self.cache = FakeCache(tmpdir.join("cache"))
+        self.inivalues = dict(parse_cache_size=parse_cache_size)
+        self.langmanager = LangPluginManager()
+
+    def getini(self, name):
+        return self.inivalues[name]
+
+
+class WordParser(object):
+    name = "words"
+
+    def __init__(self, version="1"):
+        self.version = version
+        self.calls = []
+
+    def parse(self, path, source):
+        self.calls.append(path.basename)
+        return source.decode("ascii").split()
+
+
+class WordPlugin(object):
+    """ "use x" words make a file depend on the file named x. """
+
+    def __init__(self, parser):
+        self.parser = parser
+
+    @langhookimpl
+    def pydistill_lang_parser(self, config, path):
+        if path.ext == ".words":
+            return self.parser
+
+    @langhookimpl
+    def pydistill_lang_dependencies(self, config, path, source):
+        words = source.decode("ascii").split()
+        uses = [words[i + 1] for i, word in enumerate(words[:-1])
+                if word == "use"]
+        return [path.purebasename], uses
+
+
+def make_config(tmpdir, parser, **kwargs):
+    config = FakeConfig(tmpdir, **kwargs)
+    config.langmanager.register(WordPlugin(parser))
+    return config
+
+
+def test_parse_file_is_cached(tmpdir):
+    parser = WordParser()
+    config = make_config(tmpdir, parser)
+    path = tmpdir.join("a.words")
+    path.write("one two")
+    assert parse_file(config, path) == ["one", "two"]
+    assert parse_file(config, path) == ["one", "two"]
+    assert parser.calls == ["a.words"]
+
+    # the content decides, not the path
+    tmpdir.join("b.words").write("one two")
+    assert parse_file(config, tmpdir.join("b.words")) == ["one", "two"]
+    assert parser.calls == ["a.words"]
+
+    path.write("three")
+    assert parse_file(config, path) == ["three"]
+    assert parser.calls == ["a.words", "a.words"]
+
+
+def test_new_parser_version_invalidates(tmpdir):
+    path = tmpdir.join("a.words")
+    path.write("one")
+    parse_file(make_config(tmpdir, WordParser("1")), path)
+    parser = WordParser("2")
+    parse_file(make_config(tmpdir, parser), path)
+    assert parser.calls == ["a.words"]
+
+
+def test_cache_disabled(tmpdir):
+    parser = WordParser()
+    config = make_config(tmpdir, parser, parse_cache_size="0")
+    path = tmpdir.join("a.words")
+    path.write("one")
+    parse_file(config, path)
+    parse_file(config, path)
+    assert parser.calls == ["a.words", "a.words"]
+
+
+def test_parse_cache_hook_can_be_overridden(tmpdir):
+    shared = ParseCache(ResultCache(tmpdir.ensure_dir("shared"), 1 << 20))
+
+    class SharedCache(object):
+        @langhookimpl
+        def pydistill_lang_parse_cache(self, config):
+            return shared
+
+    parser = WordParser()
+    config = make_config(tmpdir, parser)
+    config.langmanager.register(SharedCache())
+    path = tmpdir.join("a.words")
+    path.write("one")
+    parse_file(config, path)
+    assert shared.get(ParseCache.key(parser, b"one")) == ["one"]
+
+
+def test_unreadable_entry_is_a_miss(tmpdir):
+    cache = ParseCache(ResultCache(tmpdir, 1 << 20))
+    key = ParseCache.key(WordParser(), b"x")
+    cache.put(key, ["x"])
+    assert cache.get(key) == ["x"]
+    tmpdir.join(key + ".data").write_binary(b"garbage")
+    assert cache.get(key, "miss") == "miss"
+    assert tmpdir.listdir("*.pickle") == []
+
+
+def test_contains_does_not_load(tmpdir, monkeypatch):
+    cache = ParseCache(ResultCache(tmpdir, 1 << 20))
+    key = ParseCache.key(WordParser(), b"x")
+    assert key not in cache
+    cache.put(key, ["x"])
+    monkeypatch.setattr(lang.pickle, "load", None)
+    assert key in cache
+
+
+def test_no_plugin(tmpdir):
+    config = FakeConfig(tmpdir)
+    with pytest.raises(UsageError):
+        parse_file(config, py.path.local(tmpdir.join("a.f90").ensure()))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_parse_files(tmpdir, workers):
+    parser = WordParser()
+    config = make_config(tmpdir, parser)
+    tmpdir.join("a.words").write("use b")
+    tmpdir.join("b.words").write("use c")
+    tmpdir.join("c.words").write("leaf")
+    paths = [tmpdir.join(name) for name in ("a.words", "b.words", "c.words")]
+    parsed = parse_files(config, paths, workers)
+    assert len(parsed) == 3
+    assert parsed[tmpdir.join("a.words")] == ["use", "b"]
+    assert dict(parsed.items())[tmpdir.join("c.words")] == ["leaf"]
+    assert list(parsed) == paths
+    if workers == 1:
+        # in process, so the order is visible
+        assert parser.calls == ["c.words", "b.words", "a.words"]
+    else:
+        assert parser.calls == []
+        assert parsed._keys
+
+    parsed = parse_files(config, paths, workers)
+    assert parsed[tmpdir.join("b.words")] == ["use", "c"]
+
+
+def test_parse_files_without_cache(tmpdir):
+    config = make_config(tmpdir, WordParser(), parse_cache_size="0")
+    tmpdir.join("a.words").write("x")
+    tmpdir.join("b.words").write("y")
+    parsed = parse_files(config, [tmpdir.join("a.words"),
+                                  tmpdir.join("b.words")], workers=2)
+    assert parsed[tmpdir.join("a.words")] == ["x"]
+    assert not parsed._keys
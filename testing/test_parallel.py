@@ -0,0 +1,97 @@
+from __future__ import absolute_import, division, print_function
+import functools
+import multiprocessing
+import sys
+import threading
+
+import pytest
+
+from _pydistill import parallel
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, 1), ("", 1), ("0", 1), ("1", 1), ("4", 4),
+    ("auto", multiprocessing.cpu_count()),
+])
+def test_parse_workers(value, expected):
+    assert parallel.parse_workers(value) == expected
+
+
+def test_parse_workers_invalid():
+    with pytest.raises(ValueError):
+        parallel.parse_workers("-2")
+    with pytest.raises(ValueError):
+        parallel.parse_workers("many")
+
+
+_state = []
+
+
+def _init(value):
+    _state.append(value)
+
+
+def _scaled(x):
+    return x * _state[-1]
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_imap_ordered_keeps_input_order(workers):
+    items = list(range(20))
+    results = list(parallel.imap_ordered(_scaled, items, workers,
+                                         initializer=_init, initargs=(10,)))
+    assert results == [x * 10 for x in items]
+
+
+def _double(x):
+    if x == "bad":
+        raise ValueError("bad item")
+    return x * 2
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_imap_dependency_ordered(workers):
+    requires = {"c": ["a", "b"], "b": ["a", "unknown"], "d": ["e"],
+                "e": ["d"]}
+    results = list(parallel.imap_dependency_ordered(
+        _double, ["c", "b", "a", "d", "e", "z"], requires, workers))
+    assert sorted(results) == [("a", "aa"), ("b", "bb"), ("c", "cc"),
+                               ("d", "dd"), ("e", "ee"), ("z", "zz")]
+    done = [item for item, _ in results]
+    assert done.index("a") < done.index("b") < done.index("c")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_imap_dependency_ordered_error(workers):
+    with pytest.raises(ValueError, match="bad item"):
+        list(parallel.imap_dependency_ordered(
+            _double, ["a", "bad"], {}, workers))
+
+
+def _unpicklable(x):
+    return threading.Lock()
+
+
+@pytest.mark.skipif(sys.version_info < (3,), reason="no error callback")
+def test_imap_dependency_ordered_unpicklable_result():
+    with pytest.raises(Exception, match="pickle"):
+        list(parallel.imap_dependency_ordered(
+            _unpicklable, [1, 2], {}, workers=2))
+
+
+def _shared_scaled(token, x):
+    return x * parallel.lookup(token)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_shared_per_run(workers):
+    with parallel.shared(10) as ten, parallel.shared(100) as hundred:
+        assert ten != hundred
+        assert list(parallel.imap_ordered(
+            functools.partial(_shared_scaled, ten), [1, 2], workers)) == \
+            [10, 20]
+        assert list(parallel.imap_ordered(
+            functools.partial(_shared_scaled, hundred), [1, 2], workers)) == \
+            [100, 200]
+    with pytest.raises(KeyError):
+        parallel.lookup(ten)
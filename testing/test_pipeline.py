@@ -0,0 +1,175 @@
+from __future__ import absolute_import, division, print_function
+import asyncio
+import threading
+import time
+
+import pytest
+from pluggy import HookimplMarker, HookspecMarker, PluginManager
+
+from _pydistill.pipeline import Pipeline
+from _pydistill.stream import hook_chain, per_record, rebatched
+
+
+class ListWriter(object):
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, chunk):
+        self.chunks.append(list(chunk))
+
+
+def test_transforms_are_chained_and_drop_records():
+    reader = [[1, 2, 3], [4, 5], [6]]
+    writer = ListWriter()
+    transforms = [lambda x: x * 10, lambda x: None if x == 20 else x + 1]
+    stats = Pipeline(reader, writer, [per_record(transforms)], maxsize=1).run()
+    assert writer.chunks == [[11, 31], [41, 51], [61]]
+    assert stats == {'chunks': 3, 'rows_in': 6, 'rows_out': 5}
+
+
+def test_empty_chunks_are_not_written():
+    writer = ListWriter()
+    stats = Pipeline([[1], [2]], writer, [lambda chunk: None]).run()
+    assert writer.chunks == []
+    assert stats['rows_out'] == 0
+
+
+def test_async_reader_and_writer():
+    class Reader(object):
+        def __init__(self):
+            self.chunks = iter([["a"], ["b", "c"]])
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return next(self.chunks)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    class Writer(object):
+        def __init__(self):
+            self.records = []
+
+        async def write(self, chunk):
+            await asyncio.sleep(0)
+            self.records.extend(chunk)
+
+    writer = Writer()
+    Pipeline(Reader(), writer, [per_record([str.upper])]).run()
+    assert writer.records == ["A", "B", "C"]
+
+
+def test_slow_writer_throttles_reader():
+    lock = threading.Lock()
+    state = {"read": 0, "written": 0, "ahead": 0}
+
+    def reader():
+        for i in range(40):
+            with lock:
+                state["read"] += 1
+                state["ahead"] = max(state["ahead"],
+                                     state["read"] - state["written"])
+            yield [i]
+
+    class SlowWriter(object):
+        def write(self, chunk):
+            time.sleep(0.002)
+            with lock:
+                state["written"] += 1
+
+    Pipeline(reader(), SlowWriter(), maxsize=2).run()
+    assert state["written"] == 40
+    # two full queues plus one chunk in every stage
+    assert state["ahead"] <= 2 * 2 + 3
+
+
+def test_errors_propagate():
+    def reader():
+        yield [1]
+        raise ValueError("broken input")
+
+    with pytest.raises(ValueError, match="broken input"):
+        Pipeline(reader(), ListWriter()).run()
+
+    class BrokenWriter(object):
+        def write(self, chunk):
+            raise IOError("disk full")
+
+    with pytest.raises(IOError, match="disk full"):
+        Pipeline(([i] for i in range(100)), BrokenWriter(), maxsize=1).run()
+
+
+def test_batch_transforms_and_batch_size():
+    seen = []
+
+    def batch(chunk):
+        seen.append(len(chunk))
+        return [x * 2 for x in chunk]
+
+    batch.plugin = "plugin"
+    writer = ListWriter()
+    stats = Pipeline([list(range(10)), [10]], writer,
+                     rebatched([batch], {"plugin": 4})).run()
+    assert seen == [4, 4, 2, 1]
+    assert sum(writer.chunks, []) == [x * 2 for x in range(11)]
+    assert stats == {'chunks': 2, 'rows_in': 11, 'rows_out': 11}
+
+
+def test_batch_transform_may_return_other_sequences():
+    writer = ListWriter()
+    Pipeline([[1, 2, 3]], writer, [tuple, lambda chunk: chunk[1:]]).run()
+    assert writer.chunks == [[2, 3]]
+
+
+def test_invalid_queue_size():
+    with pytest.raises(ValueError):
+        Pipeline([], ListWriter(), maxsize=0)
+
+
+def test_hook_chain():
+    hookspec = HookspecMarker("example")
+    hookimpl = HookimplMarker("example")
+
+    class Spec(object):
+        @hookspec
+        def example_transform(self, config, record):
+            pass
+
+    class Add(object):
+        @hookimpl
+        def example_transform(self, record):
+            return record + "+add"
+
+    class Mul(object):
+        @hookimpl(tryfirst=True)
+        def example_transform(self, config, record):
+            return record + "+" + config
+
+    calls = []
+
+    class Wrapper(object):
+        @hookimpl(hookwrapper=True)
+        def example_transform(self, record):
+            calls.append(record)
+            yield
+
+    pm = PluginManager("example")
+    pm.add_hookspecs(Spec)
+    pm.register(Add())
+    pm.register(Mul())
+    pm.register(Wrapper())
+    monitored = []
+    pm.add_hookcall_monitoring(
+        lambda name, impls, kwargs: monitored.append(name),
+        lambda outcome, name, impls, kwargs: None)
+    chain = hook_chain(pm, "example_transform", "record", config="cfg")
+    record = "r"
+    for transform in chain:
+        record = transform(record)
+    assert record == "r+cfg+add"
+    # every call is dispatched by pluggy
+    assert calls == ["r", "r+cfg"]
+    assert monitored == ["example_transform"] * 2
@@ -0,0 +1,81 @@
+from __future__ import absolute_import, division, print_function
+import csv
+import io
+import os
+
+import pytest
+
+from _pydistill.rowindex import RowIndex, index_path
+from _pydistill.tokenizer import MmapCsvReader
+
+
+@pytest.fixture
+def data(tmpdir):
+    lines = ["id,text"]
+    for i in range(100):
+        text = '"multi\nline, %d"' % i if i % 3 == 0 else "plain%d" % i
+        lines.append("%d,%s" % (i, text))
+    p = tmpdir.join("data.csv")
+    p.write_binary(("\n".join(lines) + "\n").encode("utf-8"))
+    return p
+
+
+def _records(path, start=0, end=None, skip=0, count=None):
+    with MmapCsvReader(path) as reader:
+        reader.select(start, end, skip, count)
+        return [row.tolist() for chunk in reader for row in chunk]
+
+
+def test_build_and_load(data):
+    index = RowIndex.build(data, block_rows=16, key="id")
+    assert index.num_rows == 100
+    assert len(index.starts) == 7
+    assert index.keys[0] == [0.0, 15.0]
+    index.save(data)
+    assert os.path.exists(index_path(data))
+    loaded = RowIndex.load(data)
+    assert vars(loaded) == vars(index)
+    assert RowIndex.load(data, delimiter=";") is None
+
+
+def test_stale_index_ignored(data):
+    RowIndex.build(data).save(data)
+    data.write_binary(data.read_binary() + b"100,more\n")
+    os.utime(str(data), (0, 0))
+    assert RowIndex.load(data) is None
+
+
+def test_split_covers_all_records(data):
+    expected = list(csv.reader(io.StringIO(data.read_text("utf-8"))))[1:]
+    index = RowIndex.build(data, block_rows=8)
+    spans = index.split(3)
+    assert len(spans) == 3
+    found = []
+    for start, end in spans:
+        found.extend(_records(data, start, end))
+    assert found == expected
+
+
+def test_seek(data):
+    index = RowIndex.build(data, block_rows=16)
+    offset, skip = index.seek(42)
+    assert (offset, skip) == (index.starts[2], 10)
+    rows = _records(data, offset, skip=skip, count=2)
+    assert [row[0] for row in rows] == ["42", "43"]
+
+
+def test_blocks_between(data):
+    index = RowIndex.build(data, block_rows=16, key="id")
+    assert index.blocks_between(20, 40) == [
+        (index.starts[1], index.starts[2]), (index.starts[2], index.starts[3])]
+    with pytest.raises(ValueError):
+        RowIndex.build(data, block_rows=16).blocks_between(0, 1)
+
+
+def test_counts_blank_lines_like_csv_module(tmpdir):
+    p = tmpdir.join("blank.csv")
+    p.write_binary(b"id\n1\n\n2\r\n\r\n3\n")
+    expected = list(csv.reader(io.StringIO(p.read_text("utf-8"))))[1:]
+    index = RowIndex.build(p, block_rows=2)
+    assert index.num_rows == len(expected) == 5
+    assert _records(p, *index.split(2)[1]) == expected[2:]
@@ -0,0 +1,85 @@
+from __future__ import absolute_import, division, print_function
+import threading
+
+import pytest
+
+import pydistill
+from _pydistill import config, entrypoints
+from _pydistill.entrypoints import IndexedEntryPoint
+from _pydistill.session import Session
+
+
+class Plugin(object):
+    pass
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    """ records the jobs run instead of running them. """
+    found = []
+    ep = IndexedEntryPoint("myplugin", "os.path", "mydist", "1.0")
+    monkeypatch.setattr(entrypoints, "scan_entrypoints", lambda group: [ep])
+
+    def fake_run(args, plugins, entrypoints):
+        found.append((args, plugins, entrypoints))
+        return int(args[-1])
+
+    monkeypatch.setattr(config, "_run", fake_run)
+    return found
+
+
+def test_exported():
+    assert pydistill.Session is Session
+    assert "Session" in pydistill.__all__
+
+
+def test_entrypoints_scanned_once(jobs):
+    plugin = Plugin()
+    session = Session(plugins=[plugin])
+    jobplugin = Plugin()
+    assert session.run(["csv", "0"]) == 0
+    assert session.run(["csv", "3"], plugins=[jobplugin]) == 3
+    (args1, plugins1, eps1), (args2, plugins2, eps2) = jobs
+    assert plugins1 == [plugin]
+    assert plugins2 == [plugin, jobplugin]
+    assert [ep.name for ep in eps1] == ["myplugin"]
+    assert eps1 is eps2 is session.entrypoints
+
+
+def test_without_entrypoints(jobs):
+    session = Session(entrypoints=False)
+    session.run(["csv", "0"])
+    assert jobs[0][2] == []
+
+
+def test_concurrent_jobs(jobs):
+    session = Session()
+    threads = [threading.Thread(target=session.run, args=(["csv", str(i)],))
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(args[-1] for args, _, _ in jobs) == [
+        str(i) for i in range(8)]
+
+
+def test_config_unconfigured_on_exit(monkeypatch):
+    class FakeConfig(object):
+        configured = unconfigured = False
+
+        def _do_configure(self):
+            self.configured = True
+
+        def _ensure_unconfigure(self):
+            self.unconfigured = True
+
+    fake = FakeConfig()
+    monkeypatch.setattr(config, "_prepareconfig",
+                        lambda args, plugins, entrypoints: fake)
+    session = Session(entrypoints=False)
+    with pytest.raises(ValueError):
+        with session.config(["csv"]) as cfg:
+            assert cfg is fake and fake.configured and not fake.unconfigured
+            raise ValueError()
+    assert fake.unconfigured
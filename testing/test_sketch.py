@@ -0,0 +1,115 @@
+from __future__ import absolute_import, division, print_function
+import json
+import random
+
+import pytest
+
+from _pydistill.sketch import (CountMin, HeavyHitters, HyperLogLog, TDigest,
+                               TableSketch, hash64)
+
+
+def test_hash64_is_stable():
+    assert hash64("abc") == hash64("abc") != hash64("abd")
+    assert 0 <= hash64("abc") < 2 ** 64
+
+
+@pytest.mark.parametrize("n", [10, 1000, 50000])
+def test_hyperloglog(n):
+    sketch = HyperLogLog()
+    for i in range(n):
+        sketch.add(str(i))
+        sketch.add(str(i))
+    assert abs(sketch.count() - n) <= 0.03 * n + 1
+
+
+def test_hyperloglog_merge():
+    a, b = HyperLogLog(), HyperLogLog()
+    for i in range(3000):
+        a.add(str(i))
+        b.add(str(i + 2000))
+    a.merge(HyperLogLog.from_json(json.loads(json.dumps(b.to_json()))))
+    assert abs(a.count() - 5000) < 150
+    with pytest.raises(ValueError):
+        a.merge(HyperLogLog(10))
+
+
+def test_tdigest_quantiles():
+    rng = random.Random(0)
+    values = [rng.uniform(0, 1000) for _ in range(20000)]
+    digest = TDigest()
+    for x in values:
+        digest.add(x)
+    values.sort()
+    assert digest.min == values[0] and digest.max == values[-1]
+    for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+        assert abs(digest.quantile(q) - values[int(q * len(values))]) < 10
+    assert len(digest.centroids) < 100
+    assert TDigest().quantile(0.5) is None
+
+
+def test_tdigest_merge():
+    a, b = TDigest(), TDigest()
+    for i in range(1000):
+        a.add(i)
+        b.add(1000 + i)
+    a.merge(TDigest.from_json(json.loads(json.dumps(b.to_json()))))
+    assert a.count == 2000
+    assert abs(a.quantile(0.5) - 1000) < 20
+    assert (a.min, a.max) == (0, 1999)
+
+
+def test_countmin_never_undercounts():
+    sketch = CountMin(width=64, depth=3)
+    for i in range(500):
+        sketch.add_hash(hash64(str(i % 50)))
+    assert all(sketch.estimate_hash(hash64(str(i))) >= 10 for i in range(50))
+    copy = CountMin.from_json(json.loads(json.dumps(sketch.to_json())))
+    copy.merge(sketch)
+    assert copy.estimate_hash(hash64("0")) >= 20
+
+
+def test_heavy_hitters():
+    rng = random.Random(0)
+    a, b = HeavyHitters(top=3), HeavyHitters(top=3)
+    for sketch in (a, b):
+        for i in range(5000):
+            sketch.add("hot%d" % (i % 3) if i % 2 else str(rng.random()))
+    assert sorted(v for v, _ in a.most_common()) == ["hot0", "hot1", "hot2"]
+    a.merge(HeavyHitters.from_json(json.loads(json.dumps(b.to_json()))))
+    top = a.most_common()
+    assert sorted(v for v, _ in top) == ["hot0", "hot1", "hot2"]
+    assert all(count >= 1666 for _, count in top)
+
+
+def test_table_sketch_summary_and_merge():
+    a = TableSketch(["n", "s"], top=2)
+    b = TableSketch(["n", "s"], top=2)
+    a.update([["1", "x"], ["2", "x"], ["", "y"]])
+    b.update([["3", "x"], ["4", "z"]])
+    a.merge(TableSketch.from_json(json.loads(json.dumps(b.to_json()))))
+    n, s = a.summary()
+    assert n[:5] == ["n", "4", "1", "4", "1"]
+    assert n[9] == "4"
+    assert s[:4] == ["s", "5", "0", "3"]
+    assert s[4:10] == [""] * 6
+    assert s[10].startswith("x:3 ")
+    with pytest.raises(ValueError):
+        a.merge(TableSketch(["other"]))
+
+
+def test_table_sketch_blank_and_ragged_rows():
+    sketch = TableSketch(["n", "s"])
+    sketch.update([["1", "x"], [], ["3"], ["4", "y", "extra"]])
+    n, s = sketch.summary()
+    assert n[:3] == ["n", "3", "1"]
+    assert s[:3] == ["s", "2", "2"]
+
+
+def test_table_sketch_small_input():
+    sketch = TableSketch(["n"])
+    sketch.update([[str(i)] for i in range(1, 501)])
+    n, = sketch.summary()
+    assert n[1] == "500"
+    assert n[4] == "1"
+    assert n[9] == "500"
+    assert 200 < float(n[6]) < 300
@@ -0,0 +1,105 @@
+from __future__ import absolute_import, division, print_function
+import io
+
+import pytest
+
+from _pydistill import stream
+
+
+@pytest.mark.parametrize("spec, rows, nbytes", [
+    ("100", 100, None),
+    ("64KB", None, 64 * 1024),
+    ("2mb", None, 2 * 1024 ** 2),
+    ("1G", None, 1024 ** 3),
+])
+def test_chunksize_parse(spec, rows, nbytes):
+    size = stream.ChunkSize.parse(spec)
+    assert (size.rows, size.nbytes) == (rows, nbytes)
+
+
+@pytest.mark.parametrize("spec", ["", "0", "-5", "12XB", "MB"])
+def test_chunksize_parse_invalid(spec):
+    with pytest.raises(ValueError):
+        stream.ChunkSize.parse(spec)
+
+
+def test_iter_chunks_rows():
+    rows = [[str(i)] for i in range(10)]
+    chunks = list(stream.iter_chunks(iter(rows), "4"))
+    assert [len(c) for c in chunks] == [4, 4, 2]
+
+
+def test_iter_chunks_bytes():
+    rows = [["abcd"] for i in range(10)]
+    chunks = list(stream.iter_chunks(iter(rows), "10B"))
+    assert [len(c) for c in chunks] == [2, 2, 2, 2, 2]
+
+
+def test_stream_roundtrip():
+    src = io.StringIO(u"a,b\n1,2\n3,4\n5,6\n")
+    dst = io.StringIO()
+    reader = stream.CsvReader(src, "2")
+    writer = stream.CsvWriter(dst, lineterminator="\n")
+    writer.writeheader(reader.header)
+
+    def drop_odd(chunk):
+        return [row for row in chunk if int(row[0]) != 3]
+
+    stats = stream.Stream(reader, writer, [drop_odd]).run()
+    assert dst.getvalue() == u"a,b\n1,2\n5,6\n"
+    assert stats == {'chunks': 2, 'rows_in': 3, 'rows_out': 2}
+
+
+def test_reader_selection():
+    src = io.StringIO(u'a,b,c\n1,"x,y",3\n4,5,6\n7,y\n')
+    reader = stream.CsvReader(src, columns=["c", "a"], pattern="y")
+    assert reader.header == ["c", "a"]
+    assert [row for chunk in reader for row in chunk] == [["3", "1"],
+                                                          ["", "7"]]
+
+
+def test_rebatched_per_plugin():
+    from pluggy import HookimplMarker, HookspecMarker, PluginManager
+    hookspec = HookspecMarker("example")
+    hookimpl = HookimplMarker("example")
+    seen = []
+
+    class Spec(object):
+        @hookspec
+        def example_batch(self, chunk):
+            pass
+
+        @hookspec
+        def example_batch_size(self):
+            pass
+
+    class Plugin(object):
+        def __init__(self, name, size=None):
+            self.name = name
+            self.size = size
+
+        @hookimpl
+        def example_batch(self, chunk):
+            seen.append((self.name, len(chunk)))
+            return chunk
+
+        @hookimpl
+        def example_batch_size(self):
+            return self.size
+
+    pm = PluginManager("example")
+    pm.add_hookspecs(Spec)
+    for plugin in [Plugin("c"), Plugin("b", 2), Plugin("a")]:
+        pm.register(plugin)
+    sizes = stream.batch_sizes(pm, "example_batch_size")
+    assert sorted(sizes.values(), key=str) == [2, None, None]
+    chunk = list(range(5))
+    for transform in stream.rebatched(
+            stream.hook_chain(pm, "example_batch", "chunk"), sizes):
+        chunk = transform(chunk)
+    assert chunk == list(range(5))
+    # only the plugin asking for batches of 2 gets them
+    assert seen == [("a", 5), ("b", 2), ("b", 2), ("b", 1), ("c", 5)]
+    pm.register(Plugin("d", -1))
+    with pytest.raises(ValueError):
+        stream.batch_sizes(pm, "example_batch_size")
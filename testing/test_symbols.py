@@ -0,0 +1,144 @@
+from __future__ import absolute_import, division, print_function
+
+from _pydistill import symbols
+from _pydistill.config import langhookimpl
+from _pydistill.lang import LangPluginManager
+from _pydistill.symbols import Definition, SymbolIndex, update_index
+
+
+def make_index(tmpdir):
+    index = SymbolIndex(tmpdir.join("index.sqlite"))
+    src = tmpdir.ensure("a.f90")
+    index.update_file(src, "p-1", [("a", "subroutine", 1),
+                                   ("b", "subroutine", 5)],
+                      [("a", "b", "call"), ("b", "c", "call"),
+                       ("c", "a", "call"), ("b", "m", "use")])
+    return index, src
+
+
+def test_definitions(tmpdir):
+    index, src = make_index(tmpdir)
+    assert index.definitions("b") == [Definition("b", "subroutine", str(src),
+                                                 5)]
+    assert index.definitions("nope") == []
+
+
+def test_transitive_closure(tmpdir):
+    index, src = make_index(tmpdir)
+    # the cycle a -> b -> c -> a terminates
+    assert index.dependencies("a") == ["b", "c", "m"]
+    assert index.dependencies("a", kinds=["call"]) == ["b", "c"]
+    assert index.dependents("m") == ["a", "b", "c"]
+
+
+def test_update_file_replaces(tmpdir):
+    index, src = make_index(tmpdir)
+    index.update_file(src, "p-1", [("x", "function", 1)], [])
+    assert index.definitions("a") == []
+    assert index.dependencies("a") == []
+    assert index.files() == [src]
+    index.remove_files([src])
+    assert index.files() == []
+    assert index.definitions("x") == []
+
+
+def test_is_current(tmpdir):
+    index, src = make_index(tmpdir)
+    assert index.is_current(src, "p-1")
+    assert not index.is_current(src, "p-2")
+    src.write("changed")
+    assert not index.is_current(src, "p-1")
+    assert not index.is_current(tmpdir.join("missing"), "p-1")
+
+
+def test_schema_change_rebuilds(tmpdir, monkeypatch):
+    index, src = make_index(tmpdir)
+    index.close()
+    monkeypatch.setattr(symbols, "SCHEMA_VERSION", symbols.SCHEMA_VERSION + 1)
+    with SymbolIndex(tmpdir.join("index.sqlite")) as index:
+        assert index.files() == []
+
+
+def test_corrupt_database_is_rebuilt(tmpdir):
+    tmpdir.join("index.sqlite").write("not a database" * 100)
+    index = SymbolIndex(tmpdir.join("index.sqlite"))
+    assert index.files() == []
+
+
+class FakeCache(object):
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def makedir(self, name):
+        return self.directory.ensure_dir(name)
+
+
+class FakeConfig(object):
+
+    def __init__(self, tmpdir):
+        self.cache = FakeCache(tmpdir.join("cache"))
+        self.langmanager = LangPluginManager()
+
+    def getini(self, name):
+        return dict(parse_cache_size="1MB")[name]
+
+
+class CallParser(object):
+    """ every line "name: callee callee ..." defines a subroutine. """
+
+    name = "calls"
+    version = "1"
+
+    def __init__(self):
+        self.parsed = []
+
+    def parse(self, path, source):
+        self.parsed.append(path.basename)
+        return [line.split(":") for line in
+                source.decode("ascii").splitlines()]
+
+
+class CallPlugin(object):
+
+    def __init__(self, parser):
+        self.parser = parser
+
+    @langhookimpl
+    def pydistill_lang_parser(self, config, path):
+        return self.parser
+
+    @langhookimpl
+    def pydistill_lang_symbols(self, config, path, tree):
+        definitions = [(name, "subroutine", i + 1)
+                       for i, (name, _) in enumerate(tree)]
+        references = [(name, callee, "call") for name, callees in tree
+                      for callee in callees.split()]
+        return definitions, references
+
+
+def test_update_index(tmpdir):
+    parser = CallParser()
+    config = FakeConfig(tmpdir)
+    config.langmanager.register(CallPlugin(parser))
+    a = tmpdir.join("a.calls")
+    b = tmpdir.join("b.calls")
+    a.write("main: solve\n")
+    b.write("solve: kernel\nkernel:\n")
+    index = update_index(config, [a, b])
+    assert index.dependencies("main") == ["kernel", "solve"]
+    assert index.definitions("kernel")[0].line == 2
+    assert sorted(parser.parsed) == ["a.calls", "b.calls"]
+
+    update_index(config, [a, b])
+    assert len(parser.parsed) == 2
+
+    b.write("solve:\n")
+    b.setmtime(b.mtime() + 10)
+    update_index(config, [a, b])
+    assert parser.parsed[2:] == ["b.calls"]
+    assert index.dependencies("main") == ["solve"]
+
+    a.remove()
+    update_index(config, [b])
+    assert index.files() == [b]
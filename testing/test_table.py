@@ -0,0 +1,102 @@
+from __future__ import absolute_import, division, print_function
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from _pydistill.table import (ColumnTable, Schema, column_from_text,  # noqa: E402
+                              convert)
+
+
+def test_column_from_text_narrowest_dtype():
+    assert column_from_text(["1", "2"]).dtype == np.int64
+    assert column_from_text(["1", "2.5"]).dtype == np.float64
+    assert column_from_text(["1", "x"]).dtype.kind == "U"
+    assert column_from_text(["1", "2"], dtype=np.float32).dtype == np.float32
+
+
+def test_column_from_text_lossless():
+    for values in (["00700", "1"], ["99999999999999999999"],
+                   ["1.5", "1234567890123456"]):
+        assert column_from_text(values).dtype.kind == "U"
+    assert column_from_text(["0", "-3"]).dtype == np.int64
+    assert column_from_text(["0.5", "-0.25"]).dtype == np.float64
+
+
+def test_from_rows_and_back():
+    table = ColumnTable.from_rows(["a", "b"], [["1", "x"], ["2", "y"]])
+    assert table.header == ["a", "b"]
+    assert len(table) == 2
+    assert table["a"].flags["C_CONTIGUOUS"]
+    assert table.to_rows() == [["1", "x"], ["2", "y"]]
+
+
+def test_filter_and_assign():
+    table = ColumnTable.from_rows(["a"], [["1"], ["2"], ["3"]])
+    table.filter(table["a"] > 1)
+    table["b"] = table["a"] * 10
+    assert table.to_rows() == [["2", "20"], ["3", "30"]]
+    with pytest.raises(ValueError):
+        table["c"] = np.arange(5)
+
+
+def test_from_rows_ragged():
+    table = ColumnTable.from_rows(["a", "b"], [["1", "x"], ["2"]])
+    assert table.to_rows() == [["1", "x"], ["2", ""]]
+    with pytest.raises(ValueError):
+        ColumnTable.from_rows(["a"], [["1"], ["2", "x"]])
+
+
+def test_untouched_columns_written_as_read():
+    rows = [["True", "007", "1", "2020-01-02T10:00"],
+            ["False", "010", "2.50", "2020-01-03"]]
+    table = ColumnTable.from_rows(["b", "z", "f", "d"], rows,
+                                  schema=Schema())
+    assert table.to_rows() == rows
+    table.filter(table["b"])
+    table["f"] = table["f"] * 2
+    assert table.to_rows() == [["True", "007", "2.0", "2020-01-02T10:00"]]
+
+
+def test_convert():
+    text = np.array(["True", "false"])
+    assert convert(text, "bool").tolist() == [True, False]
+    assert np.isnan(convert(np.array(["1.5", ""]), "float")[1])
+    assert convert(np.array(["2020-01-01", ""]), "datetime").dtype.kind == "M"
+    for type in ("bool", "int", "float", "datetime"):
+        with pytest.raises(ValueError):
+            convert(np.array(["x"]), type)
+    with pytest.raises(ValueError):
+        convert(np.array(["99999999999999999999"]), "int")
+    for text in (["99999999999999999999"], ["01"]):
+        for type in ("int", "float"):
+            with pytest.raises(ValueError):
+                convert(np.array(text), type)
+
+
+def test_schema_inference():
+    schema = Schema()
+    header = ["b", "i", "f", "d", "c", "s"]
+    rows = [["true", "1", "1.5", "2020-01-01", "x", "a"],
+            ["false", "2", "", "2020-01-02T10:00", "y", "b"],
+            ["true", "3", "2", "", "x", "c"],
+            ["true", "4", "3", "2020-01-03", "x", "d"]]
+    table = ColumnTable.from_rows(header, rows, schema=schema)
+    assert list(schema.types.values()) == [
+        "bool", "int", "float", "datetime", "category", "string"]
+    assert table["i"].dtype == np.int64
+    assert table.to_rows()[1] == rows[1]
+
+
+def test_schema_widens_lazily():
+    schema = Schema()
+    ColumnTable.from_rows(["v", "c"], [["1", "a"], ["2", "a"]], schema=schema)
+    assert schema.types == {"v": "int", "c": "category"}
+    table = ColumnTable.from_rows(["v", "c"], [["2.5", "b"]], schema=schema)
+    assert table["v"].dtype == np.float64
+    assert schema.types == {"v": "float", "c": "category"}
+    assert schema.categories["c"] == {"a", "b"}
+    ColumnTable.from_rows(["v", "c"], [["x", str(i)] for i in range(300)],
+                          schema=schema)
+    assert schema.types == {"v": "string", "c": "string"}
+    assert Schema.from_json(schema.to_json()).types == schema.types
@@ -0,0 +1,128 @@
+from __future__ import absolute_import, division, print_function
+import csv
+import io
+import re
+
+import pytest
+
+from _pydistill import stream
+from _pydistill.tokenizer import CsvError, MmapCsvReader, iter_rows, prefilter
+
+
+def _tokenize(data):
+    return [row.tolist() for row in iter_rows(data)]
+
+
+@pytest.mark.parametrize("data", [
+    b"a,b,c\n1,2,3\n",
+    b"a,b\r\n1,2\r\n",
+    b"a,b\n1,\n,2",
+    b'a,b\n"x,y",2\n',
+    b'a,b\n"say ""hi""",2\n',
+    b'a,b\n"multi\nline",2\n3,4\n',
+    b'a,"b"\r\n"1",2\r\n',
+    b'a,b\n\n1,2\n',
+    b'a,b\r\n\r\n\n1,2\n\n',
+    # malformed quoting is read like csv.reader does
+    b'a,b\n1,"x"y\n"a""b"c,"d" \r\n',
+    b'a,b\n1,"x"y"z"\n',
+    b'a,b\n1,"open\n',
+])
+def test_matches_csv_module(data):
+    expected = list(csv.reader(io.StringIO(data.decode("utf-8"))))
+    assert _tokenize(data) == expected
+
+
+def test_raw_is_memoryview_slice():
+    row = next(iter_rows(b"abc,def\n"))
+    raw = row.raw(1)
+    assert isinstance(raw, memoryview)
+    assert raw.tobytes() == b"def"
+
+
+def test_unterminated_quote():
+    with pytest.raises(CsvError):
+        list(iter_rows(b'a,"b\n', partial=False))
+
+
+def test_mmap_reader(tmpdir):
+    p = tmpdir.join("data.csv")
+    p.write_binary(u"name,value\nä,1\nb,2\nc,3\n".encode("utf-8"))
+    with MmapCsvReader(p, "2") as reader:
+        assert reader.header == ["name", "value"]
+        chunks = [[row.tolist() for row in chunk] for chunk in reader]
+    assert chunks == [[[u"ä", "1"], ["b", "2"]], [["c", "3"]]]
+
+
+@pytest.mark.parametrize("tail", [b"", b"3,c", b'3,"c\nd', b'3,"c"'])
+def test_select_complete_records(tmpdir, tail):
+    p = tmpdir.join("data.csv")
+    p.write_binary(b'n,t\n1,a\n2,"b\nb"\n' + tail)
+    with MmapCsvReader(p) as reader:
+        reader.select(partial=False)
+        rows = [row for chunk in reader for row in chunk]
+    assert [row.tolist() for row in rows] == [["1", "a"], ["2", "b\nb"]]
+    assert rows[-1].end == 16
+
+
+def test_mmap_reader_empty_file(tmpdir):
+    p = tmpdir.join("empty.csv")
+    p.write_binary(b"")
+    with MmapCsvReader(p) as reader:
+        assert reader.header is None
+        assert list(reader) == []
+
+
+def test_columns_projected():
+    data = b'a,b,c,d\n1,"x,y",3,4\n5,6\n'
+    rows = [row.tolist() for row in iter_rows(data, columns=[2, 0])]
+    assert rows == [["c", "a"], ["3", "1"], ["", "5"]]
+
+
+@pytest.mark.parametrize("pattern, fixed", [
+    (b"x", True),
+    (b'x"?,', False),
+])
+def test_prefilter_drops_records(pattern, fixed):
+    data = b'a,1\nbx,2\n"c\nx",3\nd,4\n'
+    found = [row.tolist() for row in iter_rows(
+        data, match=prefilter(data, pattern, fixed))]
+    assert found == [["bx", "2"], ["c\nx", "3"]]
+    everything = [row.tolist() for row in iter_rows(
+        data, match=prefilter(data, b"[0-9]"))]
+    assert everything == _tokenize(data)
+
+
+_GREP_RECORDS = ['1,"a\nline x"', '2,b', '3,xx', '4,"q,""x"""', '5,b\r']
+
+
+@pytest.mark.parametrize("pattern, fixed", [
+    ("x", True), ('""x', True), ("^2", False), ("b$", False),
+    ("^line", False), ('"$', False), ("b\r$", False), ("a\nline", False), ("b\n3", False),
+    ("2,b\n", False),
+])
+def test_grep_same_in_both_readers(tmpdir, pattern, fixed):
+    # the raw text of a record, without its newline, is matched
+    p = tmpdir.join("data.csv")
+    p.write_binary(("id,text\n" + "\n".join(_GREP_RECORDS) + "\n").encode())
+    search = re.compile(re.escape(pattern) if fixed else pattern, re.M).search
+    expected = [i + 1 for i, raw in enumerate(_GREP_RECORDS) if search(raw)]
+    with MmapCsvReader(p, pattern=pattern, fixed=fixed) as reader:
+        found = [int(row[0]) for chunk in reader for row in chunk]
+    assert found == expected
+    with stream.open_text(p) as f:
+        reader = stream.CsvReader(f, pattern=pattern, fixed=fixed)
+        found = [int(row[0]) for chunk in reader for row in chunk]
+    assert found == expected
+
+
+def test_mmap_reader_selection(tmpdir):
+    p = tmpdir.join("data.csv")
+    p.write_binary(b"name,value,note\na,1,keep\nb,2,drop\nc,3,keep\n")
+    with MmapCsvReader(p, columns=["value", "name"], pattern="keep",
+                       fixed=True) as reader:
+        assert reader.header == ["value", "name"]
+        rows = [row.tolist() for chunk in reader for row in chunk]
+    assert rows == [["1", "a"], ["3", "c"]]
+    with pytest.raises(ValueError):
+        MmapCsvReader(p, columns=["missing"])